@@ -0,0 +1,290 @@
+"""HTTP API for the proclamation pipeline, for kiosks, photo booths and other programs
+
+    python api.py --host 0.0.0.0 --port 8000
+    curl -F photo=@me.jpg -F name="Sir Lancelot" -F analysis=ai -F style=medieval localhost:8000/jobs
+    curl -N localhost:8000/jobs/<id>/events
+
+POST /jobs takes a multipart form with the image as "photo" and optionally
+"name", "analysis" (random, ai, quick), "style" (text, overlay, artistic,
+medieval), "proclamation" (template, llm) and "seed". It answers 202 at once
+with the job's ID. GET /jobs/{id}/events streams the job as server-sent
+events: "running", "proclamation" as soon as the text is ready, "portrait"
+once the image is (not for text), then "done" or "failed". A client that
+connects late, or reconnects with Last-Event-ID, gets the events it missed.
+GET /jobs/{id} returns everything so far as JSON, and GET /portraits/{digest}
+the image. Results go in the gallery like the app's.
+
+Everything runs on one asyncio event loop. An open event stream is just a
+connection waiting on the loop, and each job runs the shared pipeline on one
+of API_WORKERS threads, so the model scheduler, caches, breakers and warm-up
+are the same ones the app uses when both run in one process.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+import pipeline
+from image_prep import PreparedUpload
+
+logger = logging.getLogger(__name__)
+
+API_WORKERS = int(os.getenv("API_WORKERS", "16"))  # jobs running at once; the rest wait their turn
+API_MAX_JOBS = int(os.getenv("API_MAX_JOBS", "256"))  # unfinished jobs before new ones are turned away
+API_MAX_UPLOAD_MB = float(os.getenv("API_MAX_UPLOAD_MB", "20"))
+FORM_OVERHEAD = 64 * 1024  # room for the text fields and multipart boundaries around the photo
+API_JOB_TTL = 600  # seconds a finished job can still be fetched
+SSE_HEARTBEAT = 15  # seconds between keep-alive comments on a quiet event stream
+DEFAULT_NAME = "The Unnamed One"
+TERMINAL_EVENTS = ("done", "failed")
+
+
+class Job:
+    """One request's events so far, and a way to wait for the next
+
+    publish() must be called on the event loop's thread; worker threads go
+    through loop.call_soon_threadsafe.
+    """
+
+    def __init__(self, options):
+        self.id = uuid.uuid4().hex
+        self.options = options
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self._changed = asyncio.Event()
+
+    @property
+    def status(self):
+        if self.finished_at is not None:
+            return self.events[-1][0]
+        return "running" if self.events else "queued"
+
+    def publish(self, event, data):
+        self.events.append((event, data))
+        if event in TERMINAL_EVENTS:
+            self.finished_at = time.time()
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, start=0, heartbeat=SSE_HEARTBEAT):
+        """Yield (index, event, data) from start on, as they're published, until the job ends
+
+        Yields None after heartbeat seconds without an event.
+        """
+        seen = start
+        while True:
+            while seen < len(self.events):
+                yield (seen, *self.events[seen])
+                seen += 1
+            if self.finished_at is not None:
+                return
+            try:
+                await asyncio.wait_for(self._changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+    def summary(self):
+        merged = {}
+        for event, data in self.events:
+            merged.update(data)
+        return {"id": self.id, "status": self.status, "options": self.options, "created_at": self.created_at, **merged}
+
+
+def run_job(loop, job, upload):
+    """Run the pipeline for job on a worker thread, publishing each stage as it finishes"""
+    def publish(event, data):
+        loop.call_soon_threadsafe(job.publish, event, data)
+
+    def on_stage(stage, result):
+        if stage == "proclamation":
+            publish("proclamation", {"description": result["description"], "ai_description": result["ai_description"]})
+        elif result["image"] is not None:
+            publish("portrait", {"image": f"/portraits/{result['image']}", "digest": result["image"], "kind": result["kind"]})
+
+    # Whatever goes wrong, the job must end with "done" or "failed", or it would count as
+    # unfinished forever and its event streams would never close
+    options = job.options
+    try:
+        publish("running", {})
+        result = pipeline.generate_portrait(
+            upload, options["name"], analysis=options["analysis"], style=options["style"],
+            proclamation=options["proclamation"], seed=options["seed"], on_stage=on_stage
+        )
+        try:
+            gallery_id = pipeline.save_to_gallery(
+                options["name"], result["description"],
+                {key: options[key] for key in ("analysis", "style", "proclamation")},
+                result["kind"], result["image"], result["ai_description"], upload, result["timings"], session="api"
+            )
+        except Exception as e:
+            # Losing a gallery entry shouldn't cost the client their portrait
+            logger.warning("Job %s: could not save to the gallery: %s", job.id, e)
+            gallery_id = None
+        done = {"errors": result["errors"], "timings": result["timings"], "bytes_sent": result["bytes_sent"], "gallery_id": gallery_id}
+    except Exception as e:
+        logger.exception("Job %s failed", job.id)
+        metrics.count("api_jobs_total", result="failed")
+        publish("failed", {"error": str(e)})
+        return
+    metrics.count("api_jobs_total", result="done")
+    publish("done", done)
+
+
+def error(status, message, headers=None):
+    return JSONResponse({"error": message}, status_code=status, headers=headers)
+
+
+def unfinished(jobs):
+    return sum(1 for job in jobs.values() if job.finished_at is None)
+
+
+async def create_job(request):
+    jobs = request.app.state.jobs
+    if unfinished(jobs) >= API_MAX_JOBS:
+        metrics.count("api_jobs_total", result="rejected")
+        return error(503, "Too many portraits are being made right now; please try again shortly", {"Retry-After": "5"})
+    # Turn an oversized photo away before its body is read, and never read more than the limit
+    max_bytes = int(API_MAX_UPLOAD_MB * 1024 * 1024)
+    too_large = error(413, f"The photo is over {API_MAX_UPLOAD_MB:g} MB")
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes + FORM_OVERHEAD:
+        return too_large
+    async with request.form(max_files=1, max_fields=8) as form:
+        photo = form.get("photo")
+        if photo is None or isinstance(photo, str):
+            return error(400, 'Send the image as a file field named "photo"')
+        if photo.size is not None and photo.size > max_bytes:
+            return too_large
+        data = await photo.read(max_bytes + 1)
+        fields = {key: (form.get(key) or "").strip() for key in ("name", "analysis", "style", "proclamation", "seed")}
+    if len(data) > max_bytes:
+        return too_large
+    options = {
+        "name": fields["name"] or DEFAULT_NAME,
+        "analysis": fields["analysis"] or "random",
+        "style": fields["style"] or "text",
+        "proclamation": fields["proclamation"] or "template",
+        "seed": fields["seed"] or None,
+    }
+    for key, allowed in (("analysis", pipeline.ANALYSIS_MODES), ("style", pipeline.PORTRAIT_STYLES), ("proclamation", pipeline.PROCLAMATION_MODES)):
+        if options[key] not in allowed:
+            return error(400, f"Unknown {key} {options[key]!r}; expected one of {', '.join(allowed)}")
+    try:
+        upload = await run_in_threadpool(PreparedUpload.from_file, BytesIO(data))
+    except Exception:
+        return error(400, "Could not read the photo; send a JPEG or PNG image")
+
+    job = Job(options)
+    jobs[job.id] = job
+    request.app.state.executor.submit(run_job, asyncio.get_running_loop(), job, upload)
+    metrics.count("api_jobs_total", result="accepted")
+    return JSONResponse(
+        {"id": job.id, "status": job.status, "url": f"/jobs/{job.id}", "events": f"/jobs/{job.id}/events"},
+        status_code=202, headers={"Location": f"/jobs/{job.id}"}
+    )
+
+
+async def get_job(request):
+    job = request.app.state.jobs.get(request.path_params["job_id"])
+    if job is None:
+        return error(404, "No such job (finished jobs are kept for ten minutes)")
+    return JSONResponse(job.summary())
+
+
+async def job_events(request):
+    job = request.app.state.jobs.get(request.path_params["job_id"])
+    if job is None:
+        return error(404, "No such job (finished jobs are kept for ten minutes)")
+    last_id = request.headers.get("Last-Event-ID", "")
+    start = int(last_id) + 1 if last_id.isdigit() else 0
+
+    async def stream():
+        async for item in job.follow(start):
+            if item is None:
+                yield ": keep-alive\n\n"
+                continue
+            index, event, data = item
+            yield f"id: {index}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"})
+
+
+async def get_portrait(request):
+    digest = request.path_params["digest"]
+    path = await run_in_threadpool(pipeline.get_blob_store().path, digest) if re.fullmatch(r"[0-9a-f]{16,64}", digest) else None
+    if path is None:
+        return error(404, "No such portrait")
+    return FileResponse(path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+
+async def health(request):
+    return JSONResponse({"ok": True, "jobs": unfinished(request.app.state.jobs), "scheduler": pipeline.get_model_scheduler().stats()})
+
+
+async def get_metrics(request):
+    return PlainTextResponse(metrics.METRICS.render())
+
+
+async def forget_finished_jobs(jobs):
+    while True:
+        await asyncio.sleep(60)
+        cutoff = time.time() - API_JOB_TTL
+        for job_id in [job_id for job_id, job in jobs.items() if job.finished_at is not None and job.finished_at < cutoff]:
+            del jobs[job_id]
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    pipeline.get_metrics_endpoint()
+    pipeline.start_warmup()
+    app.state.jobs = {}
+    app.state.executor = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="api-job")
+    metrics.METRICS.gauge("api_jobs_unfinished", lambda: {(): unfinished(app.state.jobs)}, help="API jobs queued or running")
+    cleaner = asyncio.create_task(forget_finished_jobs(app.state.jobs))
+    yield
+    cleaner.cancel()
+    app.state.executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(
+    routes=[
+        Route("/jobs", create_job, methods=["POST"]),
+        Route("/jobs/{job_id}", get_job),
+        Route("/jobs/{job_id}/events", job_events),
+        Route("/portraits/{digest}", get_portrait),
+        Route("/healthz", health),
+        Route("/metrics", get_metrics),
+    ],
+    lifespan=lifespan,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    if not os.getenv("REPLICATE_API_TOKEN"):
+        raise SystemExit("Missing REPLICATE_API_TOKEN environment variable. Get one at https://replicate.com/account/api-tokens")
+
+    import uvicorn  # only needed to serve; the app object can be mounted elsewhere
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
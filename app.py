@@ -1,21 +1,40 @@
 import os
+import time
+import uuid
 import streamlit as st
-import replicate
-import base64
-from io import BytesIO
-from PIL import Image
-import random
+import metrics
+import pipeline
+from pipeline import (
+    MODEL_IMAGE_SIZES,
+    NANO_BANANA_MODEL,
+    choose_title_and_location,
+    generate_ai_enhanced_description,
+    generate_medieval_description,
+    get_result_cache,
+    get_single_flight,
+)
 
 st.set_page_config(page_title="Dumbest Website Ever video w/ Replicate && DigitalOcean", page_icon="🏰", layout="centered")
 st.title("Medieval Portrait Generator 🏰")
 st.markdown("*Upload thy likeness and receive a most noble description befitting of medieval court!*")
 st.markdown("🔥 **Powered by [Replicate](https://replicate.com)** • 🌊 **Deployed on [DigitalOcean](https://www.digitalocean.com/products/app-platform)** • ⚡ **Built with [Streamlit](https://streamlit.io)**")
 
-# Demo video section
-st.markdown("### Dumb app video hosted on DigitalOcean spaces (S3 buckets)")
-st.video("https://dumbthingsvideo.sfo3.cdn.digitaloceanspaces.com/dumbestwebsite.MOV")
-st.markdown("*Watch the Medieval Portrait Generator transform ordinary photos into hilarious royal proclamations!*")
-st.markdown("---")
+# Fast start (the default) puts the upload form first: the demo video waits behind a toggle
+# at the bottom, the model showcase is folded away, and the descriptor pool is only loaded
+# once there's a photo. FAST_START=0 restores the original layout.
+FAST_START = os.getenv("FAST_START", "1") != "0"
+
+
+def show_demo_video():
+    """Demo video section"""
+    st.markdown("### Dumb app video hosted on DigitalOcean spaces (S3 buckets)")
+    st.video("https://dumbthingsvideo.sfo3.cdn.digitaloceanspaces.com/dumbestwebsite.MOV")
+    st.markdown("*Watch the Medieval Portrait Generator transform ordinary photos into hilarious royal proclamations!*")
+
+
+if not FAST_START:
+    show_demo_video()
+    st.markdown("---")
 
 REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
 if not REPLICATE_API_TOKEN:
@@ -25,291 +44,516 @@ if not REPLICATE_API_TOKEN:
 # Initialize Replicate client
 os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
 
-# Example lists for AI generation
-EXAMPLE_TITLES = ["Sir", "Lady", "Lord", "Dame", "Duke", "Duchess", "Earl", "Countess", "Baron", "Baroness", "Knight", "Squire", "Maiden", "Master", "Mistress"]
-EXAMPLE_LOCATIONS = ["the Cubicle", "the Coffee Shop", "the WiFi Router", "the Netflix Queue", "the Zoom Call", "the Instagram Feed"]
-EXAMPLE_SKILLS = ["wielder of spreadsheets", "master of microwaves", "guardian of the remote control", "slayer of email notifications", "ruler of WiFi passwords", "sage of memes"]
-EXAMPLE_TRAITS = ["possesses the wisdom of a thousand customer service calls", "bears the noble burden of unread messages", "commands the mystical forces of autocorrect"]
+if not FAST_START:
+    # Start a background refresh of the descriptor pool early if it's stale
+    pipeline.get_descriptors()
+pipeline.get_metrics_endpoint()
+pipeline.start_warmup()
+
+# Portraits are served straight from the blob store when Streamlit's static serving covers it
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_BLOBS = st.get_option("server.enableStaticServing") and os.path.abspath(pipeline.BLOB_STORE_DIR).startswith(STATIC_DIR + os.sep)
+
+# Live percentiles for operators; set ADMIN_PANEL=1 to show them in the sidebar
+ADMIN_PANEL = os.getenv("ADMIN_PANEL", "") not in ("", "0")
+# Kiosk staff may look up anyone's portraits (by name, or all of them) to reprint; visitors see only their own
+GALLERY_STAFF = ADMIN_PANEL or os.getenv("GALLERY_STAFF", "") not in ("", "0")
+
 
-def generate_ai_descriptors():
-    """Generate new medieval descriptors using AI"""
+def show_queue_position(notice, job):
+    """Show where a queued model call stands in the royal queue"""
+    if job.running():
+        notice.empty()
+    else:
+        notice.info(f"⏳ The royal court is busy. Thou art number {job.position() + 1} in the queue...")
+
+
+def describe_prediction(handle, job):
+    """One-line status for a tracked prediction the user is waiting on"""
+    if handle.status == "queued":
+        return f"⏳ The royal court is busy. Thou art number {job.position() + 1} in the queue..."
+    if handle.status == "starting":
+        return f"🕯️ The royal painters are preparing their easels... ({handle.elapsed():.0f}s)"
+    progress = handle.progress()
+    percent = f" {progress:.0f}%" if progress is not None else ""
+    return f"🎨 The royal painters are at work{percent}... ({handle.elapsed():.0f}s)"
+
+
+def inflight_predictions():
+    """This session's in-flight image predictions, so reruns can reattach to them"""
+    return st.session_state.setdefault("inflight_predictions", {})
+
+
+def analyze_image_with_ai(upload):
+    """Use AI to analyze the image and generate a more specific description"""
+    notice = st.empty()
     try:
-        # Generate new titles
-        titles_prompt = f"Generate 8 creative medieval titles similar to these examples: {', '.join(EXAMPLE_TITLES[:5])}. Make them funny and modern-medieval fusion. Return as comma-separated list."
-        
-        titles_output = replicate.run(
-            "meta/meta-llama-3-70b-instruct",
-            input={
-                "prompt": titles_prompt,
-                "max_tokens": 100,
-                "temperature": 0.8
-            }
-        )
-        
-        # Generate new locations  
-        locations_prompt = f"Generate 8 funny modern 'locations' for medieval titles, similar to: {', '.join(EXAMPLE_LOCATIONS[:3])}. Format: 'the [modern place]'. Return as comma-separated list."
-        
-        locations_output = replicate.run(
-            "meta/meta-llama-3-70b-instruct",
-            input={
-                "prompt": locations_prompt,
-                "max_tokens": 100,
-                "temperature": 0.8
-            }
-        )
-        
-        # Generate new skills
-        skills_prompt = f"Generate 8 funny medieval 'skills' for modern life, similar to: {', '.join(EXAMPLE_SKILLS[:3])}. Return as comma-separated list."
-        
-        skills_output = replicate.run(
-            "meta/meta-llama-3-70b-instruct",
-            input={
-                "prompt": skills_prompt,
-                "max_tokens": 100,
-                "temperature": 0.8
-            }
-        )
-        
-        # Parse outputs
-        ai_titles = [t.strip().strip('"') for t in str(titles_output).split(',')]
-        ai_locations = [l.strip().strip('"') for l in str(locations_output).split(',')]
-        ai_skills = [s.strip().strip('"') for s in str(skills_output).split(',')]
-        
-        return {
-            'titles': ai_titles[:8] if len(ai_titles) >= 8 else EXAMPLE_TITLES,
-            'locations': ai_locations[:8] if len(ai_locations) >= 8 else EXAMPLE_LOCATIONS,
-            'skills': ai_skills[:8] if len(ai_skills) >= 8 else EXAMPLE_SKILLS,
-            'traits': EXAMPLE_TRAITS  # Keep traits as examples for now
-        }
-        
+        return pipeline.analyze_image(upload, on_wait=lambda job: show_queue_position(notice, job))
     except Exception as e:
-        st.warning(f"AI descriptor generation failed: {e}. Using default lists.")
-        return {
-            'titles': EXAMPLE_TITLES,
-            'locations': EXAMPLE_LOCATIONS,
-            'skills': EXAMPLE_SKILLS,
-            'traits': EXAMPLE_TRAITS
-        }
+        st.warning(f"AI analysis failed: {e}")
+        return None
+    finally:
+        notice.empty()
 
-# Initialize with AI-generated descriptors
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def get_descriptors():
-    return generate_ai_descriptors()
-
-descriptors = get_descriptors()
-TITLES = descriptors['titles']
-LOCATIONS = descriptors['locations'] 
-SKILLS = descriptors['skills']
-PERSONALITY_TRAITS = descriptors['traits']
-
-def generate_medieval_description(has_image=False):
-    """Generate a ridiculous medieval description"""
-    title = random.choice(TITLES)
-    location = random.choice(LOCATIONS)
-    skill = random.choice(SKILLS)
-    trait = random.choice(PERSONALITY_TRAITS)
-    
-    description = f"""
-🏰 **ROYAL PROCLAMATION** 🏰
-
-Hearken all! Before thee stands **{title} [Your Name] of {location}**, 
-noble {skill} and {trait}.
-
-By royal decree, this distinguished personage shall be remembered 
-throughout the realm for their legendary ability to {random.choice([
-    "find the perfect meme for any occasion",
-    "remember where they put their keys (sometimes)",
-    "distinguish between similar-looking apps",
-    "order food without looking at the menu",
-    "pretend to understand cryptocurrency",
-    "nod knowingly during technical meetings",
-    "keep plants alive for more than a week",
-    "fold fitted sheets with minimal cursing"
-])}.
-
-*Sealed with the Royal Stamp of Ridiculous Importance* 👑
+
+def analyze_image_quickly(upload):
+    """Read the photo locally, asking the AI only when the royal eye is unsure"""
+    notice = st.empty()
+    try:
+        return pipeline.analyze_image_quickly(upload, on_wait=lambda job: show_queue_position(notice, job))
+    except Exception as e:
+        st.warning(f"AI analysis failed: {e}")
+        return None
+    finally:
+        notice.empty()
+
+
+def stream_llm_proclamation(name, ai_description, title=None, location=None, fresh=False):
+    """Have LLaMA write the proclamation, streaming it onto the page as it comes
+
+    Returns the text, or None if the scribe failed before writing anything (the
+    caller then falls back to the template). Text cut short by a failure is kept.
+    fresh=True skips the cached text so a reroll gets a new proclamation.
     """
-    
-    return description.strip()
+    slot = st.empty()
+    chunks = []
+    failure = None
+
+    def tokens():
+        nonlocal failure
+        try:
+            for token in pipeline.stream_llm_proclamation(name, ai_description, title=title, location=location, fresh=fresh):
+                chunks.append(token)
+                yield token
+        except Exception as e:
+            failure = e
+
+    with metrics.span("proclamation", mode="llm"):
+        with slot.container():
+            st.write_stream(tokens())
+    text = "".join(chunks).strip()
+    if failure is None:
+        return text
+    if text in ("", pipeline.PROCLAMATION_HEADING.strip()):
+        slot.empty()
+        st.warning(f"The royal scribe dropped their quill ({failure}); the court's template will do.")
+        return None
+    st.warning(f"The royal scribe was interrupted ({failure}); the proclamation ends there.")
+    return text
+
 
-def create_medieval_image_transformation(image_bytes, full_description, name):
+def create_medieval_image_transformation(upload, full_description, name, title_part=None):
     """Transform image to look medieval and add text overlay using nano-banana"""
+    notice = st.empty()
     try:
-        # Convert uploaded image to base64 for nano-banana
-        image_b64 = base64.b64encode(image_bytes).decode()
-        data_uri = f"data:image/jpeg;base64,{image_b64}"
-        
-        # Create a comprehensive prompt for medieval transformation
-        medieval_elements = [
-            "Add a golden ornate medieval frame around the portrait",
-            "Give the person a royal crown or medieval headdress", 
-            "Add a flowing medieval cape or royal robes",
-            "Include heraldic symbols and coat of arms in the background",
-            "Add medieval castle towers in the distant background",
-            "Give the scene a warm, candlelit medieval atmosphere",
-            "Add some medieval props like a scepter, sword, or royal orb"
-        ]
-        
-        # Randomly select 3-4 elements for variety
-        selected_elements = random.sample(medieval_elements, k=random.randint(3, 4))
-        
-        # Create a shorter, key part of the description for the image
-        title_part = ""
-        if "stands" in full_description and "of" in full_description:
-            # Extract just the title and name part
-            try:
-                stands_part = full_description.split("stands")[1].split(",")[0].strip()
-                title_part = stands_part.replace("**", "").strip()
-            except:
-                title_part = f"{name} - Royal Personage"
-        else:
-            title_part = f"{name} - Royal Personage"
-        
-        prompt = f"""Transform this portrait into a humorous medieval royal painting style. 
-        {' '.join(selected_elements)}
-        
-        MOST IMPORTANT: Keep the original person's face clearly visible and recognizable.
-        Transform the image style to medieval royal portrait but preserve the person's identity.
-        
-        Add a small elegant medieval scroll banner at the bottom with just the title: '{title_part}'
-        
-        Focus on visual transformation: medieval styling, royal clothing, majestic background.
-        Make it look like a classical royal portrait but with modern humorous touches. 
-        Use rich medieval colors: deep reds, royal blues, gold accents.
-        Make it both majestic and slightly silly in a fun way.
-        
-        The person should still be clearly recognizable in medieval royal attire."""
-        
-        output = replicate.run(
-            "google/nano-banana",
-            input={
-                "prompt": prompt,
-                "image_input": [data_uri],
-                "aspect_ratio": "match_input_image",
-                "output_format": "jpg"
-            }
+        return pipeline.create_medieval_image_transformation(
+            upload, full_description, name,
+            inflight=inflight_predictions(),
+            on_status=lambda handle, job: notice.info(describe_prediction(handle, job)),
+            title_part=title_part
         )
-        
-        # Return the URL of the generated image
-        return output
-        
     except Exception as e:
         st.error(f"Medieval image transformation failed: {e}")
         return None
+    finally:
+        notice.empty()
 
-def analyze_image_with_ai(image_bytes):
-    """Use AI to analyze the image and generate a more specific description"""
+
+def start_medieval_transformation(upload, title_part):
+    """Start nano-banana in the background before the proclamation text exists"""
+    return pipeline.start_medieval_transformation(upload, title_part, inflight=inflight_predictions())
+
+
+def wait_for_medieval_transformation(image_future):
+    """Block until a background transformation finishes, reporting failures like the sync path"""
     try:
-        # Convert image to base64
-        image_b64 = base64.b64encode(image_bytes).decode()
-        data_uri = f"data:image/jpeg;base64,{image_b64}"
-        
-        # Use Replicate's LLaVA or similar vision model
-        output = replicate.run(
-            "yorickvp/llava-13b:b5f6212d032508382d61ff00469ddda3e32fd8a0e75dc39d8a4191bb742157fb",
-            input={
-                "image": data_uri,
-                "prompt": "Describe this person in 2-3 words focusing on their appearance or setting. Be brief and simple."
-            }
+        return image_future.result()
+    except Exception as e:
+        st.error(f"Medieval image transformation failed: {e}")
+        return None
+
+
+def create_image_with_text_overlay(upload, full_description):
+    """Create an image with complete medieval text overlay using nano-banana (the artistic variant)"""
+    notice = st.empty()
+    try:
+        return pipeline.create_image_with_text_overlay(
+            upload, full_description,
+            inflight=inflight_predictions(),
+            on_status=lambda handle, job: notice.info(describe_prediction(handle, job))
         )
-        
-        # Extract key words from AI response
-        ai_description = str(output).lower()
-        return ai_description
-        
     except Exception as e:
-        st.warning(f"AI analysis failed: {e}")
+        st.error(f"Image overlay generation failed: {e}")
         return None
+    finally:
+        notice.empty()
+
 
-def create_image_with_text_overlay(image_bytes, full_description):
-    """Create an image with complete medieval text overlay using nano-banana"""
+def create_local_text_overlay(upload, full_description):
+    """Draw the proclamation onto parchment scrolls over the photo locally with Pillow"""
     try:
-        # Convert uploaded image to base64 for nano-banana
-        image_b64 = base64.b64encode(image_bytes).decode()
-        data_uri = f"data:image/jpeg;base64,{image_b64}"
+        return pipeline.create_local_text_overlay(upload, full_description)
+    except Exception as e:
+        st.error(f"Image overlay rendering failed: {e}")
+        return None
+
+
+def resume_image_prediction(track_key, cache_key=None):
+    """Wait for an image prediction started by an earlier script run and return its bytes"""
+    notice = st.empty()
+    try:
+        return pipeline.resume_image_prediction(
+            track_key, inflight_predictions(),
+            on_status=lambda handle, job: notice.info(describe_prediction(handle, job)),
+            cache_key=cache_key
+        )
+    except Exception as e:
+        st.error(f"Royal portrait failed: {e}")
+        return None
+    finally:
+        notice.empty()
+
+
+def portrait_src(digest, variant=None):
+    """What st.image should load a stored portrait from: its static URL, or else the file"""
+    path = pipeline.get_blob_store().path(digest, variant)
+    if STATIC_BLOBS:
+        return "/app/static/" + os.path.relpath(os.path.abspath(path), STATIC_DIR).replace(os.sep, "/")
+    return path
+
+
+def show_portrait_downloads(digest, label, file_stem):
+    """Download buttons for the full JPEG and a smaller WebP, plus a lasting link when one exists"""
+    store = pipeline.get_blob_store()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label=label,
+            data=store.read(digest),
+            file_name=f"{file_stem}.jpg",
+            mime="image/jpeg"
+        )
+    with col2:
+        webp = store.read(digest, "webp")
+        st.download_button(
+            label=f"🪶 Smaller WebP ({len(webp) // 1024} KB)",
+            data=webp,
+            file_name=f"{file_stem}.webp",
+            mime="image/webp"
+        )
+    if STATIC_BLOBS:
+        st.markdown(f"🔗 [Shareable link to thy portrait]({portrait_src(digest)})")
+
+
+def show_medieval_portrait(image, medieval_image, name):
+    """Show the medieval transformation next to the original, with a download button"""
+    with metrics.span("render", view="medieval"):
+        st.success("👑 Medieval Royal Portrait Complete!")
         
-        # Clean up the description for better text overlay
-        clean_description = full_description.replace("🏰", "").replace("**", "").replace("*", "").strip()
+        # Display both images side by side
+        col1, col2 = st.columns(2)
         
-        # Create a prompt for adding the complete medieval text to the image
-        prompt = f"""IMPORTANT: Keep the original image completely unchanged. Only add text overlay.
+        with col1:
+            st.markdown("**📸 Original Portrait:**")
+            st.image(image, caption="Thy modern visage", width=300)
         
-        Add elegant medieval scroll text overlay to this image with the royal proclamation: 
-        '{clean_description}'
+        with col2:
+            st.markdown("**👑 Medieval Royal Portrait:**")
+            st.image(portrait_src(medieval_image, "thumb"), caption="Thy royal medieval transformation", width=300)
+        
+        # Provide download option
+        show_portrait_downloads(medieval_image, "👑 Download Medieval Royal Portrait", f"medieval_royal_{name.replace(' ', '_')}")
+
+
+def show_overlay_portrait(image, overlay_image, name):
+    """Show the proclamation overlay next to the original, with a download button"""
+    with metrics.span("render", view="overlay"):
+        st.success("📜 Royal Portrait with Proclamation Complete!")
         
-        DO NOT modify the original image - only add text overlays on decorative parchment scrolls.
-        Keep the person and background exactly as they are in the original photo.
-        Place the text on ornate medieval scroll banners that appear to be placed over the image.
-        Use medieval calligraphy and make the text readable and elegant.
-        The original image should remain fully visible underneath the text scrolls."""
+        # Display both images side by side
+        col1, col2 = st.columns(2)
         
-        output = replicate.run(
-            "google/nano-banana",
-            input={
-                "prompt": prompt,
-                "image_input": [data_uri],
-                "aspect_ratio": "match_input_image",
-                "output_format": "jpg"
-            }
-        )
+        with col1:
+            st.markdown("**Original Portrait:**")
+            st.image(image, caption="Thy noble visage", width=300)
         
-        # Return the URL of the generated image
-        return output
+        with col2:
+            st.markdown("**Royal Proclamation Portrait:**")
+            st.image(portrait_src(overlay_image, "thumb"), caption="Thy proclaimed portrait", width=300)
         
-    except Exception as e:
-        st.error(f"Image overlay generation failed: {e}")
-        return None
+        # Provide download option
+        show_portrait_downloads(overlay_image, "📜 Download Royal Portrait", f"royal_portrait_{name.replace(' ', '_')}")
 
-def generate_ai_enhanced_description(ai_description, name):
-    """Generate medieval description enhanced by AI analysis"""
-    title = random.choice(TITLES)
-    
-    # Try to extract meaningful words from AI description
-    descriptor = "the Mysterious"
-    if ai_description:
-        if any(word in ai_description for word in ["smile", "smiling", "happy"]):
-            descriptor = "the Eternally Cheerful"
-        elif any(word in ai_description for word in ["serious", "stern", "focused"]):
-            descriptor = "the Contemplative"
-        elif any(word in ai_description for word in ["glasses", "spectacles"]):
-            descriptor = "the Wise-Eyed Scholar"
-        elif any(word in ai_description for word in ["beard", "mustache"]):
-            descriptor = "the Magnificently Whiskered"
-        elif any(word in ai_description for word in ["hat", "cap"]):
-            descriptor = "the Crown-Bearer"
-        elif any(word in ai_description for word in ["young", "child"]):
-            descriptor = "the Youthful"
-        elif any(word in ai_description for word in ["outdoor", "outside", "nature"]):
-            descriptor = "the Wild Wanderer"
-    
-    location = random.choice(LOCATIONS)
-    skill = random.choice(SKILLS)
-    trait = random.choice(PERSONALITY_TRAITS)
-    
-    description = f"""
-🏰 **ROYAL PROCLAMATION** 🏰
-
-Hearken all! Before thee stands **{title} {name} {descriptor} of {location}**, 
-noble {skill} and {trait}.
-
-*As divined by the Royal Court's mystical viewing crystal* 🔮
-
-By royal decree, this distinguished personage shall be remembered 
-throughout the realm for their legendary prowess in {random.choice([
-    "conquering the weekly grocery quest",
-    "navigating the treacherous realm of IKEA",
-    "mastering the ancient art of untangling earphones",
-    "wielding the power of perfect emoji selection",
-    "commanding respect from voice assistants",
-    "achieving legendary status in online shopping",
-    "maintaining the sacred ritual of coffee consumption",
-    "defending the realm against spam calls"
-])}.
-
-*Sealed with the Royal Stamp of AI-Enhanced Ridiculousness* 👑✨
+
+def show_fallback_overlay(upload, image, description, name):
+    """When nano-banana can't paint, inscribe the proclamation locally so there's still a portrait"""
+    st.info("🖋️ The royal painters are indisposed, so the court scribes have inscribed thy proclamation instead.")
+    overlay_image = create_local_text_overlay(upload, description)
+    if overlay_image:
+        show_overlay_portrait(image, overlay_image, name)
+    return overlay_image
+
+
+def remember_pending_portrait(upload, kind, description, name, future=None, prompt=None):
+    """Note what an image prediction is for, so a rerun can pick it back up
+
+    future is the portrait started in the background, if it was; it finishes
+    (and leaves the in-flight predictions) whether or not the script is rerun.
+    prompt is the one painted from, so a portrait that finished in between
+    can be found in the result cache.
     """
-    
-    return description.strip()
+    st.session_state["pending_portrait"] = {
+        "cache_key": pipeline.image_cache_key(upload, prompt) if prompt else None,
+        "upload": upload.digest(MODEL_IMAGE_SIZES[NANO_BANANA_MODEL]),
+        "kind": kind,
+        "description": description,
+        "name": name,
+        "options": gallery_options,
+        "prompt": prompt,
+        "future": future
+    }
+
+
+def gallery_session():
+    """This visitor's key in the gallery, kept in the URL so a bookmark brings their portraits back"""
+    session = st.query_params.get("court")
+    if not session:
+        session = uuid.uuid4().hex[:16]
+        st.query_params["court"] = session
+    return session
+
+
+def record_in_gallery(name, description, options, portrait_kind=None, portrait=None, ai_description=None, upload=None, timings=None, prompt=None):
+    """Keep this result in the royal gallery so it can be shown again without repainting"""
+    pipeline.save_to_gallery(
+        name, description, options, portrait_kind=portrait_kind, image=portrait,
+        ai_description=ai_description, upload=upload, timings=timings, session=gallery_session(), prompt=prompt
+    )
+
+
+# Each stage's results are remembered for the session under the inputs that produced them,
+# so reruns redraw the last result and a new request only redoes the stages whose inputs changed
+MEMO_SIZE = 8
+
+
+def memo(stage):
+    """This session's remembered results for one stage ("analysis", "text" or "portrait"), oldest first"""
+    return st.session_state.setdefault("royal_memo", {}).setdefault(stage, {})
+
+
+def remember(stage, key, value):
+    """Remember a stage's result, keeping only the MEMO_SIZE most recent per stage"""
+    results = memo(stage)
+    results.pop(key, None)
+    results[key] = value
+    while len(results) > MEMO_SIZE:
+        results.pop(next(iter(results)))
+    return value
+
+
+def prepared_upload(uploaded_file):
+    """The decoded upload, kept for the session so a rerun doesn't decode and re-encode the photo"""
+    # Pillow is only needed once there's a photo, so it isn't imported before the form is up
+    from image_prep import PreparedUpload
+
+    cached = st.session_state.get("prepared_upload")
+    if cached is None or cached[0] != uploaded_file.file_id:
+        # Fix orientation and colour mode once; each model gets its own downscaled encoding from this
+        with metrics.span("upload_decode") as span:
+            upload = PreparedUpload.from_file(uploaded_file)
+            span.set(bytes=uploaded_file.size, width=upload.size[0], height=upload.size[1])
+        cached = st.session_state["prepared_upload"] = (uploaded_file.file_id, upload)
+    return cached[1]
+
+
+def show_royal_portrait(image, portrait, kind, name):
+    """Show a finished portrait the way it was made"""
+    if kind == "medieval":
+        show_medieval_portrait(image, portrait, name)
+    else:
+        show_overlay_portrait(image, portrait, name)
+
+
+def show_royal_result(upload, image, result):
+    """Redraw the last result from memory, without calling any model"""
+    st.success("🎊 Royal Proclamation Complete!")
+    st.markdown(result["description"])
+    if result.get("variants"):
+        show_portrait_variants(upload, image, result)
+    elif result["portrait"] and result["portrait"] in pipeline.get_blob_store():
+        show_royal_portrait(image, result["portrait"], result["kind"], result["name"])
+
+
+def show_portrait_variants(upload, image, result):
+    """The grid of portrait variants: each appears as it's finished, with a button to keep it
+
+    Finished variants are drawn before waiting on the rest, so a pick made while
+    others are still painting takes effect at once: the rest are canceled and
+    the page reruns with the chosen portrait.
+    """
+    batch = result["variants"]
+    st.markdown("**🎭 Choose thy royal portrait:**")
+    slots = [column.empty() for column in st.columns(len(batch))]
+    status = st.empty()
+    shown = set()
+    while True:
+        # Taken first, so a variant finishing while the others are drawn still gets drawn next time round
+        pending = batch.pending()
+        for index in batch.finished():
+            if index in shown:
+                continue
+            shown.add(index)
+            with slots[index].container():
+                digest = batch.result(index)
+                if digest is None or digest not in pipeline.get_blob_store():
+                    st.caption(f"🕯️ This canvas was spoiled ({batch.error(index) or 'set aside'}).")
+                    continue
+                st.image(portrait_src(digest, "thumb"), width="stretch")
+                st.caption(f"Painted in {batch.seconds(index):.0f}s")
+                if st.button("👑 This one", key=f"pick_variant_{result['variants_id']}_{index}"):
+                    keep_portrait_variant(upload, result, index)
+                    st.rerun()
+        if not pending:
+            break
+        # Redrawn twice a second, which also lets a click on "This one" interrupt the wait
+        status.info(f"🎨 The royal painters are finishing {len(pending)} more... ({time.monotonic() - batch.started_at:.0f}s)")
+        batch.wait(timeout=0.5)
+    status.empty()
+
+
+def keep_portrait_variant(upload, result, index):
+    """Make the picked variant the result's portrait, stop the others, and hang it in the gallery"""
+    batch = result.pop("variants")
+    digest = pipeline.pick_variant(batch, index)
+    result.update(portrait=digest, kind="medieval")
+    remember("portrait", result["portrait_key"], (digest, "medieval"))
+    result["timings"]["portrait"] = batch.seconds(index)
+    record_in_gallery(
+        result["name"], result["description"], result["options"], "medieval", digest,
+        result["ai_description"], upload, result["timings"], prompt=batch.variants[index]
+    )
+
+
+GALLERY_PAGE_SIZE = 6
+
+
+def show_gallery_entry(row):
+    """One gallery card: the stored thumbnail (or a note if it has been cleared out) and a view button"""
+    store = pipeline.get_blob_store()
+    if row["image"] and row["image"] in store:
+        st.image(portrait_src(row["image"], "thumb"), width="stretch")
+    elif row["image"]:
+        st.caption("🕯️ This portrait has faded from the archive; its proclamation remains.")
+    else:
+        st.markdown("## 📜")
+    st.caption(f"**{row['name']}** · {time.strftime('%d %b %Y, %H:%M', time.localtime(row['created_at']))}")
+    if st.button("View", key=f"gallery_view_{row['id']}"):
+        st.session_state["gallery_open"] = row["id"]
+
+
+@st.fragment
+def show_gallery():
+    """Past proclamations, newest first, a page at a time; only the shown page is read or thumbnailed
+
+    Visitors see only their own; staff (GALLERY_STAFF) can also look up a name or everyone's.
+    """
+    gallery = pipeline.get_gallery()
+    scope = "Mine"
+    if GALLERY_STAFF:
+        scope = st.radio("Whose portraits?", ["Mine", "By name", "The whole court's"], horizontal=True, key="gallery_scope")
+    session = name_filter = None
+    if scope == "Mine":
+        session = st.query_params.get("court")
+        if not session:
+            st.caption("Thy portraits will hang here once the court has made one.")
+            return
+    elif scope == "By name":
+        name_filter = st.text_input("Name", key="gallery_name", placeholder="e.g. The Unnamed One")
+        if not name_filter:
+            return
+
+    # Keyset pagination: remember the cursor each page started from
+    if st.session_state.get("gallery_filter") != (scope, session, name_filter):
+        st.session_state["gallery_filter"] = (scope, session, name_filter)
+        st.session_state["gallery_cursors"] = [None]
+    cursors = st.session_state["gallery_cursors"]
+    rows = gallery.page(GALLERY_PAGE_SIZE + 1, before=cursors[-1], session=session, name=name_filter)
+    has_older = len(rows) > GALLERY_PAGE_SIZE
+    rows = rows[:GALLERY_PAGE_SIZE]
+    if not rows:
+        st.caption("No proclamations hang here yet.")
+        return
+
+    columns = st.columns(3)
+    for i, row in enumerate(rows):
+        with columns[i % 3]:
+            show_gallery_entry(row)
+
+    newer, position, older = st.columns([1, 2, 1])
+    if newer.button("◀ Newer", disabled=len(cursors) == 1, key="gallery_newer"):
+        cursors.pop()
+        st.rerun(scope="fragment")
+    position.caption(f"Page {len(cursors)} of {-(-gallery.count(session=session, name=name_filter) // GALLERY_PAGE_SIZE)}")
+    if older.button("Older ▶", disabled=not has_older, key="gallery_older"):
+        cursors.append(gallery.cursor(rows[-1]))
+        st.rerun(scope="fragment")
+
+    opened = st.session_state.get("gallery_open")
+    row = gallery.get(opened) if opened is not None else None
+    if row is not None and (GALLERY_STAFF or row["session"] == session):
+        st.markdown("---")
+        st.markdown(row["description"])
+        if row["image"] and row["image"] in pipeline.get_blob_store():
+            st.image(portrait_src(row["image"], "small"), width=400)
+            show_portrait_downloads(row["image"], "👑 Download Royal Portrait", f"royal_portrait_{row['name'].replace(' ', '_')}")
+
+
+@st.fragment(run_every=5)
+def show_admin_panel():
+    """Live per-stage latency percentiles and model queue state, refreshed every few seconds"""
+    st.markdown("### 📈 Royal Stopwatch")
+    rows = [
+        {
+            "stage": labels["stage"] + "".join(f" ({v})" for k, v in labels.items() if k != "stage"),
+            "count": count,
+            "p50 s": round(p50, 3),
+            "p95 s": round(p95, 3),
+            "p99 s": round(p99, 3),
+        }
+        for labels, count, (p50, p95, p99) in metrics.METRICS.percentiles("stage_seconds")
+    ]
+    if rows:
+        st.dataframe(rows, hide_index=True)
+    else:
+        st.caption("No stages timed yet.")
+    for name, title in (("model_queue_seconds", "Queue wait"), ("model_run_seconds", "Model run")):
+        for labels, count, (p50, p95, p99) in metrics.METRICS.percentiles(name):
+            st.caption(f"{title} · {labels['model']}: p50 {p50:.2f}s, p95 {p95:.2f}s, p99 {p99:.2f}s ({count} calls)")
+    quick = pipeline.heuristic_stats()
+    if quick["requests"]:
+        st.caption(f"Quick glance: {quick['hit_rate']:.0%} of {quick['requests']} answered without LLaVA, ~{quick['seconds_saved']:.0f}s saved")
+    warmup = pipeline.get_warmup_scheduler().stats()
+    for model, state in warmup["models"].items():
+        times = {
+            labels["warmth"]: p50 for labels, count, (p50, p95, p99) in metrics.METRICS.percentiles("model_call_seconds")
+            if labels["model"] == pipeline.model_label(model)
+        }
+        latency = " · ".join(f"{warmth} p50 {times[warmth]:.1f}s" for warmth in ("cold", "warm") if warmth in times)
+        st.caption(f"{'🔥 Warm' if state['warm'] else '🧊 Cold'} · {pipeline.model_label(model)}: {state['cold_calls']} cold / {state['warm_calls']} warm calls"
+                   f"{' · ' + latency if latency else ''} · {state['pings']} keep-alives ({state['ping_seconds']:.0f}s)")
+    staging = pipeline.get_input_stager().stats()
+    if staging["staged"] or staging["inline"]:
+        sent = metrics.METRICS.percentile("generation_sent_bytes", 0.5)
+        per_generation = f", ~{sent / 1024:.0f} KB sent per generation" if sent is not None else ""
+        st.caption(f"Photos staged ({staging['mode']}): {staging['staged']} uploaded, {staging['reused']} reused, "
+                   f"{staging['inline']} sent inline{per_generation}")
+    scheduler = pipeline.get_model_scheduler().stats()
+    st.caption(f"Running {sum(scheduler['running'].values())}, queued {sum(scheduler['queued'].values())}, turned away {scheduler['rejected']}")
+
+
+if ADMIN_PANEL:
+    with st.sidebar:
+        show_admin_panel()
 
 # Main app interface
 st.markdown("### 📸 Upload thy portrait, noble steed🐴!")
@@ -339,8 +583,8 @@ if name == "":
 # Analysis options
 analysis_type = st.radio(
     "Choose thy method of royal analysis:",
-    ["🎲 Random Royal Description (Fast)", "🔮 AI-Enhanced Analysis (Uses AI vision)"],
-    help="Random is instant and silly. AI-Enhanced analyzes your photo for more personalized silliness!"
+    ["🎲 Random Royal Description (Fast)", "🔮 AI-Enhanced Analysis (Uses AI vision)", "⚡ Quick Royal Glance (Reads thy photo locally)"],
+    help="Random is instant and silly. AI-Enhanced analyzes your photo for more personalized silliness! Quick Glance judges thy light and surroundings in an instant, and only asks the AI when unsure."
 )
 
 # Image transformation options
@@ -357,157 +601,251 @@ image_option = st.radio(
 create_overlay = image_option == "🖼️ Add medieval text overlay only"
 create_medieval = image_option == "👑 Full medieval royal transformation (Recommended!)"
 
-use_ai = analysis_type.startswith("🔮")
+artistic_overlay = False
+if create_overlay:
+    artistic_overlay = st.checkbox(
+        "🎨 Artistic overlay (AI-painted scrolls, slower)",
+        help="The standard overlay is drawn instantly by the royal scribes. Artistic asks nano-banana to paint the scrolls, which takes longer and may garble the text."
+    )
+
+variant_count = 1
+if create_medieval:
+    variant_count = st.select_slider(
+        "🎭 Portraits to choose from",
+        options=list(range(1, pipeline.MAX_VARIANTS + 1)),
+        help="The royal painters paint this many at once, each with different regalia. They appear as they're finished; keeping one early stops the rest."
+    )
+
+llm_proclamation = st.checkbox(
+    "✍️ Let the royal scribe write the whole proclamation (streams live)",
+    help="LLaMA writes a one-of-a-kind proclamation from scratch, word by word as thou watchest. With AI-Enhanced analysis it also works in what the viewing crystal saw."
+)
+
+use_ai = analysis_type.startswith(("🔮", "⚡"))
+quick_glance = analysis_type.startswith("⚡")
+# Recorded with each gallery entry, in the same terms as pipeline.generate_portrait()
+gallery_options = {
+    "analysis": "quick" if quick_glance else "ai" if use_ai else "random",
+    "style": "medieval" if create_medieval else "artistic" if artistic_overlay else "overlay" if create_overlay else "text",
+    "proclamation": "llm" if llm_proclamation else "template",
+}
+if variant_count > 1:
+    gallery_options["variants"] = variant_count
 
 if uploaded_file is not None:
+    # Load the descriptor pool (refreshing it in the background if stale) while options are picked
+    pipeline.get_descriptors()
+    upload = prepared_upload(uploaded_file)
+    image = upload.image
     # Display the uploaded image
-    image = Image.open(uploaded_file)
     st.image(image, caption="Thy noble visage", width=300)
     
+    # What each stage depends on; a stage is redone only when its key changes
+    upload_key = upload.digest(MODEL_IMAGE_SIZES[NANO_BANANA_MODEL])
+    analysis_key = (upload_key, gallery_options["analysis"])
+    text_key = (*analysis_key, name, gallery_options["proclamation"])
+    inputs = (*text_key, gallery_options["style"], variant_count)
+    last_result = st.session_state.get("royal_result")
+    
     # Generate description button
-    if st.button("🏰 Generate Royal Proclamation!", type="primary"):
-        
-        # Convert image to bytes for processing
-        img_byte_arr = BytesIO()
-        image.save(img_byte_arr, format='JPEG')
-        img_byte_arr = img_byte_arr.getvalue()
+    generate_clicked = st.button("🏰 Generate Royal Proclamation!", type="primary")
+    
+    # A rerun while a portrait was being painted: reattach to that prediction instead of dropping it
+    pending = st.session_state.get("pending_portrait")
+    if (
+        not generate_clicked
+        and pending
+        and pending["upload"] == upload_key
+    ):
+        st.info("⏳ Thy portrait was still being painted; the royal court picks up where it left off...")
+        st.markdown(pending["description"])
+        with st.spinner("🎨 The royal court painters are finishing thy portrait..."):
+            if pending.get("future") is not None:
+                # Painted in the background, so it may well have finished during the rerun
+                portrait = wait_for_medieval_transformation(pending["future"])
+            else:
+                # Still painting, or finished during the rerun and waiting in the result cache
+                portrait = resume_image_prediction(f"{pending['kind']}:{pending['upload']}", pending.get("cache_key"))
+        st.session_state.pop("pending_portrait", None)
+        if portrait and pending["kind"] == "medieval":
+            show_medieval_portrait(image, portrait, pending["name"])
+            portrait_kind = "medieval"
+        elif portrait:
+            show_overlay_portrait(image, portrait, pending["name"])
+            portrait_kind = "artistic"
+        else:
+            portrait = show_fallback_overlay(upload, image, pending["description"], pending["name"])
+            portrait_kind = "overlay"
+        record_in_gallery(
+            pending["name"], pending["description"], pending.get("options", {}), portrait_kind, portrait, upload=upload,
+            prompt=pending.get("prompt") if portrait_kind == "medieval" else None
+        )
+        if last_result and last_result.get("pending"):
+            # The run that started this portrait never got to finish its result; complete it here
+            last_result.update(pending=False, portrait=portrait, kind=portrait_kind)
+            if portrait:
+                remember("portrait", (upload_key, *last_result["inputs"][-2:], pending["description"]), (portrait, portrait_kind))
+    
+    elif not generate_clicked and last_result and last_result["description"] and last_result["inputs"][0] == upload_key:
+        # Any other rerun (a download, a changed option) redraws the last result from memory
+        if last_result["inputs"] != inputs:
+            st.caption("🪶 Thy choices have changed since this proclamation; press Generate to update only what they touch.")
+        show_royal_result(upload, image, last_result)
+    
+    if generate_clicked:
+        # A portrait still painting from an earlier click is superseded by this run, whatever style it picks
+        st.session_state.pop("pending_portrait", None)
+        
+        # While nano-banana's circuit breaker is open, go straight to the local overlay
+        painters_available = pipeline.model_available(NANO_BANANA_MODEL)
+        started = time.perf_counter()
+        sent_before = upload.bytes_sent
+        timings = {}
+        portrait = portrait_kind = None
+        
+        # Asking again with nothing changed means a fresh proclamation; otherwise reuse what still fits
+        reroll = last_result is not None and last_result["inputs"] == inputs
+        ai_description = memo("analysis").get(analysis_key) if use_ai else None
+        remembered_text = None if reroll else memo("text").get(text_key)
+        if last_result and last_result.get("variants"):
+            # Nobody picked from the last set of variants; stop painting them
+            last_result["variants"].cancel()
+        st.session_state["royal_result"] = {
+            "inputs": inputs, "name": name, "options": gallery_options, "timings": timings,
+            "description": None, "ai_description": None, "portrait": None, "kind": None, "pending": True
+        }
         
-        if use_ai:
+        # The same photo and name always earn the same title, so the portrait prompt
+        # repeats and a re-click is painted from the result cache, pipelined or not
+        title, location = choose_title_and_location(pipeline.portrait_rng(upload, name))
+        title_part = f"{title} {name} of {location}"
+        image_future = None
+        if use_ai and create_medieval and variant_count == 1 and painters_available and ai_description is None and remembered_text is None:
+            # The portrait only needs the title line, so start it now and let nano-banana paint
+            # while LLaVA analyzes; total wait is the slower of the two instead of their sum
+            image_future = start_medieval_transformation(upload, title_part)
+        
+        if use_ai and ai_description is None and remembered_text is None:
             with st.spinner("The royal court's mystical viewing crystal is analyzing thy likeness..."):
                 # Get AI analysis
-                ai_description = analyze_image_with_ai(img_byte_arr)
-                
+                ai_description = analyze_image_quickly(upload) if quick_glance else analyze_image_with_ai(upload)
+            if ai_description:
+                remember("analysis", analysis_key, ai_description)
+            timings["analysis"] = time.perf_counter() - started
+        
+        description = None
+        if remembered_text is not None:
+            description = remembered_text
+            st.success("🎊 Royal Proclamation Complete!")
+            st.markdown(description)
+        
+        elif llm_proclamation:
+            # Streamed straight onto the page; the finished text feeds the portrait prompts below
+            description = stream_llm_proclamation(name, ai_description, title=title, location=location, fresh=reroll)
+            if description:
+                st.success("🎊 Royal Proclamation Complete!")
+        
+        if description is None:
+            if use_ai:
                 # Generate enhanced description
-                description = generate_ai_enhanced_description(ai_description, name)
-        else:
-            # Generate random description instantly
-            description = generate_medieval_description(has_image=True)
-            # Replace placeholder name
-            description = description.replace("[Your Name]", name)
-        
-        # Display the royal proclamation
-        st.success("🎊 Royal Proclamation Complete!")
-        st.markdown(description)
+                with metrics.span("proclamation"):
+                    description = generate_ai_enhanced_description(ai_description, name, title=title, location=location)
+            else:
+                # Generate random description instantly
+                with metrics.span("proclamation"):
+                    description = generate_medieval_description(has_image=True, title=title, location=location)
+                # Replace placeholder name
+                description = description.replace("[Your Name]", name)
+            
+            # Display the royal proclamation
+            st.success("🎊 Royal Proclamation Complete!")
+            st.markdown(description)
+        remember("text", text_key, description)
+        st.session_state["royal_result"].update(description=description, ai_description=ai_description)
+        timings["proclamation"] = time.perf_counter() - started
         
         # Generate image transformations if requested
-        if create_overlay or create_medieval:
-            if create_medieval:
+        stage = time.perf_counter()
+        portrait_key = (upload_key, gallery_options["style"], variant_count, description)
+        st.session_state["royal_result"]["portrait_key"] = portrait_key
+        remembered_portrait = memo("portrait").get(portrait_key)
+        if remembered_portrait and remembered_portrait[0] not in pipeline.get_blob_store():
+            # Evicted from the portrait store since; paint it again
+            remembered_portrait = None
+        
+        if remembered_portrait:
+            portrait, portrait_kind = remembered_portrait
+            show_royal_portrait(image, portrait, portrait_kind, name)
+        
+        elif create_overlay or create_medieval:
+            if create_medieval and not painters_available:
+                portrait, portrait_kind = show_fallback_overlay(upload, image, description, name), "overlay"
+            
+            elif create_medieval and variant_count > 1:
+                # Paint several at once and let the visitor keep one; the pick is recorded when it's made
+                st.session_state["royal_result"].update(
+                    pending=False, variants_id=uuid.uuid4().hex[:8],
+                    variants=pipeline.start_medieval_variants(upload, title_part, variant_count)
+                )
+                show_portrait_variants(upload, image, st.session_state["royal_result"])
+            
+            elif create_medieval:
+                remember_pending_portrait(
+                    upload, "medieval", description, name, future=image_future,
+                    prompt=pipeline.medieval_prompt(upload, title_part)
+                )
                 with st.spinner("🎨 The royal court painters are transforming thy portrait into a majestic medieval masterpiece..."):
-                    # Use the complete description for the medieval transformation
-                    medieval_image = create_medieval_image_transformation(img_byte_arr, description, name)
-                    
-                    if medieval_image:
-                        st.success("👑 Medieval Royal Portrait Complete!")
-                        
-                        # Display both images side by side
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            st.markdown("**📸 Original Portrait:**")
-                            st.image(image, caption="Thy modern visage", width=300)
-                        
-                        with col2:
-                            st.markdown("**👑 Medieval Royal Portrait:**")
-                            # Display the AI-generated medieval image
-                            try:
-                                # Handle different possible output formats from nano-banana
-                                if hasattr(medieval_image, 'url') and callable(getattr(medieval_image, 'url', None)):
-                                    image_url = medieval_image.url()
-                                    st.image(image_url, caption="Thy royal medieval transformation", width=300)
-                                elif hasattr(medieval_image, 'url'):
-                                    # url is a property, not a method
-                                    st.image(medieval_image.url, caption="Thy royal medieval transformation", width=300)
-                                elif isinstance(medieval_image, list) and len(medieval_image) > 0:
-                                    # Handle if output is a list
-                                    st.image(medieval_image[0], caption="Thy royal medieval transformation", width=300)
-                                elif isinstance(medieval_image, str):
-                                    # Direct URL string
-                                    st.image(medieval_image, caption="Thy royal medieval transformation", width=300)
-                                else:
-                                    st.image(str(medieval_image), caption="Thy royal medieval transformation", width=300)
-                            except Exception as e:
-                                st.error(f"Could not display the medieval image: {e}")
-                                st.write(f"Debug - Image object type: {type(medieval_image)}")
-                                st.write(f"Debug - Image object: {medieval_image}")
-                        
-                        # Provide download option
-                        try:
-                            if hasattr(medieval_image, 'read') and callable(getattr(medieval_image, 'read', None)):
-                                img_data = medieval_image.read()
-                                st.download_button(
-                                    label="👑 Download Medieval Royal Portrait",
-                                    data=img_data,
-                                    file_name=f"medieval_royal_{name.replace(' ', '_')}.jpg",
-                                    mime="image/jpeg"
-                                )
-                            elif hasattr(medieval_image, 'url'):
-                                # Provide link to view/download
-                                image_url = medieval_image.url if not callable(getattr(medieval_image, 'url', None)) else medieval_image.url()
-                                st.markdown(f"[👑 View/Download Medieval Portrait]({image_url})")
-                            elif isinstance(medieval_image, str):
-                                st.markdown(f"[👑 View/Download Medieval Portrait]({medieval_image})")
-                        except Exception as e:
-                            st.warning(f"Download not available: {e}")
-                            # At least show the image URL for manual download
-                            try:
-                                if hasattr(medieval_image, 'url'):
-                                    image_url = medieval_image.url if not callable(getattr(medieval_image, 'url', None)) else medieval_image.url()
-                                    st.code(f"Image URL: {image_url}")
-                                elif isinstance(medieval_image, str):
-                                    st.code(f"Image URL: {medieval_image}")
-                            except:
-                                pass
+                    if image_future is not None:
+                        medieval_image = wait_for_medieval_transformation(image_future)
+                    else:
+                        medieval_image = create_medieval_image_transformation(upload, description, name, title_part)
+                st.session_state.pop("pending_portrait", None)
+                
+                if medieval_image:
+                    show_medieval_portrait(image, medieval_image, name)
+                    portrait, portrait_kind = medieval_image, "medieval"
+                else:
+                    portrait, portrait_kind = show_fallback_overlay(upload, image, description, name), "overlay"
                             
             elif create_overlay:
+                artistic_overlay = artistic_overlay and painters_available
+                if artistic_overlay:
+                    remember_pending_portrait(upload, "overlay", description, name, prompt=pipeline.build_overlay_prompt(description))
                 with st.spinner("📜 The royal scribes are inscribing thy proclamation upon thy portrait..."):
                     # Use the complete description for the text overlay
-                    overlay_image = create_image_with_text_overlay(img_byte_arr, description)
-                    
-                    if overlay_image:
-                        st.success("📜 Royal Portrait with Proclamation Complete!")
-                        
-                        # Display both images side by side
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            st.markdown("**Original Portrait:**")
-                            st.image(image, caption="Thy noble visage", width=300)
-                        
-                        with col2:
-                            st.markdown("**Royal Proclamation Portrait:**")
-                            # Display the AI-generated image with overlay
-                            try:
-                                if hasattr(overlay_image, 'url') and callable(getattr(overlay_image, 'url', None)):
-                                    st.image(overlay_image.url(), caption="Thy proclaimed portrait", width=300)
-                                elif hasattr(overlay_image, 'url'):
-                                    st.image(overlay_image.url, caption="Thy proclaimed portrait", width=300)
-                                elif isinstance(overlay_image, list) and len(overlay_image) > 0:
-                                    st.image(overlay_image[0], caption="Thy proclaimed portrait", width=300)
-                                else:
-                                    st.image(str(overlay_image), caption="Thy proclaimed portrait", width=300)
-                            except Exception as e:
-                                st.error(f"Could not display the overlay image: {e}")
-                                st.write(f"Debug - Image object type: {type(overlay_image)}")
-                                st.write(f"Debug - Image object: {overlay_image}")
-                        
-                        # Provide download option
-                        try:
-                            if hasattr(overlay_image, 'read'):
-                                img_data = overlay_image.read()
-                                st.download_button(
-                                    label="📜 Download Royal Portrait",
-                                    data=img_data,
-                                    file_name=f"royal_portrait_{name.replace(' ', '_')}.jpg",
-                                    mime="image/jpeg"
-                                )
-                        except Exception as e:
-                            st.warning(f"Download not available: {e}")
+                    if artistic_overlay:
+                        overlay_image = create_image_with_text_overlay(upload, description)
+                    else:
+                        overlay_image = create_local_text_overlay(upload, description)
+                st.session_state.pop("pending_portrait", None)
+                
+                if overlay_image:
+                    show_overlay_portrait(image, overlay_image, name)
+                    portrait, portrait_kind = overlay_image, "artistic" if artistic_overlay else "overlay"
+                elif artistic_overlay:
+                    portrait, portrait_kind = show_fallback_overlay(upload, image, description, name), "overlay"
+            if portrait:
+                remember("portrait", portrait_key, (portrait, portrait_kind))
+            timings["portrait"] = time.perf_counter() - stage
+        timings["total"] = time.perf_counter() - started
+        pipeline.record_bytes_sent(upload, sent_before)
+        st.session_state["royal_result"].update(portrait=portrait, kind=portrait_kind, pending=False)
+        fresh = remembered_text is None or (portrait and not remembered_portrait)
+        if fresh and not st.session_state["royal_result"].get("variants"):
+            # Only new results go in the gallery (variants once one is picked); remembered ones are already there
+            prompt = pipeline.medieval_prompt(upload, title_part) if portrait_kind == "medieval" else None
+            record_in_gallery(name, description, gallery_options, portrait_kind, portrait, ai_description, upload, timings, prompt)
         
         # Add some royal flourish
         st.balloons()
         
 else:
     st.info("👆 Upload an image above to receive thy royal medieval description!")
+
+# Past portraits are read back from the gallery and blob store, never repainted
+st.markdown("---")
+if st.toggle("🖼️ Visit the royal gallery", help="Every proclamation and portrait the court has made. Bookmark this page's link to find thine again."):
+    show_gallery()
     
 # Instructions
 st.markdown("---")
@@ -518,9 +856,11 @@ st.markdown("""
 3. **Choose analysis type**:
    - 🎲 **Random**: Instant silly medieval description using AI-generated terms
    - 🔮 **AI-Enhanced**: AI analyzes your photo for personalized medieval nonsense
+   - ⚡ **Quick Glance**: Light, colour and scenery are read locally in milliseconds; the AI is only asked about photos that are hard to call
+   - ✍️ **Royal scribe** (optional): LLaMA writes the whole proclamation live instead of filling in the template
 4. **Choose thy portrait style**:
    - 📜 **Text-only**: Just the hilarious proclamation
-   - 🖼️ **Text overlay**: Adds medieval text to your photo
+   - 🖼️ **Text overlay**: Adds medieval text to your photo (instantly, or AI-painted with the artistic option)
    - 👑 **Full medieval**: Complete royal transformation with crown, robes, castle!
 5. **Receive thy royal proclamation & portrait!** 👑
 
@@ -534,32 +874,43 @@ st.markdown("""
 *Perfect for profile pics, social media, or becoming internet royalty!*
 """)
 
-# Replicate Models showcase
-st.markdown("### 🔥 Replicate AI Models Used")
-col1, col2, col3 = st.columns(3)
 
-with col1:
-    st.markdown("""
-    **[🦙 LLaMA 3 70B](https://replicate.com/meta/meta-llama-3-70b-instruct)**
+def show_model_showcase():
+    """Replicate Models showcase"""
+    col1, col2, col3 = st.columns(3)
     
-    Generates creative medieval descriptors, titles, and skills
-    """)
-
-with col2:
-    st.markdown("""
-    **[👁️ LLaVA 13B](https://replicate.com/yorickvp/llava-13b)**
+    with col1:
+        st.markdown("""
+        **[🦙 LLaMA 3 70B](https://replicate.com/meta/meta-llama-3-70b-instruct)**
+        
+        Generates creative medieval descriptors, titles, and skills
+        """)
     
-    Computer vision for analyzing your photos
-    """)
-
-with col3:
-    st.markdown("""
-    **[🎨 nano-banana](https://replicate.com/google/nano-banana)**
+    with col2:
+        st.markdown("""
+        **[👁️ LLaVA 13B](https://replicate.com/yorickvp/llava-13b)**
+        
+        Computer vision for analyzing your photos
+        """)
     
-    Advanced image editing for medieval transformations
-    """)
+    with col3:
+        st.markdown("""
+        **[🎨 nano-banana](https://replicate.com/google/nano-banana)**
+        
+        Advanced image editing for medieval transformations
+        """)
+    
+    st.markdown("*Explore these models and more on [Replicate.com](https://replicate.com) 🚀*")
+
 
-st.markdown("*Explore these models and more on [Replicate.com](https://replicate.com) 🚀*")
+if FAST_START:
+    with st.expander("🔥 Replicate AI Models Used"):
+        show_model_showcase()
+    if st.toggle("🎬 Watch the demo video"):
+        show_demo_video()
+else:
+    st.markdown("### 🔥 Replicate AI Models Used")
+    show_model_showcase()
 
 # Fun facts section
 with st.expander("🏰 Medieval Fun Facts & AI Features"):
@@ -585,6 +936,20 @@ with st.expander("🏰 Medieval Fun Facts & AI Features"):
     
     *Your medieval persona is scientifically* calculated using cutting-edge AI (*still not actually scientific)*
     """)
+    
+    cache_stats = get_result_cache().stats()
+    st.caption(
+        f"🗄️ Result cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+        f"({cache_stats['hit_rate']:.0%} hit rate), {cache_stats['entries']} entries, "
+        f"{cache_stats['bytes'] / 1024 / 1024:.1f} MB"
+    )
+    blob_stats = pipeline.get_blob_store().stats()
+    st.caption(f"🖼️ Portrait store: {blob_stats['images']} images, {blob_stats['bytes'] / 1024 / 1024:.1f} MB")
+    flight_stats = get_single_flight().stats()
+    st.caption("🪶 Duplicate requests collapsed: " + (", ".join(
+        f"{label} {counts['collapsed']} of {counts['executed'] + counts['collapsed']}"
+        for label, counts in sorted(flight_stats.items())
+    ) or "none yet"))
 
 # Sticky footer
 st.markdown("""
@@ -0,0 +1,168 @@
+"""Batch-generate royal proclamations and portraits for a directory of photos
+
+    python batch.py photos/ --names names.csv --out output/ --style medieval --analysis ai --workers 4
+
+names.csv needs "photo" and "name" columns (photo is the file name inside the
+photo directory); photos without a row are proclaimed as "The Unnamed One".
+For each photo the proclamation goes to <out>/<photo stem>.md and the portrait
+to <out>/<photo stem>.jpg, and a line is appended to <out>/manifest.jsonl.
+Re-running with the same --out skips photos the manifest already lists as done.
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pipeline
+from image_prep import PreparedUpload
+
+PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+DEFAULT_NAME = "The Unnamed One"
+
+
+def load_names(path):
+    if not path:
+        return {}
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        missing = {"photo", "name"} - set(reader.fieldnames or [])
+        if missing:
+            raise SystemExit(f"{path} is missing column(s): {', '.join(sorted(missing))}")
+        return {row["photo"].strip(): row["name"].strip() for row in reader if row["photo"].strip()}
+
+
+def load_done(manifest_path):
+    """Photos the manifest already records as finished"""
+    done = set()
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record["photo"])
+    return done
+
+
+def process_photo(photo_dir, photo, name, out_dir, analysis, style, proclamation="template", seed=None):
+    stem = os.path.splitext(photo)[0]
+    record = {"photo": photo, "name": name, "analysis": analysis, "style": style, "proclamation": proclamation}
+    started = time.perf_counter()
+    try:
+        with open(os.path.join(photo_dir, photo), "rb") as f:
+            upload = PreparedUpload.from_file(f)
+        result = pipeline.generate_portrait(
+            upload, name, analysis=analysis, style=style, proclamation=proclamation,
+            seed=None if seed is None else f"{seed}:{photo}"
+        )
+    except Exception as e:
+        record.update(status="failed", error=str(e), seconds=time.perf_counter() - started)
+        return record
+
+    with open(os.path.join(out_dir, f"{stem}.md"), "w") as f:
+        f.write(result["description"] + "\n")
+    if result["image"] is not None:
+        shutil.copyfile(pipeline.get_blob_store().path(result["image"]), os.path.join(out_dir, f"{stem}.jpg"))
+    record.update(
+        status="ok",
+        ai_description=result["ai_description"],
+        errors=result["errors"],
+        timings=result["timings"],
+        bytes_sent=result["bytes_sent"],
+        seconds=time.perf_counter() - started,
+    )
+    return record
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def print_report(records, skipped, elapsed):
+    ok = [r for r in records if r["status"] == "ok"]
+    failed = [r for r in records if r["status"] != "ok"]
+    print()
+    print(f"Processed {len(records)} photo(s) in {elapsed:.1f}s: {len(ok)} ok, {len(failed)} failed, {skipped} skipped (already done)")
+    if records and elapsed > 0:
+        print(f"Throughput: {len(ok) / elapsed * 60:.1f} portraits/min")
+    stages = sorted({stage for r in ok for stage in r["timings"]})
+    if stages:
+        print(f"{'stage':>12}  {'p50 s':>7}  {'p95 s':>7}  {'max s':>7}")
+        for stage in stages:
+            values = [r["timings"][stage] for r in ok if stage in r["timings"]]
+            print(f"{stage:>12}  {statistics.median(values):>7.2f}  {percentile(values, 0.95):>7.2f}  {max(values):>7.2f}")
+    sent = [r["bytes_sent"] for r in ok if "bytes_sent" in r]
+    if sent:
+        staging = pipeline.get_input_stager().stats()
+        print(f"Sent to Replicate: {statistics.median(sent) / 1024:.0f} KB per photo (median), {sum(sent) / 2**20:.1f} MB in all; input images {staging['mode']}: {staging['staged']} staged, {staging['inline']} sent inline")
+    quick = pipeline.heuristic_stats()
+    if quick["requests"]:
+        print(f"Quick analysis: {quick['hits']}/{quick['requests']} answered locally ({quick['hit_rate']:.0%}), ~{quick['seconds_saved']:.1f}s of LLaVA saved")
+    for r in failed:
+        print(f"  failed {r['photo']}: {r['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("photos", help="directory of .jpg/.jpeg/.png photos")
+    parser.add_argument("--names", help="CSV with photo,name columns")
+    parser.add_argument("--out", default="output", help="output directory (default: output)")
+    parser.add_argument("--analysis", choices=pipeline.ANALYSIS_MODES, default="random")
+    parser.add_argument("--style", choices=pipeline.PORTRAIT_STYLES, default="medieval")
+    parser.add_argument("--proclamation", choices=pipeline.PROCLAMATION_MODES, default="template",
+                        help="llm has LLaMA write each proclamation instead of filling in the template")
+    parser.add_argument("--seed", type=int, help="make each photo's template proclamation reproducible")
+    parser.add_argument("--workers", type=int, default=4, help="photos processed at once (default: 4)")
+    parser.add_argument("--no-resume", action="store_true", help="redo photos the manifest lists as done")
+    args = parser.parse_args(argv)
+
+    needs_replicate = args.analysis != "random" or args.style in ("medieval", "artistic") or args.proclamation == "llm"
+    if needs_replicate and not os.getenv("REPLICATE_API_TOKEN"):
+        raise SystemExit("Missing REPLICATE_API_TOKEN environment variable. Get one at https://replicate.com/account/api-tokens")
+
+    names = load_names(args.names)
+    photos = sorted(
+        entry for entry in os.listdir(args.photos)
+        if os.path.splitext(entry)[1].lower() in PHOTO_EXTENSIONS
+    )
+    os.makedirs(args.out, exist_ok=True)
+    manifest_path = os.path.join(args.out, "manifest.jsonl")
+    done = set() if args.no_resume else load_done(manifest_path)
+    todo = [photo for photo in photos if photo not in done]
+    skipped = len(photos) - len(todo)
+
+    # Let the descriptor pool refresh while the first photos are read
+    pipeline.get_descriptors()
+
+    records = []
+    manifest_lock = threading.Lock()
+    started = time.perf_counter()
+    with open(manifest_path, "a") as manifest, ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(process_photo, args.photos, photo, names.get(photo, DEFAULT_NAME), args.out, args.analysis, args.style, args.proclamation, args.seed)
+            for photo in todo
+        ]
+        for count, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            records.append(record)
+            with manifest_lock:
+                manifest.write(json.dumps(record) + "\n")
+                manifest.flush()
+            print(f"[{count}/{len(todo)}] {record['photo']}: {record['status']} ({record['seconds']:.1f}s)", file=sys.stderr)
+
+    print_report(records, skipped, time.perf_counter() - started)
+    return 0 if all(r["status"] == "ok" for r in records) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""Benchmark the HTTP API against the Streamlit app: throughput and memory per client
+
+    python -m benchmarks.api_bench --clients 8 --requests 3 --mode ai/medieval --speed 0.05
+
+Starts benchmarks.fake_replicate in-process, then measures each target in a
+process of its own, so its memory is its own:
+
+- api: api.py served by uvicorn. The clients are asyncio tasks here that
+  POST a multipart photo and read the job's event stream until "done".
+- streamlit: app.py under `streamlit run`. Each client speaks Streamlit's
+  websocket protocol as a browser tab does: it uploads a new photo, then
+  clicks Generate, which reruns the whole script. Sessions stay open until
+  the end, as tabs would.
+
+Every client sends --requests photos, each one different, so no cache
+answers. Both targets warm up with one request before the baseline RSS is
+read. Reported: requests per second, p50 time to the proclamation (API only;
+a Streamlit rerun returns all at once) and to the finished result, idle and
+peak RSS, and (peak - idle) / clients.
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.fake_replicate import make_server
+from benchmarks.load_test import make_photo
+
+ANALYSIS_OPTIONS = {"random": "🎲", "ai": "🔮", "quick": "⚡"}
+STYLE_OPTIONS = {"text": "Text-only", "overlay": "🖼️", "artistic": "🖼️", "medieval": "👑"}
+
+
+def rss_mb(pid="self", field="VmRSS"):
+    """Resident (VmRSS) or peak resident (VmHWM) memory of a process, from /proc"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def summarize(latencies, first, failures, wall, idle, peak, clients):
+    return {
+        "requests": len(latencies) + failures,
+        "failures": failures,
+        "rps": len(latencies) / wall if wall else 0.0,
+        "first_p50": statistics.median(first) if first else None,
+        "total_p50": statistics.median(latencies) if latencies else None,
+        "idle_mb": idle,
+        "peak_mb": peak,
+        "per_client_mb": (peak - idle) / clients,
+    }
+
+
+def bench_api(args, env):
+    import httpx
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = subprocess.Popen([sys.executable, "api.py", "--port", str(port)], env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    analysis, style = args.mode.split("/")
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{base_url}/healthz").raise_for_status()
+                break
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+        async def request(client, seed):
+            started = time.perf_counter()
+            response = await client.post(
+                "/jobs", files={"photo": ("photo.jpg", make_photo(seed), "image/jpeg")},
+                data={"name": f"Sir Client {seed}", "analysis": analysis, "style": style}
+            )
+            response.raise_for_status()
+            first = None
+            async with client.stream("GET", response.json()["events"]) as events:
+                async for line in events.aiter_lines():
+                    if line == "event: proclamation":
+                        first = time.perf_counter() - started
+                    elif line == "event: failed":
+                        raise RuntimeError("job failed")
+                    elif line == "event: done":
+                        return first, time.perf_counter() - started
+            raise RuntimeError("event stream ended early")
+
+        async def run():
+            limits = httpx.Limits(max_connections=2 * args.clients + 2)
+            async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+                await request(client, args.seed * 10000 + 9999)  # warm-up
+                idle = rss_mb(server.pid)
+                latencies, first, failures = [], [], 0
+
+                async def one_client(client_id):
+                    nonlocal failures
+                    for number in range(args.requests):
+                        try:
+                            to_first, total = await request(client, args.seed * 10000 + client_id * 100 + number)
+                        except Exception as e:
+                            print(f"api client {client_id}: {e}", file=sys.stderr)
+                            failures += 1
+                            continue
+                        latencies.append(total)
+                        if to_first is not None:
+                            first.append(to_first)
+
+                started = time.perf_counter()
+                await asyncio.gather(*(one_client(client_id) for client_id in range(args.clients)))
+                wall = time.perf_counter() - started
+                return summarize(latencies, first, failures, wall, idle, rss_mb(server.pid, "VmHWM"), args.clients)
+
+        return asyncio.run(run())
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def widget_states(session, photo, choices, trigger=None):
+    """A rerun_script BackMsg setting the session's photo and options, optionally clicking the button labelled trigger"""
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+
+    message = BackMsg()
+    states = message.rerun_script.widget_states
+    name, size, urls = photo
+    state = states.widgets.add(id=session["Choose an image..."].id)
+    state.file_uploader_state_value.uploaded_file_info.add(name=name, size=size, file_id=urls.file_id, file_urls=urls)
+    for label, value in choices.items():
+        if label not in session:
+            continue
+        state = states.widgets.add(id=session[label].id)
+        if isinstance(value, bool):
+            state.bool_value = value
+        else:
+            state.string_value = value
+    if trigger is not None:
+        states.widgets.add(id=session[trigger].id, trigger_value=True)
+    return message
+
+
+def bench_streamlit(args, env):
+    import httpx
+    import websockets
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", "app.py", "--server.headless", "true", "--server.port", str(port),
+         "--server.enableXsrfProtection", "false", "--browser.gatherUsageStats", "false", "--logger.level", "error"],
+        env=env, stdout=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    analysis, style = args.mode.split("/")
+
+    async def run_script(ws, session, message):
+        """Send a rerun and read until the script finishes, noting widgets by label; raises on an exception or error"""
+        await ws.send(message.SerializeToString())
+        problem = None
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await ws.recv())
+            kind = forward.WhichOneof("type")
+            if kind == "new_session":
+                session["id"] = forward.new_session.initialize.session_id
+            elif kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                widget = getattr(element, element.WhichOneof("type"))
+                if element.WhichOneof("type") == "exception":
+                    problem = problem or widget.message
+                elif element.WhichOneof("type") == "alert" and widget.format == widget.ERROR:
+                    problem = problem or widget.body
+                elif getattr(widget, "id", "") and getattr(widget, "label", ""):
+                    session[widget.label] = widget
+            elif kind == "script_finished" and forward.script_finished == forward.FINISHED_SUCCESSFULLY:
+                if problem:
+                    raise RuntimeError(problem)
+                return
+
+    async def upload(ws, http, session, seed):
+        """Upload a photo the way the browser does: ask for a URL over the websocket, then PUT it there"""
+        request = BackMsg()
+        request.file_urls_request.request_id = f"photo-{seed}"
+        request.file_urls_request.file_names.append("photo.jpg")
+        request.file_urls_request.session_id = session["id"]
+        await ws.send(request.SerializeToString())
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await ws.recv())
+            if forward.WhichOneof("type") == "file_urls_response":
+                break
+        urls = forward.file_urls_response.file_urls[0]
+        data = make_photo(seed)
+        try:
+            response = await http.put(urls.upload_url, files={"file": ("photo.jpg", data, "image/jpeg")})
+        except httpx.ReadError:
+            # The server closed an idle keep-alive connection as we reused it; browsers retry a PUT too
+            response = await http.put(urls.upload_url, files={"file": ("photo.jpg", data, "image/jpeg")})
+        response.raise_for_status()
+        return "photo.jpg", len(data), urls
+
+    async def open_session(stack, http, seed):
+        """Connect like a browser tab, then pick a photo, name and options so the Generate button shows"""
+        ws = await stack.enter_async_context(
+            websockets.connect(f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"], max_size=None)
+        )
+        session = {}
+        first = BackMsg()
+        first.rerun_script.SetInParent()
+        await run_script(ws, session, first)
+        choices = {
+            "What shall we call thee?": f"Sir Client {seed}",
+            "Choose thy method of royal analysis:": next(
+                o for o in session["Choose thy method of royal analysis:"].options if o.startswith(ANALYSIS_OPTIONS[analysis])
+            ),
+            "Choose thy royal portrait style:": next(
+                o for o in session["Choose thy royal portrait style:"].options if o.startswith(STYLE_OPTIONS[style])
+            ),
+        }
+        await run_script(ws, session, widget_states(session, await upload(ws, http, session, seed), choices))
+        artistic = next((label for label in session if label.startswith("🎨")), None)
+        if artistic:
+            choices[artistic] = style == "artistic"
+        return ws, session, choices
+
+    async def generate(ws, http, session, choices, seed):
+        started = time.perf_counter()
+        photo = await upload(ws, http, session, seed)
+        await run_script(ws, session, widget_states(session, photo, choices, trigger="🏰 Generate Royal Proclamation!"))
+        return time.perf_counter() - started
+
+    async def run():
+        async with contextlib.AsyncExitStack() as stack:
+            http = await stack.enter_async_context(httpx.AsyncClient(base_url=base_url, timeout=300))
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    (await http.get("/_stcore/health")).raise_for_status()
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise
+                    await asyncio.sleep(0.2)
+
+            ws, session, choices = await open_session(stack, http, args.seed * 10000 + 9998)
+            await generate(ws, http, session, choices, args.seed * 10000 + 9999)  # warm-up
+            idle = rss_mb(server.pid)
+            latencies, failures = [], 0
+
+            async def one_client(client_id):
+                nonlocal failures
+                # Kept open until the end, like a browser tab
+                ws, session, choices = await open_session(stack, http, args.seed * 10000 + client_id * 100 + 99)
+                for number in range(args.requests):
+                    try:
+                        total = await generate(ws, http, session, choices, args.seed * 10000 + client_id * 100 + number)
+                    except Exception as e:
+                        print(f"streamlit client {client_id}: {e!r}", file=sys.stderr)
+                        failures += 1
+                        continue
+                    latencies.append(total)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one_client(client_id) for client_id in range(args.clients)))
+            wall = time.perf_counter() - started
+            return summarize(latencies, [], failures, wall, idle, rss_mb(server.pid, "VmHWM"), args.clients)
+
+    try:
+        return asyncio.run(run())
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients (default: 8)")
+    parser.add_argument("--requests", type=int, default=3, help="photos per client (default: 3)")
+    parser.add_argument("--mode", default="ai/medieval", help="analysis/style, e.g. random/overlay (default: ai/medieval)")
+    parser.add_argument("--targets", nargs="+", default=["api", "streamlit"], choices=["api", "streamlit"])
+    parser.add_argument("--speed", type=float, default=0.05, help="fake model latency multiplier (default: 0.05)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = make_server(speed=args.speed, seed=args.seed, models={name: {"error_rate": 0} for name in ("llama", "llava", "nano-banana")})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Fake Replicate at {server.backend.base_url} (speed x{args.speed}); {args.clients} clients x "
+          f"{args.requests} requests of {args.mode}", file=sys.stderr)
+
+    reports = []
+    for target in args.targets:
+        scratch = tempfile.mkdtemp(prefix=f"api_bench_{target}_")
+        env = dict(
+            os.environ,
+            REPLICATE_BASE_URL=server.backend.base_url,
+            REPLICATE_API_TOKEN=os.getenv("REPLICATE_API_TOKEN", "fake-token"),
+            RESULT_CACHE_DIR=os.path.join(scratch, "results"),
+            DESCRIPTOR_STORE_PATH=os.path.join(scratch, "descriptors.json"),
+            BLOB_STORE_DIR=os.path.join(scratch, "blobs"),
+            GALLERY_PATH=os.path.join(scratch, "gallery.sqlite3"),
+        )
+        reports.append((target, bench_api(args, env) if target == "api" else bench_streamlit(args, env)))
+
+    print(f"{'target':>10}  {'reqs':>5}  {'fail':>5}  {'req/s':>6}  {'first p50 s':>11}  {'total p50 s':>11}  "
+          f"{'idle RSS MB':>11}  {'peak RSS MB':>11}  {'MB/client':>9}")
+    for target, report in reports:
+        first = f"{report['first_p50']:.2f}" if report["first_p50"] is not None else "-"
+        total = f"{report['total_p50']:.2f}" if report["total_p50"] is not None else "-"
+        print(f"{target:>10}  {report['requests']:>5}  {report['failures']:>5}  {report['rps']:>6.2f}  {first:>11}  {total:>11}  "
+              f"{report['idle_mb']:>11.1f}  {report['peak_mb']:>11.1f}  {report['per_client_mb']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
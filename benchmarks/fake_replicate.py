@@ -0,0 +1,432 @@
+"""Offline stand-in for the parts of the Replicate HTTP API the app uses
+
+Serves LLaMA 3 70B, LLaVA 13B and nano-banana predictions with simulated latency,
+failures and output sizes, so the app, batch.py and the benchmarks can run
+without a network or a paid token. Point the replicate client at it with
+REPLICATE_BASE_URL:
+
+    python -m benchmarks.fake_replicate --port 5055 [--speed 0.1] [--config models.json]
+    REPLICATE_BASE_URL=http://127.0.0.1:5055 REPLICATE_API_TOKEN=fake streamlit run app.py
+
+Predictions created with "stream": true also get a server-sent events URL
+that releases their tokens spread over the simulated latency (LLaMA streams
+stream_tokens, a short proclamation).
+
+POST /v1/files accepts uploads like Replicate's files API. A prediction whose
+input refers to a file URL that was never uploaded fails, and bytes_received
+tallies request bodies per model (and "files" for uploads).
+
+A model with a cold_boot (seconds, 0 by default) scales to zero like a
+Replicate deployment: after idle_timeout seconds without a prediction running,
+the next one waits cold_boot seconds in "starting" before it runs, and
+cold_starts counts the boots. Both are multiplied by --speed like latencies.
+
+--config is a JSON object keyed by model name ("llama", "llava", "nano-banana")
+whose values override fields of DEFAULT_MODELS, e.g.
+{"nano-banana": {"median": 20, "error_rate": 0.05}} or {"llava": {"cold_boot": 30}}.
+"""
+import argparse
+import copy
+import email.parser
+import email.policy
+import hashlib
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+
+# Latency is lognormal around median (seconds) with the given sigma
+DEFAULT_MODELS = {
+    "llama": {
+        "model": "meta/meta-llama-3-70b-instruct",
+        "median": 2.0,
+        "sigma": 0.4,
+        "error_rate": 0.01,
+        "cold_boot": 0,
+        "idle_timeout": 300,
+        "output": "tokens",
+        "tokens": ["Sir", " Byte", "-a-lot", ", ", "Lady", " Wi", "fi", ", ", "Duke", " of", " Dongles",
+                   ", ", "Baron", " von", " Buffer", ", ", "Dame", " Deadline", ", ", "Count", " Cookie",
+                   ", ", "Earl", " Grey", "scale", ", ", "Knight", " Mode"],
+        "stream_tokens": ("Hearken all! Before thee stands **Sir Test of the Fake Server**, wielder of "
+                          "mocked responses and keeper of the sacred localhost. Though no true oracle "
+                          "answers, this noble one bears the burden of latency simulated at random, and "
+                          "fears not the timeout.\n\n*By royal decree, this proclamation is sealed with "
+                          "the wax of a thousand unit tests.*").split(" "),
+    },
+    "llava": {
+        "model": "yorickvp/llava-13b",
+        "median": 3.0,
+        "sigma": 0.35,
+        "error_rate": 0.01,
+        "cold_boot": 0,
+        "idle_timeout": 300,
+        "output": "tokens",
+        "tokens": ["Smiling", " person", " outdoors", "."],
+    },
+    "nano-banana": {
+        "model": "google/nano-banana",
+        "median": 12.0,
+        "sigma": 0.3,
+        "error_rate": 0.02,
+        "cold_boot": 0,
+        "idle_timeout": 300,
+        "output": "image",
+        "width": 1024,
+        "height": 1024,
+    },
+}
+
+LLAVA_VERSION = "b5f6212d032508382d61ff00469ddda3e32fd8a0e75dc39d8a4191bb742157fb"
+MAX_WAIT = 60  # seconds the API holds a "Prefer: wait" request open
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeReplicate:
+    """Prediction state and simulated model behaviour behind the HTTP handler"""
+
+    def __init__(self, models=None, speed=1.0, seed=None):
+        self.models = copy.deepcopy(DEFAULT_MODELS)
+        for name, overrides in (models or {}).items():
+            self.models.setdefault(name, {}).update(overrides)
+        self.speed = speed
+        self.random = random.Random(seed)
+        self.predictions = {}
+        self.files = {}
+        self.streams = {}  # prediction ID -> (created, latency) for streaming predictions
+        self.uploads = {}  # file ID -> (file JSON, content)
+        self.counts = {name: 0 for name in self.models}
+        self.cold_starts = {name: 0 for name in self.models}
+        self.ready = {}  # prediction ID -> time.monotonic() when its model is booted
+        self._busy_until = {}  # model name -> when its last prediction finishes
+        self._booted_at = {}  # model name -> when its current boot finishes
+        self.bytes_received = {name: 0 for name in [*self.models, "files"]}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+
+    def find_model(self, identifier):
+        owner_name = identifier.split(":", 1)[0]
+        for name, config in self.models.items():
+            if config["model"] == owner_name:
+                return name, config
+        return None, None
+
+    def create(self, model_name, input, stream=False):
+        config = self.models[model_name]
+        with self._lock:
+            prediction_id = f"fake{next(self._ids):08d}"
+            latency = config["median"] * math.exp(self.random.gauss(0, config["sigma"])) * self.speed
+            failed = self.random.random() < config["error_rate"]
+            missing = [url for url in self._file_urls(input) if url.rsplit("/", 1)[-1] not in self.uploads]
+            if missing:
+                failed, latency = f"Input file not found: {missing[0]}", 0.01 * self.speed
+            boot = 0.0 if missing else self._boot(model_name, config, latency)
+            self.counts[model_name] += 1
+            prediction = {
+                "id": prediction_id,
+                "model": config["model"],
+                "version": LLAVA_VERSION if model_name == "llava" else "",
+                "status": "starting",
+                "input": input,
+                "output": None,
+                "logs": "",
+                "error": None,
+                "metrics": {},
+                "created_at": now(),
+                "started_at": None,
+                "completed_at": None,
+                "urls": {
+                    "get": f"/v1/predictions/{prediction_id}",
+                    "cancel": f"/v1/predictions/{prediction_id}/cancel",
+                },
+            }
+            if stream:
+                prediction["urls"]["stream"] = f"{self.base_url}/stream/{prediction_id}"
+                self.streams[prediction_id] = (time.monotonic() + boot, latency)
+            self.ready[prediction_id] = time.monotonic() + boot
+            self.predictions[prediction_id] = prediction
+        threading.Timer(boot + latency, self._finish, args=(prediction_id, model_name, failed, latency)).start()
+        return prediction
+
+    def _boot(self, model_name, config, latency):
+        # Seconds this prediction waits for its model to boot; called with the lock held
+        started = time.monotonic()
+        cold_boot = config.get("cold_boot", 0) * self.speed
+        if cold_boot and started > self._busy_until.get(model_name, float("-inf")) + config.get("idle_timeout", 300) * self.speed:
+            self._booted_at[model_name] = started + cold_boot
+            self.cold_starts[model_name] += 1
+        boot = max(0.0, self._booted_at.get(model_name, started) - started)
+        self._busy_until[model_name] = max(self._busy_until.get(model_name, started), started + boot + latency)
+        return boot
+
+    def _finish(self, prediction_id, model_name, failed, latency):
+        output = None if failed else self._output(model_name, prediction_id, prediction_id in self.streams)
+        with self._lock:
+            prediction = self.predictions[prediction_id]
+            if prediction["status"] == "canceled":
+                return
+            prediction["status"] = "failed" if failed else "succeeded"
+            prediction["error"] = (failed if isinstance(failed, str) else "Simulated model failure") if failed else None
+            prediction["output"] = output
+            prediction["started_at"] = prediction["started_at"] or datetime.fromtimestamp(time.time() - latency, timezone.utc).isoformat()
+            prediction["completed_at"] = now()
+            prediction["metrics"] = {"predict_time": latency}
+            self._done.notify_all()
+
+    def _output(self, model_name, prediction_id, stream=False):
+        config = self.models[model_name]
+        if config["output"] == "tokens":
+            return self._tokens(config, stream)
+        self.files[prediction_id] = self.image_bytes(config["width"], config["height"])
+        return f"{self.base_url}/files/{prediction_id}.jpg"
+
+    def _file_urls(self, input):
+        prefix = f"{self.base_url}/v1/files/"
+        values = [item for value in input.values() for item in (value if isinstance(value, list) else [value])]
+        return [value for value in values if isinstance(value, str) and value.startswith(prefix)]
+
+    def upload(self, filename, content_type, content, metadata=None):
+        """Keep an uploaded file and return its JSON, as POST /v1/files does"""
+        with self._lock:
+            file_id = f"file{next(self._ids):08d}"
+            file = {
+                "id": file_id,
+                "name": filename,
+                "content_type": content_type,
+                "size": len(content),
+                "etag": hashlib.md5(content).hexdigest(),
+                "checksums": {"sha256": hashlib.sha256(content).hexdigest(), "md5": hashlib.md5(content).hexdigest()},
+                "metadata": metadata or {},
+                "created_at": now(),
+                "expires_at": datetime.fromtimestamp(time.time() + 24 * 3600, timezone.utc).isoformat(),
+                "urls": {"get": f"{self.base_url}/v1/files/{file_id}"},
+            }
+            self.uploads[file_id] = (file, content)
+        return file
+
+    def _tokens(self, config, stream):
+        if stream and "stream_tokens" in config:
+            words = config["stream_tokens"]
+            return [words[0]] + [f" {word}" for word in words[1:]]
+        return list(config["tokens"])
+
+    def stream_events(self, prediction_id):
+        """Yield (event, data) for a streaming prediction, pacing tokens over its latency"""
+        with self._lock:
+            if prediction_id not in self.streams:
+                return
+            config = self.find_model(self.predictions[prediction_id]["model"])[1]
+            started, latency = self.streams[prediction_id]
+        tokens = self._tokens(config, stream=True)
+        # Roughly a tenth of the time goes to the first token, the rest to the others
+        for i, token in enumerate(tokens):
+            due = started + latency * (0.1 + 0.9 * i / len(tokens))
+            time.sleep(max(0.0, due - time.monotonic()))
+            status = self.get(prediction_id)["status"]
+            if status in ("canceled", "failed"):
+                break
+            yield "output", token
+        prediction = self.get(prediction_id, wait=max(0.0, started + latency - time.monotonic()) + 1)
+        if prediction["status"] == "failed":
+            yield "error", prediction["error"]
+        yield "done", "{}" if prediction["status"] == "succeeded" else json.dumps({"reason": prediction["status"]})
+
+    def image_bytes(self, width, height):
+        # Noise compresses about as badly as a photo, so output sizes are realistic
+        key = (width, height)
+        if key not in self.files:
+            noise = Image.effect_noise((width, height), 64).convert("RGB")
+            buffer = BytesIO()
+            noise.save(buffer, format="JPEG", quality=90)
+            self.files[key] = buffer.getvalue()
+        return self.files[key]
+
+    def get(self, prediction_id, wait=0):
+        deadline = time.monotonic() + wait
+        with self._lock:
+            prediction = self.predictions.get(prediction_id)
+            while prediction and prediction["status"] in ("starting", "processing"):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._done.wait(remaining)
+            if prediction and prediction["status"] == "starting" and time.monotonic() >= self.ready.get(prediction_id, 0):
+                prediction["status"] = "processing"
+                prediction["started_at"] = now()
+            return copy.deepcopy(prediction) if prediction else None
+
+    def cancel(self, prediction_id):
+        with self._lock:
+            prediction = self.predictions.get(prediction_id)
+            if prediction and prediction["status"] in ("starting", "processing"):
+                prediction["status"] = "canceled"
+                prediction["completed_at"] = now()
+                self._done.notify_all()
+        return self.get(prediction_id)
+
+
+class Handler(BaseHTTPRequestHandler):
+    backend = None  # set by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if match := re.fullmatch(r"/v1/predictions/([\w-]+)", self.path):
+            return self._reply(self.backend.get(match.group(1)))
+        if match := re.fullmatch(r"/v1/files/([\w-]+)", self.path):
+            return self._reply(self.backend.uploads.get(match.group(1), (None,))[0])
+        if match := re.fullmatch(r"/v1/files/([\w-]+)/download", self.path):
+            file, content = self.backend.uploads.get(match.group(1), (None, None))
+            if file is None:
+                return self._reply(None)
+            self.send_response(200)
+            self.send_header("Content-Type", file["content_type"])
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        if match := re.fullmatch(r"/v1/models/([\w.-]+)/([\w.-]+)/versions/(\w+)", self.path):
+            return self._reply(self._version(match.group(3)))
+        if match := re.fullmatch(r"/files/([\w-]+)\.jpg", self.path):
+            data = self.backend.files.get(match.group(1))
+            if data is None:
+                return self._reply(None)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if match := re.fullmatch(r"/stream/([\w-]+)", self.path):
+            return self._stream(match.group(1))
+        self._reply(None)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        if self.path == "/v1/files":
+            return self._upload(raw)
+        body = json.loads(raw or b"{}")
+        if match := re.fullmatch(r"/v1/predictions/([\w-]+)/cancel", self.path):
+            return self._reply(self.backend.cancel(match.group(1)))
+        if match := re.fullmatch(r"/v1/models/([\w.-]+/[\w.-]+)/predictions", self.path):
+            identifier = match.group(1)
+        elif self.path == "/v1/predictions":
+            identifier = "yorickvp/llava-13b" if body.get("version") == LLAVA_VERSION else body.get("version", "")
+        else:
+            return self._reply(None)
+        name, _ = self.backend.find_model(identifier)
+        if name is None:
+            return self._reply({"title": "Not found", "detail": f"Unknown model {identifier}", "status": 404}, 404)
+        with self.backend._lock:
+            self.backend.bytes_received[name] += length
+        prediction = self.backend.create(name, body.get("input", {}), stream=bool(body.get("stream")))
+        self._reply(self.backend.get(prediction["id"], wait=self._wait()), 201)
+
+    def _upload(self, raw):
+        with self.backend._lock:
+            self.backend.bytes_received["files"] += len(raw)
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode() + raw
+        )
+        fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+        if "content" not in fields:
+            return self._reply({"title": "Bad request", "detail": "No content part", "status": 400}, 400)
+        content = fields["content"]
+        metadata = json.loads(fields["metadata"].get_content()) if "metadata" in fields else None
+        file = self.backend.upload(
+            content.get_filename() or "file", content.get_content_type(), content.get_payload(decode=True), metadata
+        )
+        self._reply(file, 201)
+
+    def _stream(self, prediction_id):
+        if prediction_id not in self.backend.streams:
+            return self._reply(None)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        try:
+            for i, (event, data) in enumerate(self.backend.stream_events(prediction_id)):
+                lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+                self.wfile.write(f"event: {event}\nid: {i}\n{lines}\n".encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client stopped reading
+        self.close_connection = True
+
+    def _wait(self):
+        prefer = self.headers.get("Prefer", "")
+        if not prefer.startswith("wait"):
+            return 0
+        _, _, seconds = prefer.partition("=")
+        return min(int(seconds), MAX_WAIT) if seconds.isdigit() else MAX_WAIT
+
+    def _version(self, version_id):
+        return {
+            "id": version_id,
+            "created_at": now(),
+            "cog_version": "0.9.0",
+            "openapi_schema": {
+                "components": {"schemas": {"Output": {"type": "array", "items": {"type": "string"}, "x-cog-array-type": "iterator"}}}
+            },
+        }
+
+    def _reply(self, payload, status=200):
+        if payload is None:
+            payload, status = {"title": "Not found", "detail": "Not found", "status": 404}, 404
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_server(host="127.0.0.1", port=0, **backend_options):
+    """Build (but don't start) a fake Replicate server; port 0 picks a free port"""
+    backend = FakeReplicate(**backend_options)
+    handler = type("FakeReplicateHandler", (Handler,), {"backend": backend})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    backend.base_url = f"http://{host}:{server.server_address[1]}"
+    server.backend = backend
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--speed", type=float, default=1.0, help="multiply every latency by this (e.g. 0.1)")
+    parser.add_argument("--config", help="JSON file of per-model overrides")
+    parser.add_argument("--seed", type=int, help="seed latency and failure sampling")
+    args = parser.parse_args()
+
+    models = None
+    if args.config:
+        with open(args.config) as f:
+            models = json.load(f)
+    server = make_server(args.host, args.port, models=models, speed=args.speed, seed=args.seed)
+    print(f"Fake Replicate listening on {server.backend.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark the local image heuristics behind "quick" analysis
+
+Run from the repository root:
+
+    python -m benchmarks.heuristics_bench [photos/] [--llava-seconds 3.0]
+
+Times image_heuristics.guess_descriptor() on each photo in the directory (or
+on a set of synthetic scenes if none is given) and reports how many photos
+each confidence threshold would answer locally, and roughly how much LLaVA
+time that saves at --llava-seconds per call (the fake server's median by
+default; use the llava p50 from the admin panel or /metrics for real numbers).
+"""
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from image_heuristics import guess_descriptor
+from image_prep import normalize_image
+
+THRESHOLDS = [0.5, 0.6, 0.75, 0.9]
+
+
+def scene(sky, ground, face, size=(1600, 1200), seed=0):
+    """A crude photo: sky over ground with a face-coloured oval in the middle"""
+    image = Image.new("RGB", size, ground)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 0, size[0], size[1] // 2], fill=sky)
+    draw.ellipse([size[0] * 0.35, size[1] * 0.25, size[0] * 0.65, size[1] * 0.8], fill=face)
+    noise = np.random.default_rng(seed).normal(0, 10, (size[1], size[0], 3))
+    return Image.fromarray(np.clip(np.asarray(image) + noise, 0, 255).astype("uint8"))
+
+
+SCENES = {
+    "park": ((110, 160, 230), (60, 140, 50), (200, 150, 120)),
+    "beach": ((120, 180, 240), (220, 200, 150), (210, 160, 125)),
+    "night": ((25, 25, 35), (20, 18, 25), (80, 60, 50)),
+    "candlelit": ((90, 60, 30), (60, 40, 20), (170, 120, 80)),
+    "sunny room": ((250, 225, 190), (240, 205, 165), (225, 170, 130)),
+    "office": ((170, 170, 175), (120, 120, 125), (200, 150, 120)),
+    "green wall": ((90, 130, 90), (140, 140, 140), (200, 150, 120)),
+    "studio": ((60, 90, 160), (60, 90, 160), (205, 155, 125)),
+}
+
+
+def load_photos(directory):
+    if directory is None:
+        return {name: scene(*colours, seed=i) for i, (name, colours) in enumerate(SCENES.items())}
+    photos = {}
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png")):
+            photos[name] = normalize_image(Image.open(os.path.join(directory, name)))
+    return photos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("photos", nargs="?", help="directory of .jpg/.jpeg/.png photos (default: synthetic scenes)")
+    parser.add_argument("--llava-seconds", type=float, default=3.0, help="LLaVA latency a local answer saves")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per photo")
+    args = parser.parse_args()
+
+    photos = load_photos(args.photos)
+    guess_descriptor(next(iter(photos.values())))  # warm up NumPy
+
+    guesses, timings = {}, []
+    for name, image in photos.items():
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            guesses[name] = guess_descriptor(image)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    print(f"{'photo':>24}  {'descriptor':>24}  {'confidence':>10}")
+    for name, guess in guesses.items():
+        print(f"{name[-24:]:>24}  {guess.descriptor:>24}  {guess.confidence:>10.2f}")
+    print()
+    print(f"Heuristics: median {statistics.median(timings):.1f} ms, max {max(timings):.1f} ms per photo")
+    print(f"{'threshold':>9}  {'hit rate':>8}  {'LLaVA s saved':>13}")
+    for threshold in THRESHOLDS:
+        hits = sum(1 for guess in guesses.values() if guess.confidence >= threshold)
+        saved = hits * (args.llava_seconds - statistics.median(timings) / 1000)
+        print(f"{threshold:>9.2f}  {hits / len(guesses):>8.0%}  {saved:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Load-test the full portrait pipeline against the offline Replicate stand-in
+
+    python -m benchmarks.load_test --sessions 8 --requests 3 --speed 0.1
+    python -m benchmarks.load_test --modes ai/medieval random/overlay --config models.json
+    python -m benchmarks.load_test --staging inline   # photos inlined as data URIs, to compare
+
+Starts benchmarks.fake_replicate in-process (or uses --base-url), then for each
+mode runs N concurrent sessions, each sending R photos through upload ->
+analysis -> proclamation -> portrait. Every photo is slightly different so the
+result cache never answers for the model. Reports p50/p95/p99 latency,
+throughput, failures and peak memory per mode; no network or real token needed.
+Then, for each mode with a nano-banana portrait, it sends one photo twice with
+the same name and options and checks the second was a result cache hit.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+import metrics
+
+from benchmarks.fake_replicate import make_server
+
+DEFAULT_MODES = ["random/text", "random/overlay", "ai/overlay", "quick/overlay", "random/artistic", "ai/medieval"]
+
+
+def make_photo(seed, size=(1600, 1200)):
+    """A synthetic photo as JPEG bytes; seed makes every one distinct"""
+    rng = random.Random(seed)
+    image = Image.effect_noise(size, 40).convert("RGB")
+    tint = Image.new("RGB", size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    image = Image.blend(image, tint, 0.5)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_request(pipeline, photo, name, analysis, style):
+    from image_prep import PreparedUpload
+
+    started = time.perf_counter()
+    try:
+        upload = PreparedUpload.from_file(BytesIO(photo))
+        result = pipeline.generate_portrait(upload, name, analysis=analysis, style=style)
+    except Exception as e:
+        return {"ok": False, "seconds": time.perf_counter() - started, "error": f"{type(e).__name__}: {e}"}
+    return {"ok": True, "seconds": time.perf_counter() - started, "errors": result["errors"], "bytes_sent": result["bytes_sent"]}
+
+
+def run_mode(pipeline, mode, sessions, requests, photos):
+    analysis, style = mode.split("/")
+    counter = iter(range(sessions * requests))
+    counter_lock = threading.Lock()
+
+    def session(session_id):
+        records = []
+        for _ in range(requests):
+            with counter_lock:
+                index = next(counter)
+            records.append(run_request(pipeline, photos[index % len(photos)], f"Tester {session_id}", analysis, style))
+        return records
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        records = [r for batch in executor.map(session, range(sessions)) for r in batch]
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = [r["seconds"] for r in records if r["ok"]]
+    return {
+        "mode": mode,
+        "requests": len(records),
+        "failed": [r["error"] for r in records if not r["ok"]],
+        # Non-fatal errors by the stage that fell back ("analysis", "proclamation", "portrait")
+        "degraded": Counter(error.split(":", 1)[0] for r in records if r["ok"] for error in r["errors"]),
+        "latencies": latencies,
+        "sent_kb": statistics.mean(r["bytes_sent"] for r in records if r["ok"]) / 1024 if latencies else float("nan"),
+        "elapsed": elapsed,
+        "peak_mb": peak / 2**20,
+        "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def check_repeat(pipeline, mode, photo):
+    """Send photo twice with the same options; whether the second portrait came from the cache (None if not painted)"""
+    analysis, style = mode.split("/")
+    label = pipeline.model_label(pipeline.NANO_BANANA_MODEL)
+    first = run_request(pipeline, photo, "Repeat Tester", analysis, style)
+    if not first["ok"] or first["errors"]:
+        return None
+    hits = metrics.METRICS.total("cache_requests_total", model=label, result="hit")
+    second = run_request(pipeline, photo, "Repeat Tester", analysis, style)
+    return second["ok"] and metrics.METRICS.total("cache_requests_total", model=label, result="hit") > hits
+
+
+def print_report(reports):
+    print(f"{'mode':>16}  {'reqs':>5}  {'fail':>5}  {'p50 s':>7}  {'p95 s':>7}  {'p99 s':>7}  {'req/min':>8}  {'KB sent/req':>11}  {'py peak MB':>10}  {'max RSS MB':>10}")
+    for report in reports:
+        latencies = report["latencies"] or [float("nan")]
+        throughput = len(report["latencies"]) / report["elapsed"] * 60 if report["elapsed"] else 0
+        print(
+            f"{report['mode']:>16}  {report['requests']:>5}  {len(report['failed']):>5}  "
+            f"{statistics.median(latencies):>7.2f}  {percentile(latencies, 0.95):>7.2f}  {percentile(latencies, 0.99):>7.2f}  "
+            f"{throughput:>8.1f}  {report['sent_kb']:>11.1f}  {report['peak_mb']:>10.1f}  {report['maxrss_mb']:>10.1f}"
+        )
+    for report in reports:
+        for stage, count in sorted(report["degraded"].items()):
+            print(f"  {report['mode']}: {count} request(s) fell back after a failed {stage}")
+        for error in sorted(set(report["failed"])):
+            print(f"  {report['mode']} failed: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions per mode (default: 8)")
+    parser.add_argument("--requests", type=int, default=3, help="photos per session (default: 3)")
+    parser.add_argument("--modes", nargs="+", default=DEFAULT_MODES, help="analysis/style pairs (default: %(default)s)")
+    parser.add_argument("--speed", type=float, default=0.1, help="fake model latency multiplier (default: 0.1)")
+    parser.add_argument("--config", help="JSON file of per-model overrides for the fake server")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--base-url", help="use an already running fake (or real) Replicate API instead")
+    parser.add_argument("--staging", choices=["replicate", "inline"], default="replicate",
+                        help="upload each photo once through the files API, or inline it in every request (default: replicate)")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        models = None
+        if args.config:
+            with open(args.config) as f:
+                models = json.load(f)
+        server = make_server(models=models, speed=args.speed, seed=args.seed)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = server.backend.base_url
+
+    # pipeline reads these at import time, so set them first and keep the
+    # benchmark's caches, stores and descriptor pool away from the app's
+    scratch = tempfile.mkdtemp(prefix="load_test_")
+    os.environ["REPLICATE_BASE_URL"] = base_url
+    os.environ.setdefault("REPLICATE_API_TOKEN", "fake-token")
+    os.environ["RESULT_CACHE_DIR"] = os.path.join(scratch, "results")
+    os.environ["DESCRIPTOR_STORE_PATH"] = os.path.join(scratch, "descriptors.json")
+    os.environ["BLOB_STORE_DIR"] = os.path.join(scratch, "blobs")
+    os.environ["INPUT_STAGING"] = args.staging
+    import pipeline
+
+    for mode in args.modes:
+        analysis, _, style = mode.partition("/")
+        if analysis not in pipeline.ANALYSIS_MODES or style not in pipeline.PORTRAIT_STYLES:
+            parser.error(f"bad mode {mode!r}; expected analysis/style from {pipeline.ANALYSIS_MODES} and {pipeline.PORTRAIT_STYLES}")
+
+    print(f"Fake Replicate at {base_url} (speed x{args.speed})", file=sys.stderr)
+    total = args.sessions * args.requests
+    # Fill the descriptor pool up front so the first mode isn't charged for it
+    refresh = pipeline.get_descriptor_store().refresh_async()
+    if refresh is not None:
+        refresh.join()
+
+    reports = []
+    for number, mode in enumerate(args.modes):
+        # Fresh photos per mode, so later modes can't hit what earlier ones cached
+        photos = [make_photo((args.seed * len(args.modes) + number) * total + i) for i in range(total)]
+        print(f"Running {mode}: {args.sessions} sessions x {args.requests} requests", file=sys.stderr)
+        reports.append(run_mode(pipeline, mode, args.sessions, args.requests, photos))
+    print_report(reports)
+    repeats_cached = True
+    for number, mode in enumerate(args.modes):
+        if mode.split("/")[1] not in ("medieval", "artistic"):
+            continue
+        cached = check_repeat(pipeline, mode, make_photo(-(args.seed * len(args.modes) + number) - 1))
+        if cached is None:
+            print(f"Repeat {mode}: first request fell back, not checked")
+        else:
+            print(f"Repeat {mode}: second identical request {'hit' if cached else 'MISSED'} the result cache")
+            repeats_cached = repeats_cached and cached
+    quick = pipeline.heuristic_stats()
+    if quick["requests"]:
+        print(f"Quick analysis: {quick['hit_rate']:.0%} of {quick['requests']} answered locally, ~{quick['seconds_saved']:.1f}s of LLaVA saved")
+    if server is not None:
+        counts = ", ".join(f"{name} {count}" for name, count in server.backend.counts.items())
+        print(f"Fake predictions served: {counts}")
+        received = ", ".join(f"{name} {size / 2**20:.1f} MB" for name, size in server.backend.bytes_received.items())
+        print(f"Fake server received: {received}")
+        server.shutdown()
+    return 0 if repeats_cached and not any(report["failed"] for report in reports) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
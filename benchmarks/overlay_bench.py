@@ -0,0 +1,52 @@
+"""Benchmark the local Pillow proclamation overlay across image sizes
+
+Run from the repository root:
+
+    python -m benchmarks.overlay_bench [--repeat 10]
+"""
+import argparse
+import statistics
+import time
+
+from PIL import Image
+
+from overlay import render_overlay
+
+SIZES = [(640, 480), (1024, 768), (768, 1024), (2048, 1536), (4032, 3024)]
+
+DESCRIPTION = """
+🏰 **ROYAL PROCLAMATION** 🏰
+
+Hearken all! Before thee stands **Sir The Unnamed One the Eternally Cheerful of the Coffee Shop**,
+noble slayer of email notifications and commands the mystical forces of autocorrect.
+
+*As divined by the Royal Court's mystical viewing crystal* 🔮
+
+By royal decree, this distinguished personage shall be remembered
+throughout the realm for their legendary prowess in navigating the treacherous realm of IKEA.
+
+*Sealed with the Royal Stamp of AI-Enhanced Ridiculousness* 👑✨
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10, help="renders per size")
+    args = parser.parse_args()
+
+    # Warm the font cache so the first size doesn't pay for font loading
+    render_overlay(Image.new("RGB", SIZES[0]), DESCRIPTION)
+
+    print(f"{'size':>11}  {'median ms':>9}  {'max ms':>7}  {'jpeg KB':>7}")
+    for size in SIZES:
+        image = Image.new("RGB", size, (90, 120, 150))
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            output = render_overlay(image, DESCRIPTION)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{size[0]:>5}x{size[1]:<5}  {statistics.median(timings):>9.1f}  {max(timings):>7.1f}  {len(output) / 1024:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
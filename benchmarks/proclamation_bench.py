@@ -0,0 +1,52 @@
+"""Benchmark template proclamation generation, one at a time and in bulk
+
+Run from the repository root:
+
+    python -m benchmarks.proclamation_bench [--count 20000]
+
+Compares the app's per-request generate_medieval_description() and
+descriptor_for() with the bulk generator writing JSONL to an in-memory file,
+on the built-in example descriptor pool. No model is called.
+"""
+import argparse
+import io
+import random
+import time
+
+import proclamations
+from pipeline import EXAMPLE_LOCATIONS, EXAMPLE_SKILLS, EXAMPLE_TITLES, EXAMPLE_TRAITS
+
+DESCRIPTORS = {"titles": EXAMPLE_TITLES, "locations": EXAMPLE_LOCATIONS, "skills": EXAMPLE_SKILLS, "traits": EXAMPLE_TRAITS}
+LLAVA_TEXTS = ["smiling person outdoors", "man with glasses", "serious woman", "person in a cap", "bearded man in nature", "a dog"]
+
+
+def rate(label, count, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:>38}  {count / elapsed:>12,.0f}/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=20000, help="proclamations per run (default: 20000)")
+    args = parser.parse_args()
+    count = args.count
+    rng = random.Random(0)
+
+    rate("random_proclamation (seeded rng)", count, lambda: [proclamations.random_proclamation(DESCRIPTORS, rng) for _ in range(count)])
+    rate("ai_proclamation (seeded rng)", count, lambda: [
+        proclamations.ai_proclamation(DESCRIPTORS, LLAVA_TEXTS[i % len(LLAVA_TEXTS)], "Ada", rng) for i in range(count)
+    ])
+    rate("descriptor_for", count, lambda: [proclamations.descriptor_for(LLAVA_TEXTS[i % len(LLAVA_TEXTS)]) for i in range(count)])
+    unique = {record["text"] for record in proclamations.generate_bulk(DESCRIPTORS, count, seed=1)}
+    print(f"{'unique proclamations':>38}  {len(unique):>12,} of {count:,} ({proclamations.combination_count(DESCRIPTORS):,} possible)")
+    rate("generate_bulk (unique)", count, lambda: list(proclamations.generate_bulk(DESCRIPTORS, count, seed=1)))
+    rate("generate_bulk (repeats allowed)", count, lambda: list(proclamations.generate_bulk(DESCRIPTORS, count, seed=1, unique=False)))
+    rate("generate_bulk + write_jsonl (unique)", count, lambda: proclamations.write_jsonl(
+        proclamations.generate_bulk(DESCRIPTORS, count, seed=1), io.StringIO()
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Check that clicking Generate again in the app is painted from the result cache
+
+Run from the repository root:
+
+    python -m benchmarks.repeat_check [--modes random ai quick] [--speed 0.02]
+
+Starts benchmarks.fake_replicate in-process and renders app.py through
+Streamlit's AppTest with scratch stores. For each analysis mode it makes a
+full medieval portrait of one photo, then presses Generate again with nothing
+changed (a reroll: the proclamation is rewritten, but the banner title and so
+the nano-banana prompt stay the same). The second run must not start a new
+nano-banana prediction; the exit status is 1 if any mode does.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from io import BytesIO
+
+from benchmarks.fake_replicate import make_server
+from benchmarks.load_test import make_photo
+
+ANALYSIS_OPTIONS = {"random": "🎲", "ai": "🔮", "quick": "⚡"}
+
+
+class Upload(BytesIO):
+    """Stands in for Streamlit's UploadedFile; AppTest can't upload files"""
+
+    def __init__(self, data, file_id):
+        super().__init__(data)
+        self.size = len(data)
+        self.file_id = file_id
+
+
+def generate_twice(photo, analysis, speed):
+    """Make one medieval portrait and press Generate again; returns nano-banana predictions per click"""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    st.file_uploader = lambda *args, **kwargs: Upload(photo, f"repeat-{analysis}")
+    at = AppTest.from_file(os.path.abspath("app.py"), default_timeout=max(60, 600 * speed))
+    at.run()
+    at.text_input[0].input("Repeat Tester")
+    at.radio[0].set_value(next(o for o in at.radio[0].options if o.startswith(ANALYSIS_OPTIONS[analysis])))
+    at.radio[1].set_value(next(o for o in at.radio[1].options if o.startswith("👑")))
+    at.run()
+    predictions = []
+    for _ in range(2):
+        before = SERVER.backend.counts.get("nano-banana", 0)
+        next(button for button in at.button if "Generate" in button.label).click()
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+        predictions.append(SERVER.backend.counts.get("nano-banana", 0) - before)
+    return predictions
+
+
+def main(argv=None):
+    global SERVER
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=list(ANALYSIS_OPTIONS), choices=list(ANALYSIS_OPTIONS))
+    parser.add_argument("--speed", type=float, default=0.02, help="fake model latency multiplier (default: 0.02)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    SERVER = make_server(speed=args.speed, seed=args.seed, models={name: {"error_rate": 0} for name in ("llama", "llava", "nano-banana")})
+    threading.Thread(target=SERVER.serve_forever, daemon=True).start()
+
+    # The app reads these at import time, so set them first and keep its stores away from the real ones
+    scratch = tempfile.mkdtemp(prefix="repeat_check_")
+    os.environ["REPLICATE_BASE_URL"] = SERVER.backend.base_url
+    os.environ.setdefault("REPLICATE_API_TOKEN", "fake-token")
+    os.environ["RESULT_CACHE_DIR"] = os.path.join(scratch, "results")
+    os.environ["DESCRIPTOR_STORE_PATH"] = os.path.join(scratch, "descriptors.json")
+    os.environ["BLOB_STORE_DIR"] = os.path.join(scratch, "blobs")
+    os.environ["GALLERY_PATH"] = os.path.join(scratch, "gallery.sqlite3")
+
+    ok = True
+    for number, analysis in enumerate(args.modes):
+        first, second = generate_twice(make_photo(args.seed * 100 + number), analysis, args.speed)
+        passed = first > 0 and second == 0
+        ok = ok and passed
+        print(f"{analysis + '/medieval':>16}  first click {first} prediction(s), second {second}  {'ok' if passed else 'FAILED'}")
+    SERVER.shutdown()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Benchmark a cold start of the app: time to the upload form, and memory
+
+Run from the repository root:
+
+    python -m benchmarks.startup_bench [--runs 5]
+
+Each run starts a fresh Python process that renders app.py once through
+Streamlit's AppTest, with FAST_START=1 (the default) and FAST_START=0 (the
+original layout). It reports the time from process start until the upload
+form is drawn, the whole first run of the script, peak RSS, and which heavy
+libraries had been imported by the time the form appeared. The app points at
+an unreachable Replicate and scratch stores, so nothing leaves the machine;
+AppTest doesn't fetch the demo video, so a browser sees a bigger gap.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY = ("replicate", "httpx", "numpy", "PIL")
+
+
+def child():
+    """Render the app once and print what happened as JSON"""
+    started = float(os.environ["STARTUP_BENCH_T0"])
+    import resource
+
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    seen = {}
+    file_uploader = st.file_uploader
+
+    def first_widget(*args, **kwargs):
+        if "form" not in seen:
+            seen["form"] = time.time() - started
+            seen["loaded"] = [name for name in HEAVY if name in sys.modules]
+        return file_uploader(*args, **kwargs)
+
+    st.file_uploader = first_widget
+    at = AppTest.from_file(os.path.abspath("app.py"), default_timeout=60)
+    at.run()
+    print(json.dumps({
+        "form": seen.get("form"),
+        "total": time.time() - started,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "loaded": seen.get("loaded", []),
+        "errors": [str(e.value) for e in at.exception],
+    }))
+
+
+def run_once(fast_start, scratch):
+    env = dict(
+        os.environ,
+        FAST_START=fast_start,
+        REPLICATE_API_TOKEN="startup-bench",
+        REPLICATE_BASE_URL="http://127.0.0.1:9",
+        DESCRIPTOR_STORE_PATH=os.path.join(scratch, "descriptors.json"),
+        RESULT_CACHE_DIR=os.path.join(scratch, "results"),
+        BLOB_STORE_DIR=os.path.join(scratch, "blobs"),
+        GALLERY_PATH=os.path.join(scratch, "gallery.sqlite3"),
+        STARTUP_BENCH_T0=repr(time.time()),
+    )
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup_bench", "--child"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per mode")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    print(f"{'FAST_START':>10}  {'form ms':>8}  {'script ms':>9}  {'RSS MB':>7}  loaded before the form")
+    with tempfile.TemporaryDirectory() as scratch:
+        for fast_start in ("0", "1"):
+            results = [run_once(fast_start, scratch) for _ in range(args.runs)]
+            for result in results:
+                if result["errors"]:
+                    print(f"FAST_START={fast_start}: {result['errors'][0]}", file=sys.stderr)
+            form = statistics.median(result["form"] for result in results) * 1000
+            total = statistics.median(result["total"] for result in results) * 1000
+            rss = statistics.median(result["rss_mb"] for result in results)
+            loaded = ", ".join(results[-1]["loaded"]) or "-"
+            print(f"{fast_start:>10}  {form:>8.0f}  {total:>9.0f}  {rss:>7.1f}  {loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark painting several portrait variants at once against painting one
+
+    python -m benchmarks.variants_bench --variants 4 --rounds 5 --speed 0.1
+
+Starts benchmarks.fake_replicate in-process, then for each round paints one
+medieval portrait, then --variants of them through
+pipeline.start_medieval_variants(). It reports the median wall-clock time
+for each, and for the batch the time until the first variant arrived. It
+also reports how many variants an early pick (keeping the first to finish)
+canceled before they were paid for. Every round uses a fresh photo so the
+result cache never answers.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+from benchmarks.fake_replicate import make_server
+from benchmarks.load_test import make_photo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--variants", type=int, default=4, help="portraits per batch (default: 4)")
+    parser.add_argument("--rounds", type=int, default=5, help="photos to paint (default: 5)")
+    parser.add_argument("--speed", type=float, default=0.1, help="fake model latency multiplier (default: 0.1)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = make_server(speed=args.speed, seed=args.seed, models={"nano-banana": {"error_rate": 0}})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # pipeline reads these at import time, so set them first
+    scratch = tempfile.mkdtemp(prefix="variants_bench_")
+    os.environ["REPLICATE_BASE_URL"] = server.backend.base_url
+    os.environ.setdefault("REPLICATE_API_TOKEN", "fake-token")
+    os.environ["RESULT_CACHE_DIR"] = os.path.join(scratch, "results")
+    os.environ["DESCRIPTOR_STORE_PATH"] = os.path.join(scratch, "descriptors.json")
+    os.environ["BLOB_STORE_DIR"] = os.path.join(scratch, "blobs")
+    import pipeline
+    from image_prep import PreparedUpload
+
+    print(f"Fake Replicate at {server.backend.base_url} (speed x{args.speed}), "
+          f"VARIANT_CONCURRENCY={pipeline.VARIANT_CONCURRENCY}, "
+          f"nano-banana concurrency {pipeline.MODEL_CONCURRENCY[pipeline.NANO_BANANA_MODEL]}", file=sys.stderr)
+
+    single, batch_all, batch_first = [], [], []
+    for round_number in range(args.rounds):
+        upload = PreparedUpload.from_file(BytesIO(make_photo(args.seed * 1000 + round_number)))
+        title = f"Sir Bench the {round_number}th of the Fake Server"
+
+        started = time.perf_counter()
+        pipeline.create_medieval_image_transformation(upload, f"stands **{title}**, noble", "Bench")
+        single.append(time.perf_counter() - started)
+
+        batch = pipeline.start_medieval_variants(upload, title, args.variants)
+        while batch.pending():
+            batch.wait()
+        batch_all.append(max(batch.seconds(index) for index in range(len(batch))))
+        batch_first.append(min(batch.seconds(index) for index in range(len(batch))))
+
+        # Keep whichever finishes first and cancel the rest
+        batch = pipeline.start_medieval_variants(upload, title, args.variants)
+        pipeline.pick_variant(batch, batch.wait()[0])
+
+    time.sleep(1)  # let the last cancellations reach the server
+    canceled = sum(1 for prediction in server.backend.predictions.values() if prediction["status"] == "canceled")
+
+    print(f"{'':>24}  {'median s':>8}  {'max s':>7}")
+    print(f"{'one portrait':>24}  {statistics.median(single):>8.2f}  {max(single):>7.2f}")
+    print(f"{f'{args.variants} variants, all':>24}  {statistics.median(batch_all):>8.2f}  {max(batch_all):>7.2f}")
+    print(f"{f'{args.variants} variants, one by one':>24}  {args.variants * statistics.median(single):>8.2f}  {'(est.)':>7}")
+    print(f"{f'{args.variants} variants, first':>24}  {statistics.median(batch_first):>8.2f}  {max(batch_first):>7.2f}")
+    print(f"Early picks canceled {canceled} of {args.rounds * (args.variants - 1)} other variants before they finished")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark keep-alive warm-up against a fake Replicate whose models boot cold
+
+    python -m benchmarks.warmup_bench --visits 4 --speed 0.05
+
+Starts benchmarks.fake_replicate in-process with LLaVA and nano-banana set to
+scale to zero after --idle-timeout seconds and take --cold-boot seconds to
+boot again (all times are in model seconds, multiplied by --speed). Visitors
+arrive one at a time, each after a quiet spell longer than the idle timeout,
+and make an AI-analysed medieval portrait. This runs twice: without warm-up,
+then with pipeline.start_warmup() keeping the models warm (the whole day
+counts as opening hours). For each run it reports visitor latency, how many
+calls found their model cold, the cold boots the fake paid, and the keep-alive
+predictions sent (what the schedule costs). It ends with cold and warm call
+times per model as the app records them (model_call_seconds).
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+import metrics
+from benchmarks.fake_replicate import make_server
+from benchmarks.load_test import make_photo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--visits", type=int, default=4, help="visitors per run (default: 4)")
+    parser.add_argument("--speed", type=float, default=0.05, help="fake model time multiplier (default: 0.05)")
+    parser.add_argument("--cold-boot", type=float, default=60, help="model seconds LLaVA and nano-banana take to boot (default: 60)")
+    parser.add_argument("--idle-timeout", type=float, default=120, help="model seconds idle before they scale to zero (default: 120)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    cold = {"cold_boot": args.cold_boot, "idle_timeout": args.idle_timeout, "error_rate": 0}
+    server = make_server(speed=args.speed, seed=args.seed, models={"llava": cold, "nano-banana": cold, "llama": {"error_rate": 0}})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    idle = args.idle_timeout * args.speed
+
+    # pipeline reads these at import time, so set them first
+    scratch = tempfile.mkdtemp(prefix="warmup_bench_")
+    os.environ["REPLICATE_BASE_URL"] = server.backend.base_url
+    os.environ.setdefault("REPLICATE_API_TOKEN", "fake-token")
+    os.environ["RESULT_CACHE_DIR"] = os.path.join(scratch, "results")
+    os.environ["DESCRIPTOR_STORE_PATH"] = os.path.join(scratch, "descriptors.json")
+    os.environ["BLOB_STORE_DIR"] = os.path.join(scratch, "blobs")
+    os.environ["GALLERY_PATH"] = os.path.join(scratch, "gallery.sqlite3")
+    os.environ["WARMUP_MODELS"] = "llava,nano-banana"
+    os.environ["WARMUP_HOURS"] = "0-24"
+    os.environ["WARMUP_INTERVAL"] = repr(idle / 2)
+    os.environ["WARMUP_COLD_AFTER"] = repr(idle)
+    os.environ["WARMUP_CHECK_EVERY"] = repr(min(1.0, idle / 10))
+    import pipeline
+    from image_prep import PreparedUpload
+
+    print(f"Fake Replicate at {server.backend.base_url} (speed x{args.speed}): cold boot {args.cold_boot * args.speed:.1f}s "
+          f"after {idle:.1f}s idle; visitors {1.5 * idle:.1f}s apart", file=sys.stderr)
+
+    warmup = pipeline.get_warmup_scheduler()
+    runs = []
+    for name, warm_up in (("no warm-up", False), ("warm-up", True)):
+        before = totals(warmup.stats()["models"], server.backend.cold_starts)
+        if warm_up:
+            pipeline.start_warmup()
+        timings = []
+        for visit in range(args.visits):
+            time.sleep(1.5 * idle)  # long enough for every model to scale down, unless kept warm
+            upload = PreparedUpload.from_file(BytesIO(make_photo(args.seed * 1000 + len(runs) * 100 + visit)))
+            result = pipeline.generate_portrait(upload, f"Visitor {visit}", analysis="ai", style="medieval")
+            if result["errors"]:
+                print(f"{name}, visit {visit}: {result['errors']}", file=sys.stderr)
+            timings.append(result["timings"])
+        if warm_up:
+            warmup.stop()
+        after = totals(warmup.stats()["models"], server.backend.cold_starts)
+        runs.append((name, timings, {key: after[key] - before[key] for key in after}))
+
+    print(f"{'':>12}  {'analysis p50':>12}  {'portrait p50':>12}  {'total p50':>9}  {'cold calls':>10}  "
+          f"{'cold boots':>10}  {'keep-alives':>11}  {'keep-alive s':>12}")
+    for name, timings, counts in runs:
+        print(f"{name:>12}  {median(timings, 'analysis'):>12.2f}  {median(timings, 'portrait'):>12.2f}  "
+              f"{median(timings, 'total'):>9.2f}  {counts['cold']:>4} of {counts['cold'] + counts['warm']:<3}  "
+              f"{counts['boots']:>10}  {counts['pings']:>11}  {counts['ping_seconds']:>12.1f}")
+
+    print("\nModel call time (model_call_seconds):")
+    for labels, count, (p50, p95, _) in metrics.METRICS.percentiles("model_call_seconds"):
+        print(f"  {labels['model']:<32} {labels['warmth']:>4}  p50 {p50:.2f}s  p95 {p95:.2f}s  ({count} calls)")
+
+
+def totals(models, cold_starts):
+    return {
+        "cold": sum(model["cold_calls"] for model in models.values()),
+        "warm": sum(model["warm_calls"] for model in models.values()),
+        "pings": sum(model["pings"] for model in models.values()),
+        "ping_seconds": sum(model["ping_seconds"] for model in models.values()),
+        "boots": sum(cold_starts.values()),
+    }
+
+
+def median(timings, stage):
+    return statistics.median(timing[stage] for timing in timings if stage in timing)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+# name -> (format, longest side or None, quality); made on first request from the original
+VARIANTS = {
+    "thumb": ("JPEG", 600, 80),
+    "small": ("JPEG", 1280, 80),
+    "webp": ("WEBP", None, 80),
+}
+EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+
+
+class BlobStore:
+    """Content-addressed store for generated images on local disk
+
+    Each image is kept once under the SHA-256 of its bytes, so the same portrait
+    produced twice (or cached and re-shown) is one file. Variants (thumbnail,
+    smaller JPEG, WebP) are derived from the original the first time they are
+    asked for and kept next to it. When the store grows past max_bytes the
+    least recently used images and their variants are removed.
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes = {}  # digest -> bytes on disk including variants
+        self._used = {}  # digest -> last access
+        self._total_bytes = 0
+        self._scan()
+
+    def put(self, data, ext="jpg"):
+        """Store bytes and return their digest"""
+        return self.put_stream(BytesIO(data), ext)
+
+    def put_stream(self, stream, ext="jpg", chunk_size=256 * 1024):
+        """Copy a file-like object into the store while hashing it; returns the digest"""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f".{os.getpid()}.{threading.get_ident()}.tmp")
+        digest = hashlib.sha256()
+        with open(tmp_path, "wb") as f:
+            while chunk := stream.read(chunk_size):
+                digest.update(chunk)
+                f.write(chunk)
+        digest = digest.hexdigest()
+        path = self._path(digest, None, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        self._touch(digest)
+        return digest
+
+    def path(self, digest, variant=None):
+        """Path of the original (or a variant, made if missing); None if digest isn't stored"""
+        original = self._find_original(digest)
+        if original is None:
+            return None
+        try:
+            # mtime carries the LRU order across restarts
+            os.utime(original)
+        except OSError:
+            pass
+        self._touch(digest)
+        if variant is None:
+            return original
+        image_format, max_side, quality = VARIANTS[variant]
+        path = self._path(digest, variant, EXTENSIONS[image_format])
+        if not os.path.exists(path):
+            self._make_variant(original, path, image_format, max_side, quality)
+            self._touch(digest)
+        return path
+
+    def relpath(self, digest, variant=None):
+        """path() relative to the store's directory, e.g. for building a URL"""
+        path = self.path(digest, variant)
+        return os.path.relpath(path, self.directory) if path else None
+
+    def read(self, digest, variant=None):
+        path = self.path(digest, variant)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def __contains__(self, digest):
+        return self._find_original(digest) is not None
+
+    def stats(self):
+        with self._lock:
+            return {"images": len(self._sizes), "bytes": self._total_bytes}
+
+    def _path(self, digest, variant, ext):
+        name = f"{digest}.{variant}.{ext}" if variant else f"{digest}.{ext}"
+        return os.path.join(self.directory, digest[:2], name)
+
+    def _find_original(self, digest):
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            return None
+        for ext in EXTENSIONS.values():
+            path = self._path(digest, None, ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _make_variant(self, original, path, image_format, max_side, quality):
+        from PIL import Image
+
+        with Image.open(original) as image:
+            image = image.convert("RGB")
+            if max_side and max(image.size) > max_side:
+                image.thumbnail((max_side, max_side), Image.LANCZOS)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            image.save(tmp_path, format=image_format, quality=quality, optimize=True)
+        os.replace(tmp_path, path)
+
+    def _touch(self, digest):
+        shard = os.path.join(self.directory, digest[:2])
+        size = sum(
+            os.path.getsize(os.path.join(shard, name))
+            for name in os.listdir(shard) if name.startswith(digest) and not name.endswith(".tmp")
+        )
+        with self._lock:
+            self._total_bytes += size - self._sizes.get(digest, 0)
+            self._sizes[digest] = size
+            self._used[digest] = time.time()
+            self._evict()
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        for digest, _ in sorted(self._used.items(), key=lambda item: item[1]):
+            # Keep the newest image even if it alone is over budget
+            if self._total_bytes <= self.max_bytes or len(self._sizes) <= 1:
+                break
+            shard = os.path.join(self.directory, digest[:2])
+            try:
+                for name in os.listdir(shard):
+                    if name.startswith(digest):
+                        os.remove(os.path.join(shard, name))
+            except OSError as e:
+                logger.warning("Could not evict blob %s: %s", digest, e)
+                continue
+            self._total_bytes -= self._sizes.pop(digest)
+            del self._used[digest]
+
+    def _scan(self):
+        if not os.path.isdir(self.directory):
+            return
+        for shard in os.listdir(self.directory):
+            shard_path = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_path):
+                continue
+            for name in os.listdir(shard_path):
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(shard_path, name))
+                except OSError:
+                    continue
+                digest = name.split(".", 1)[0]
+                self._sizes[digest] = self._sizes.get(digest, 0) + stat.st_size
+                self._used[digest] = max(self._used.get(digest, 0), stat.st_mtime)
+                self._total_bytes += stat.st_size
+        with self._lock:
+            self._evict()
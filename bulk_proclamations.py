@@ -0,0 +1,54 @@
+"""Pre-generate unique template proclamations as JSONL, e.g. for giveaway cards
+
+    python bulk_proclamations.py --count 50000 --seed 7 --out giveaway.jsonl [--names names.txt]
+
+Draws from the descriptor pool saved by the app (DESCRIPTOR_STORE_PATH) together
+with the built-in examples, which on their own make over 250,000 combinations;
+no model is called. Every line holds
+one proclamation's parts and its "text". The same pool and seed give the same
+file, and no two lines share a title/location/skill/trait/feat combination
+unless --allow-repeats is given.
+"""
+import argparse
+import sys
+import time
+
+import pipeline
+import proclamations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, required=True, help="proclamations to write")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="-", help="output file (default: stdout)")
+    parser.add_argument("--names", help="text file with one name per line, used in turn")
+    parser.add_argument("--allow-repeats", action="store_true", help="don't require unique combinations")
+    args = parser.parse_args(argv)
+
+    names = None
+    if args.names:
+        with open(args.names) as f:
+            names = [line.strip() for line in f if line.strip()]
+
+    # The saved pool as it stands, plus the examples; a bulk run shouldn't wait on (or pay for) a refresh
+    store = pipeline.get_descriptor_store()
+    descriptors = {part: list(dict.fromkeys([*store.pool[part], *store.defaults[part]])) for part in proclamations.PARTS}
+    print(f"Descriptor pool makes {proclamations.combination_count(descriptors):,} unique proclamations", file=sys.stderr)
+    try:
+        records = proclamations.generate_bulk(descriptors, args.count, seed=args.seed, names=names, unique=not args.allow_repeats)
+    except ValueError as e:
+        parser.error(f"{e}; pass --allow-repeats to permit repeated combinations")
+    started = time.perf_counter()
+    if args.out == "-":
+        written = proclamations.write_jsonl(records, sys.stdout)
+    else:
+        with open(args.out, "w", encoding="utf-8") as f:
+            written = proclamations.write_jsonl(records, f)
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {written:,} proclamations in {elapsed:.2f}s ({written / max(elapsed, 1e-9):,.0f}/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class DescriptorStore:
+    """Stale-while-revalidate store for the AI-generated descriptor pool
+
+    get() always returns the last good pool straight away. When the pool is older
+    than ttl, a background thread asks generate() for a new one. Pools are persisted
+    to a JSON file so new processes start warm, and a lock file next to it keeps
+    several worker processes from regenerating at the same time.
+    """
+
+    def __init__(self, path, generate, defaults, ttl=3600, history_size=24, lock_timeout=300, retry_interval=60):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.generate = generate
+        self.defaults = defaults
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.retry_interval = retry_interval
+        self.history = deque(maxlen=history_size)
+        self.pool = dict(defaults)
+        self.generated_at = 0
+        self.last_error = None
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._retry_at = 0
+        self._load()
+
+    def get(self):
+        """Return the current pool, starting a background refresh if it is stale"""
+        if self.is_stale():
+            # Another process may have refreshed the file since we last read it
+            self._load()
+        if self.is_stale() and time.time() >= self._retry_at:
+            self.refresh_async()
+        return self.pool
+
+    def is_stale(self):
+        return time.time() - self.generated_at > self.ttl
+
+    def refresh_async(self):
+        """Start a refresh thread unless one is already running; returns the thread or None"""
+        with self._lock:
+            if self._refreshing:
+                return None
+            self._refreshing = True
+            # Don't hammer the LLM (or the lock) if this attempt fails or loses the race
+            self._retry_at = time.time() + self.retry_interval
+        thread = threading.Thread(target=self._refresh, name="descriptor-refresh", daemon=True)
+        thread.start()
+        return thread
+
+    def _refresh(self):
+        try:
+            if not self._acquire_file_lock():
+                return
+            try:
+                pool = self.generate()
+                self._accept(pool)
+            finally:
+                self._release_file_lock()
+        except Exception as e:
+            self.last_error = e
+            logger.warning("Descriptor refresh failed: %s", e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _accept(self, pool):
+        # Lists that came back as the defaults mean that call failed, so keep the
+        # previous good list for those instead of regressing to the examples
+        merged = {}
+        for key, default in self.defaults.items():
+            items = pool.get(key) or default
+            merged[key] = self.pool.get(key, default) if items == default else items
+        if self.generated_at:
+            self.history.append({'generated_at': self.generated_at, 'pool': self.pool})
+        self.pool = merged
+        self.generated_at = time.time()
+        self.last_error = None
+        self._save()
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self._loaded_mtime:
+                return
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read descriptor store %s: %s", self.path, e)
+            return
+        pool = data.get('pool') or {}
+        self.pool = {key: pool.get(key) or default for key, default in self.defaults.items()}
+        self.generated_at = data.get('generated_at', 0)
+        self.history = deque(data.get('history', []), maxlen=self.history.maxlen)
+        self._loaded_mtime = mtime
+
+    def _save(self):
+        data = {
+            'generated_at': self.generated_at,
+            'pool': self.pool,
+            'history': list(self.history),
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self._loaded_mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            logger.warning("Could not persist descriptor store %s: %s", self.path, e)
+
+    def _acquire_file_lock(self):
+        directory = os.path.dirname(self.lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                abandoned = time.time() - os.path.getmtime(self.lock_path) > self.lock_timeout
+            except FileNotFoundError:
+                abandoned = True
+            if not abandoned:
+                return False
+            # The process holding the lock died mid-refresh; take it over
+            self._release_file_lock()
+            return self._acquire_file_lock()
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return True
+
+    def _release_file_lock(self):
+        try:
+            os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
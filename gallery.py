@@ -0,0 +1,131 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS portraits (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    session TEXT,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    description TEXT NOT NULL,
+    ai_description TEXT,
+    image TEXT,
+    upload TEXT,
+    model TEXT,
+    prompt TEXT,
+    options TEXT NOT NULL,
+    timings TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS portraits_created ON portraits (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS portraits_session ON portraits (session, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS portraits_name ON portraits (name_key, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS portraits_image ON portraits (image);
+"""
+
+COLUMNS = ("id", "created_at", "session", "name", "description", "ai_description", "image", "upload", "model", "prompt", "options", "timings")
+
+
+class Gallery:
+    """Every generated proclamation and portrait, kept in a local SQLite file
+
+    Rows hold the text, the options and prompt that produced it, per-stage
+    timings, and digests of the upload and of the portrait in the blob store, so
+    showing a past portrait again is a database and disk read. Lookups by
+    session, name (case-insensitive) and time are indexed, and page() walks
+    them newest first with keyset pagination, so deep pages cost the same as
+    the first.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def add(self, name, description, options, ai_description=None, image=None, upload=None,
+            model=None, prompt=None, timings=None, session=None, created_at=None):
+        """Record one result; returns its id"""
+        with self._connect() as db:
+            cursor = db.execute(
+                "INSERT INTO portraits (created_at, session, name, name_key, description, ai_description,"
+                " image, upload, model, prompt, options, timings) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    created_at or time.time(), session, name, name.strip().lower(), description, ai_description,
+                    image, upload, model, prompt, json.dumps(options, sort_keys=True), json.dumps(timings or {}),
+                ),
+            )
+            return cursor.lastrowid
+
+    def get(self, portrait_id):
+        rows = self._query("WHERE id = ?", (portrait_id,), 1)
+        return rows[0] if rows else None
+
+    def page(self, limit=12, before=None, session=None, name=None):
+        """Up to limit rows, newest first, optionally for one session or name
+
+        before is the (created_at, id) cursor of the last row of the previous
+        page, as returned by cursor().
+        """
+        clauses, params = self._filters(session, name)
+        if before is not None:
+            clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params += [before[0], before[0], before[1]]
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        return self._query(where, params, limit)
+
+    def count(self, session=None, name=None):
+        clauses, params = self._filters(session, name)
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        with self._connect() as db:
+            return db.execute(f"SELECT COUNT(*) FROM portraits {where}", params).fetchone()[0]
+
+    def hourly_counts(self, since):
+        """{local hour of day: entries} for entries made since the given epoch time"""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT CAST(strftime('%H', created_at, 'unixepoch', 'localtime') AS INTEGER), COUNT(*)"
+                " FROM portraits WHERE created_at >= ? GROUP BY 1",
+                (since,),
+            ).fetchall()
+        return dict(rows)
+
+    @staticmethod
+    def cursor(row):
+        return (row["created_at"], row["id"])
+
+    def _filters(self, session, name):
+        clauses, params = [], []
+        if session is not None:
+            clauses.append("session = ?")
+            params.append(session)
+        if name:
+            clauses.append("name_key = ?")
+            params.append(name.strip().lower())
+        return clauses, params
+
+    def _query(self, where, params, limit):
+        with self._connect() as db:
+            rows = db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM portraits {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [
+            {**dict(zip(COLUMNS, row)), "options": json.loads(row[10]), "timings": json.loads(row[11])}
+            for row in rows
+        ]
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections can't be shared between threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
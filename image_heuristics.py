@@ -0,0 +1,86 @@
+import numpy as np
+from PIL import Image
+
+import metrics
+
+ANALYSIS_SIDE = 128  # statistics are taken from a thumbnail this size
+
+# descriptor -> the short description handed on in place of LLaVA's, worded so
+# proclamations.descriptor_for() picks the same descriptor back out of it
+DESCRIPTIONS = {
+    "the Wild Wanderer": "person outdoors in nature",
+    "the Contemplative": "serious person in dim light",
+    "the Eternally Cheerful": "happy person in bright warm light",
+}
+
+
+class LocalGuess:
+    """What the photo's statistics suggest, and how sure they are
+
+    confidence is the winning descriptor's score minus the runner-up's, so two
+    plausible answers cancel out and the photo goes to LLaVA instead.
+    """
+
+    def __init__(self, descriptor, confidence, scores, features):
+        self.descriptor = descriptor
+        self.confidence = confidence
+        self.scores = scores
+        self.features = features
+
+    @property
+    def description(self):
+        return DESCRIPTIONS[self.descriptor]
+
+
+def ramp(value, low, high):
+    """0 at low, 1 at high, linear in between (high may be below low)"""
+    return float(np.clip((value - low) / (high - low), 0.0, 1.0))
+
+
+def image_features(image):
+    """Colour, brightness and composition statistics of image, each roughly in 0..1"""
+    small = image.convert("RGB")
+    small.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE), Image.BILINEAR)
+    rgb = np.asarray(small, dtype=np.float32) / 255
+    hue, saturation, value = np.moveaxis(np.asarray(small.convert("HSV"), dtype=np.float32) / 255, -1, 0)
+    red, green, blue = np.moveaxis(rgb, -1, 0)
+    height, width = value.shape
+
+    vegetation = (hue > 0.17) & (hue < 0.45) & (saturation > 0.2) & (value > 0.15)
+    bluish = (hue > 0.5) & (hue < 0.72) & (saturation > 0.15) & (value > 0.35)
+    overcast = (saturation < 0.12) & (value > 0.8)
+    # Sky sits above the subject; blue or white all the way down is a backdrop or a wall
+    top, bottom = slice(0, height // 3), slice(height - height // 3, height)
+    sky = max(0.0, bluish[top].mean() - bluish[bottom].mean()) + 0.5 * max(0.0, overcast[top].mean() - overcast[bottom].mean())
+    # A common RGB skin-tone rule, over the middle of the frame where a face usually is
+    centre = (slice(height // 5, height - height // 5), slice(width // 5, width - width // 5))
+    r, g, b = red[centre], green[centre], blue[centre]
+    skin = (r > 0.37) & (g > 0.16) & (b > 0.08) & (r > g) & (r > b) & (r - g > 0.06) & (np.ptp(rgb[centre], axis=-1) > 0.06)
+
+    return {
+        "brightness": float(value.mean()),
+        "saturation": float(saturation.mean()),
+        "warmth": float((red - blue).mean()),
+        "vegetation": float(vegetation.mean()),
+        "sky": float(sky),
+        "skin": float(skin.mean()),
+    }
+
+
+def guess_descriptor(image):
+    """Pick a descriptor from image statistics alone; takes a few milliseconds"""
+    with metrics.span("heuristics") as span:
+        features = image_features(image)
+        scores = {
+            "the Wild Wanderer": max(ramp(features["vegetation"], 0.1, 0.35), ramp(features["sky"], 0.15, 0.5)),
+            "the Contemplative": max(ramp(features["brightness"], 0.4, 0.2), ramp(features["saturation"], 0.15, 0.05)),
+            "the Eternally Cheerful": min(
+                ramp(features["brightness"], 0.45, 0.65),
+                ramp(features["warmth"], 0.02, 0.12),
+                ramp(features["skin"], 0.05, 0.25),
+            ),
+        }
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        guess = LocalGuess(ranked[0], scores[ranked[0]] - scores[ranked[1]], scores, features)
+        span.set(descriptor=guess.descriptor, confidence=round(guess.confidence, 2))
+    return guess
@@ -0,0 +1,92 @@
+import base64
+import hashlib
+import threading
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+import metrics
+
+
+class PreparedUpload:
+    """An uploaded photo, normalized once and encoded once per target size
+
+    The upload is rotated according to its EXIF orientation and converted to RGB
+    (transparent images are flattened onto white so they can be saved as JPEG).
+    jpeg() and data_uri() downscale to fit a max_side x max_side box and keep the
+    result, so every model call that asks for the same size shares one encoding.
+    bytes_sent tallies what has gone over the wire on this upload's behalf.
+    """
+
+    def __init__(self, image, quality=90):
+        self.image = normalize_image(image)
+        self.quality = quality
+        self._jpegs = {}
+        self._data_uris = {}
+        self._digests = {}
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, fileobj, quality=90):
+        return cls(Image.open(fileobj), quality=quality)
+
+    @property
+    def size(self):
+        return self.image.size
+
+    def resized(self, max_side):
+        """Return the image scaled down to fit max_side (never scaled up)"""
+        if max_side is None or max(self.image.size) <= max_side:
+            return self.image
+        image = self.image.copy()
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        return image
+
+    def jpeg(self, max_side=None):
+        """JPEG bytes of the image at max_side, encoded on first use"""
+        with self._lock:
+            if max_side not in self._jpegs:
+                with metrics.span("jpeg_encode") as span:
+                    buffer = BytesIO()
+                    self.resized(max_side).save(buffer, format='JPEG', quality=self.quality, optimize=True)
+                    self._jpegs[max_side] = buffer.getvalue()
+                    span.set(max_side=max_side, bytes=len(self._jpegs[max_side]))
+            return self._jpegs[max_side]
+
+    def digest(self, max_side=None):
+        """SHA-256 hex digest of jpeg(max_side), identifying this upload at that size"""
+        image_bytes = self.jpeg(max_side)
+        with self._lock:
+            if max_side not in self._digests:
+                self._digests[max_side] = hashlib.sha256(image_bytes).hexdigest()
+            return self._digests[max_side]
+
+    def note_sent(self, size):
+        """Count size bytes sent to a model or staging host for this upload"""
+        with self._lock:
+            self.bytes_sent += size
+
+    def data_uri(self, max_side=None):
+        """data:image/jpeg URI of jpeg(max_side), built on first use"""
+        image_bytes = self.jpeg(max_side)
+        with self._lock:
+            if max_side not in self._data_uris:
+                with metrics.span("data_uri"):
+                    image_b64 = base64.b64encode(image_bytes).decode()
+                    self._data_uris[max_side] = f"data:image/jpeg;base64,{image_b64}"
+            return self._data_uris[max_side]
+
+
+def normalize_image(image):
+    """Apply EXIF orientation and convert to an RGB image that JPEG can hold"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode == 'P' and 'transparency' in image.info:
+        image = image.convert('RGBA')
+    if image.mode in ('RGBA', 'LA', 'PA'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from io import BytesIO
+
+import metrics
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+STAGING_MODES = ("replicate", "static", "inline")
+
+
+class InputStager:
+    """Puts each prepared upload where the models can fetch it, once, and hands out its URL
+
+    With mode "replicate" the JPEG goes up through Replicate's files API; with
+    "static" it is written to a BlobStore whose directory is served publicly
+    at base_url; "inline" stages nothing. Each upload is staged once per
+    process (concurrent callers share the upload) and the URL is reused by
+    every model, retry and session until shortly before it expires, so a
+    prediction request carries a short URL instead of the whole photo. If
+    staging fails, or the mode is "inline", ref() returns the data URI
+    instead, so a model call never fails because of staging.
+    """
+
+    def __init__(self, mode="replicate", client=None, store=None, base_url=None, ttl=23 * 3600, refresh_margin=3600):
+        if mode not in STAGING_MODES:
+            raise ValueError(f"Unknown input staging mode {mode!r}; expected one of {STAGING_MODES}")
+        if mode == "static" and not (store is not None and base_url):
+            logger.warning("Static input staging needs a store and a public base URL; sending images inline")
+            mode = "inline"
+        self.mode = mode
+        self.client = client
+        self.store = store
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self._staged = {}  # upload digest -> (url, expiry in epoch seconds)
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._counts = {"staged": 0, "reused": 0, "inline": 0, "failed": 0}
+
+    def ref(self, upload, max_side, fallback_side=None):
+        """URL of upload's JPEG at max_side, staged on first use; the data URI at fallback_side if that fails"""
+        if self.mode != "inline":
+            digest = upload.digest(max_side)
+            with self._lock:
+                url, expires = self._staged.get(digest, (None, 0))
+                fresh = url is not None and time.time() < expires - self.refresh_margin
+                if fresh:
+                    self._counts["reused"] += 1
+            if fresh:
+                return url
+            try:
+                return self._flight.do(digest, self._stage, upload, max_side, digest, label="staging")
+            except Exception as e:
+                logger.warning("Could not stage the input image (%s); sending it inline", e)
+                with self._lock:
+                    self._counts["failed"] += 1
+        with self._lock:
+            self._counts["inline"] += 1
+        return upload.data_uri(fallback_side or max_side)
+
+    def stats(self):
+        with self._lock:
+            return {"mode": self.mode, "files": len(self._staged), **self._counts}
+
+    def _stage(self, upload, max_side, digest):
+        image_bytes = upload.jpeg(max_side)
+        with metrics.span("stage_input", target=self.mode) as span:
+            if self.mode == "replicate":
+                url, expires = self._upload_to_replicate(image_bytes, digest)
+            else:
+                stored = self.store.put(image_bytes)
+                url, expires = f"{self.base_url}/{self.store.relpath(stored)}", time.time() + self.ttl
+            span.set(bytes=len(image_bytes))
+        metrics.observe("upload_bytes", len(image_bytes), target=self.mode)
+        metrics.count("bytes_sent_total", len(image_bytes), kind="staging")
+        upload.note_sent(len(image_bytes))
+        with self._lock:
+            self._staged[digest] = (url, expires)
+            self._counts["staged"] += 1
+        return url
+
+    def _upload_to_replicate(self, image_bytes, digest):
+        if self.client is None:
+            import replicate  # the API client is only loaded once there's something to send
+
+            self.client = replicate.default_client
+        file = self.client.files.create(
+            BytesIO(image_bytes), filename=f"{digest[:16]}.jpg", content_type="image/jpeg",
+            metadata={"sha256": digest}
+        )
+        expires = time.time() + self.ttl
+        if file.expires_at:
+            expires = min(expires, datetime.fromisoformat(file.expires_at.replace("Z", "+00:00")).timestamp())
+        return file.urls["get"], expires
@@ -0,0 +1,236 @@
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds: seconds for timings, bytes for anything named *_bytes
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 KB .. 256 MB
+
+
+class Histogram:
+    """Cumulative bucket counts for Prometheus plus recent samples for live percentiles"""
+
+    def __init__(self, buckets, recent=1024):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=recent)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, fraction):
+        ordered = sorted(self.recent)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Span:
+    """Timing for one stage; set() attaches fields that go out with the span's log record"""
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.fields = {}
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.error = None
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+
+class Metrics:
+    """Process-wide counters, histograms and timing spans
+
+    span() times a stage of the flow into the stage_seconds histogram, observe()
+    and count() record anything else (queue wait, upload and output sizes, cache
+    hits, retries), and gauge() registers a callback read at scrape time.
+    render() produces the Prometheus text format; serve() exposes it over HTTP.
+    """
+
+    def __init__(self, prefix="proclaim", recent_spans=200):
+        self.prefix = prefix
+        self._histograms = {}  # name -> {labels: Histogram}
+        self._counters = {}  # name -> {labels: value}
+        self._gauges = {}  # name -> (help, fn)
+        self._help = {}
+        self._lock = threading.Lock()
+        self.recent_spans = deque(maxlen=recent_spans)
+
+    def describe(self, name, help):
+        self._help[name] = help
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(SIZE_BUCKETS if name.endswith("_bytes") else TIME_BUCKETS)
+            series[key].observe(value)
+
+    def count(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def gauge(self, name, fn, help=""):
+        """Register fn() -> {labels dict as tuple of pairs: value}, read on every render"""
+        self._gauges[name] = (help, fn)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Time the with-block as stage name; failures are counted in stage_errors_total
+
+        Only Exceptions count as failures: Streamlit stops or reruns a script by
+        raising a BaseException through it, which is not the stage's fault.
+        """
+        span = Span(name, labels)
+        try:
+            yield span
+        except Exception as e:
+            span.error = type(e).__name__
+            self.count("stage_errors_total", stage=name, error=span.error, **labels)
+            raise
+        finally:
+            span.seconds = time.perf_counter() - span.started
+            self.observe("stage_seconds", span.seconds, stage=name, **labels)
+            self.recent_spans.append(span)
+            logger.debug(
+                "span %s %.3fs%s", name, span.seconds,
+                "".join(f" {k}={v}" for k, v in {**labels, **span.fields, "error": span.error}.items() if v is not None)
+            )
+
+    def total(self, name, **labels):
+        """Sum of counter name over every series carrying the given labels"""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(value for key, value in self._counters.get(name, {}).items() if wanted <= set(key))
+
+    def percentiles(self, name, fractions=(0.5, 0.95, 0.99)):
+        """[(labels dict, count, [percentile, ...]), ...] over each series' recent samples"""
+        with self._lock:
+            series = list(self._histograms.get(name, {}).items())
+            return [
+                (dict(key), histogram.count, [histogram.percentile(f) for f in fractions])
+                for key, histogram in sorted(series)
+            ]
+
+    def percentile(self, name, fraction, min_samples=1, **labels):
+        """fraction percentile of one series' recent samples, or None with fewer than min_samples"""
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+            if histogram is None or len(histogram.recent) < min_samples:
+                return None
+            return histogram.percentile(fraction)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f"{self.prefix}_{name}"
+                lines += self._header(name, full, "counter")
+                lines += [f"{full}{format_labels(key)} {value}" for key, value in sorted(series.items())]
+            for name, series in sorted(self._histograms.items()):
+                full = f"{self.prefix}_{name}"
+                lines += self._header(name, full, "histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{full}_bucket{format_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{full}_sum{format_labels(key)} {histogram.sum}")
+                    lines.append(f"{full}_count{format_labels(key)} {histogram.count}")
+        for name, (help, fn) in sorted(self._gauges.items()):
+            full = f"{self.prefix}_{name}"
+            try:
+                values = fn()
+            except Exception as e:
+                logger.warning("Gauge %s failed: %s", name, e)
+                continue
+            if help:
+                lines.append(f"# HELP {full} {help}")
+            lines.append(f"# TYPE {full} gauge")
+            lines += [f"{full}{format_labels(key)} {value}" for key, value in sorted(values.items())]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host="0.0.0.0", port=9464):
+        """Serve render() at /metrics from a daemon thread; returns the server"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
+
+    def _header(self, name, full, kind):
+        lines = [f"# HELP {full} {self._help[name]}"] if name in self._help else []
+        return lines + [f"# TYPE {full} {kind}"]
+
+
+def format_labels(key):
+    if not key:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in key)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+
+
+# One registry per process, so modules can record without passing it around
+METRICS = Metrics()
+METRICS.describe("stage_seconds", "Time spent in each stage of the proclamation flow")
+METRICS.describe("stage_errors_total", "Stages that raised, by exception type")
+METRICS.describe("model_queue_seconds", "Time model calls waited in the scheduler queue")
+METRICS.describe("model_run_seconds", "Time model calls spent running once started")
+METRICS.describe("upload_bytes", "Size of each input photo staged for the models (once per photo)")
+METRICS.describe("request_bytes", "Size of each prediction's input in the request body, per attempt")
+METRICS.describe("bytes_sent_total", "Bytes sent to Replicate or the staging host, by kind (staging or prediction)")
+METRICS.describe("generation_sent_bytes", "Bytes sent for one generation: staging plus each model call's input")
+METRICS.describe("output_bytes", "Size of generated images downloaded from each model")
+METRICS.describe("cache_requests_total", "Result cache lookups by model and outcome")
+METRICS.describe("retries_total", "Model calls retried after a transient failure, by model and error")
+METRICS.describe("single_flight_takeovers_total", "Collapsed calls that ran themselves because the call they waited on was interrupted")
+METRICS.describe("prediction_polls_total", "Status polls made for tracked predictions")
+METRICS.describe("circuit_rejections_total", "Model calls refused because the model's circuit breaker was open")
+METRICS.describe("hedges_total", "Duplicate requests sent because the first ran past the model's p95")
+METRICS.describe("first_token_seconds", "Time from starting a streamed model call to its first token")
+METRICS.describe("heuristic_requests_total", "Quick analyses answered from local image statistics (hit) or passed on to LLaVA")
+METRICS.describe("heuristic_seconds_saved_total", "Estimated LLaVA time avoided by quick analyses answered locally")
+METRICS.describe("portrait_variants_total", "Portrait variants started when several were asked for at once")
+METRICS.describe("portrait_variants_canceled_total", "Portrait variants stopped unfinished because another was picked first")
+METRICS.describe("model_call_seconds", "Successful model calls from start to output, by whether the model was cold or warm")
+METRICS.describe("model_setup_seconds", "Time Replicate took to start a prediction (queueing and any cold boot), by warmth")
+METRICS.describe("warmup_pings_total", "Keep-alive predictions sent, by outcome and why visitors were expected")
+METRICS.describe("warmup_ping_seconds", "Time keep-alive predictions took, which is roughly what keeping models warm costs")
+
+span = METRICS.span
+observe = METRICS.observe
+count = METRICS.count
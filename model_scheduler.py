@@ -0,0 +1,151 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    """Raised when the scheduler's queue is full and new work is turned away"""
+
+
+class ModelJob(Future):
+    """A scheduled model call; a Future that also knows its place in the queue"""
+
+    def __init__(self, scheduler, model, priority, seq, fn, args, kwargs):
+        super().__init__()
+        self.scheduler = scheduler
+        self.model = model
+        self.sort_key = (priority, seq)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
+
+    def queue_seconds(self):
+        """Time spent waiting for a slot (so far, if still queued)"""
+        return (self.started_at or time.monotonic()) - self.submitted_at
+
+    def run_seconds(self):
+        """Time spent running once started (None if it never started)"""
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def position(self):
+        """Number of queued jobs that will start before this one (0 once it's running)"""
+        return self.scheduler.position(self)
+
+
+class ModelScheduler:
+    """Process-wide scheduler for model calls
+
+    Each model has its own concurrency cap and max_running bounds all models
+    together. Work beyond the caps waits in a queue ordered by priority (lower
+    first) and then arrival, so cheap text and vision calls overtake image
+    generation. Once max_queued jobs are waiting, submit() raises QueueFullError
+    instead of letting the backlog grow. observer(job), if given, is called as each
+    job finishes, e.g. to record its queue wait and run time.
+    """
+
+    def __init__(self, limits, priorities=None, default_limit=2, default_priority=1, max_running=8, max_queued=32, observer=None):
+        self.limits = dict(limits)
+        self.priorities = dict(priorities or {})
+        self.default_limit = default_limit
+        self.default_priority = default_priority
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.observer = observer
+        self.rejected = 0
+        self._running = {}
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix="model")
+
+    def submit(self, model, fn, *args, priority=None, **kwargs):
+        """Queue fn(*args, **kwargs) as a call to model and return its ModelJob"""
+        if priority is None:
+            priority = self.priorities.get(model, self.default_priority)
+        with self._lock:
+            job = ModelJob(self, model, priority, next(self._seq), fn, args, kwargs)
+            if self._has_capacity(model):
+                self._start(job)
+            elif len(self._queue) >= self.max_queued:
+                self.rejected += 1
+                raise QueueFullError(f"too many requests are waiting ({len(self._queue)} queued); please try again shortly")
+            else:
+                heapq.heappush(self._queue, job)
+        return job
+
+    def position(self, job):
+        with self._lock:
+            if job not in self._queue:
+                return 0
+            return sum(1 for other in self._queue if other < job and self._competes(other, job))
+
+    def stats(self):
+        with self._lock:
+            queued = {}
+            for job in self._queue:
+                queued[job.model] = queued.get(job.model, 0) + 1
+            return {
+                'running': {model: count for model, count in self._running.items() if count},
+                'queued': queued,
+                'rejected': self.rejected,
+            }
+
+    def _competes(self, other, job):
+        # A job for another model only holds this one back through the global cap
+        return other.model == job.model or sum(self._running.values()) >= self.max_running
+
+    def _has_capacity(self, model):
+        return (
+            sum(self._running.values()) < self.max_running
+            and self._running.get(model, 0) < self.limits.get(model, self.default_limit)
+        )
+
+    def _start(self, job):
+        if not job.set_running_or_notify_cancel():
+            return
+        job.started_at = time.monotonic()
+        self._running[job.model] = self._running.get(job.model, 0) + 1
+        self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        try:
+            result = job.fn(*job.args, **job.kwargs)
+        except BaseException as e:
+            job.finished_at = time.monotonic()
+            job.set_exception(e)
+        else:
+            job.finished_at = time.monotonic()
+            job.set_result(result)
+        finally:
+            with self._lock:
+                self._running[job.model] -= 1
+                self._dispatch()
+        if self.observer is not None:
+            try:
+                self.observer(job)
+            except Exception:
+                pass
+
+    def _dispatch(self):
+        # Start the best queued jobs whose model (and the pool) now has room
+        waiting = []
+        while self._queue and sum(self._running.values()) < self.max_running:
+            job = heapq.heappop(self._queue)
+            if job.cancelled():
+                continue
+            if self._has_capacity(job.model):
+                self._start(job)
+            else:
+                waiting.append(job)
+        for job in waiting:
+            heapq.heappush(self._queue, job)
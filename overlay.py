@@ -0,0 +1,163 @@
+import os
+import re
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+# Tried in order; ImageFont.truetype also searches the system font directories.
+# OVERLAY_FONT / OVERLAY_TITLE_FONT point at a blackletter or old-style face if one is installed.
+BODY_FONTS = [
+    os.getenv("OVERLAY_FONT"),
+    "IMFellEnglish-Regular.ttf",
+    "EBGaramond-Regular.ttf",
+    "Georgia.ttf",
+    "DejaVuSerif.ttf",
+    "LiberationSerif-Regular.ttf",
+]
+TITLE_FONTS = [
+    os.getenv("OVERLAY_TITLE_FONT"),
+    "UnifrakturMaguntia-Book.ttf",
+    "EBGaramond-Bold.ttf",
+    "Georgia Bold.ttf",
+    "DejaVuSerif-Bold.ttf",
+    "LiberationSerif-Bold.ttf",
+]
+
+PARCHMENT = (238, 222, 182)
+PARCHMENT_SHADE = (206, 178, 126)
+INK = (62, 34, 14)
+GILT = (128, 86, 30)
+
+MAX_RENDER_SIDE = 2048  # Larger photos are scaled down first; the overlay doesn't need more pixels
+MAX_BODY_HEIGHT = 0.42  # Fraction of the image the proclamation scroll may cover
+
+# Drop emoji and other symbols the text fonts can't draw
+_UNDRAWABLE = re.compile(r"[^\u0000-\u024f\u2010-\u2027\u2030-\u205e]")
+
+
+@lru_cache(maxsize=64)
+def load_font(candidates, size):
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def clean_proclamation(description):
+    """Split a markdown proclamation into (heading, paragraphs) of plain drawable text"""
+    text = _UNDRAWABLE.sub("", description.replace("**", "").replace("*", ""))
+    paragraphs = [" ".join(block.split()) for block in re.split(r"\n\s*\n", text)]
+    paragraphs = [p for p in paragraphs if p]
+    heading = "Royal Proclamation"
+    if paragraphs and "PROCLAMATION" in paragraphs[0].upper():
+        heading = paragraphs.pop(0).title()
+    return heading, paragraphs
+
+
+def wrap_text(text, font, max_width):
+    lines, line = [], ""
+    for word in text.split():
+        candidate = f"{line} {word}".strip()
+        if not line or font.getlength(candidate) <= max_width:
+            line = candidate
+        else:
+            lines.append(line)
+            line = word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def layout_body(paragraphs, width, max_height, base_size):
+    """Pick the largest font size whose wrapped paragraphs fit in width x max_height"""
+    size = base_size
+    while True:
+        font = load_font(tuple(BODY_FONTS), size)
+        line_height = int(size * 1.3)
+        gap = line_height // 2
+        blocks = [wrap_text(p, font, width) for p in paragraphs]
+        height = sum(len(lines) for lines in blocks) * line_height + gap * max(len(blocks) - 1, 0)
+        if height <= max_height or size <= 10:
+            return font, blocks, line_height, gap, height
+        size = max(10, int(size * 0.9))
+
+
+def draw_scroll(draw, box, scale):
+    """Draw a parchment scroll panel with rolled ends into box (left, top, right, bottom)"""
+    left, top, right, bottom = box
+    roll = max(6, int(min(14 * scale, (bottom - top) * 0.25)))
+    border = max(2, int(3 * scale))
+    draw.rounded_rectangle(box, radius=roll, fill=PARCHMENT + (236,), outline=GILT + (255,), width=border)
+    inset = border * 3
+    draw.rounded_rectangle(
+        (left + inset, top + inset, right - inset, bottom - inset),
+        radius=max(roll - inset, 1), outline=PARCHMENT_SHADE + (255,), width=max(1, border // 2)
+    )
+    # Rolled ends
+    for x in (left, right):
+        draw.rounded_rectangle(
+            (x - roll, top - roll // 2, x + roll, bottom + roll // 2),
+            radius=roll, fill=PARCHMENT_SHADE + (255,), outline=GILT + (255,), width=border
+        )
+
+
+def render_overlay_image(image, description):
+    """Draw the proclamation onto parchment scrolls over the photo; returns a new RGB image"""
+    base = image.convert("RGB")
+    if max(base.size) > MAX_RENDER_SIDE:
+        base = base.copy()
+        base.thumbnail((MAX_RENDER_SIDE, MAX_RENDER_SIDE), Image.LANCZOS)
+    width, height = base.size
+    scale = max(width, height) / 1000
+    margin = int(min(width, height) * 0.06)
+    padding = max(8, int(22 * scale))
+
+    heading, paragraphs = clean_proclamation(description)
+    layer = Image.new("RGBA", base.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+
+    # Heading banner across the top
+    title_font = load_font(tuple(TITLE_FONTS), max(14, int(min(width, height) * 0.065)))
+    title_width = min(title_font.getlength(heading), width - 2 * margin - 2 * padding)
+    banner_height = int(title_font.size * 1.6)
+    banner = (
+        int((width - title_width) / 2 - padding), margin,
+        int((width + title_width) / 2 + padding), margin + banner_height,
+    )
+    draw_scroll(draw, banner, scale)
+    draw.text(((banner[0] + banner[2]) / 2, (banner[1] + banner[3]) / 2), heading,
+              font=title_font, fill=INK, anchor="mm")
+
+    # Proclamation scroll along the bottom, shrinking the type until it fits
+    if paragraphs:
+        text_width = width - 2 * margin - 2 * padding
+        max_body = int(height * MAX_BODY_HEIGHT) - 2 * padding
+        base_size = max(12, int(min(width, height) * 0.034))
+        font, blocks, line_height, gap, body_height = layout_body(paragraphs, text_width, max_body, base_size)
+        panel = (margin, height - margin - body_height - 2 * padding, width - margin, height - margin)
+        draw_scroll(draw, panel, scale)
+        y = panel[1] + padding
+        for lines in blocks:
+            for line in lines:
+                draw.text((width / 2, y), line, font=font, fill=INK, anchor="ma")
+                y += line_height
+            y += gap
+
+    shadow = Image.new("RGBA", base.size, (0, 0, 0, 0))
+    shadow.paste((0, 0, 0, 110), mask=layer.getchannel("A"))
+    shadow = shadow.filter(ImageFilter.GaussianBlur(max(2, int(4 * scale))))
+    composed = Image.alpha_composite(base.convert("RGBA"), shadow)
+    composed = Image.alpha_composite(composed, layer)
+    return composed.convert("RGB")
+
+
+def render_overlay(image, description, quality=90):
+    """Render the proclamation overlay and return it as JPEG bytes"""
+    buffer = BytesIO()
+    render_overlay_image(image, description).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
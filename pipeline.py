@@ -0,0 +1,1177 @@
+"""Proclamation, analysis and portrait pipeline shared by the Streamlit app and batch.py
+
+Nothing here touches Streamlit: progress is reported through optional callbacks,
+failures are raised, and the shared machinery (model scheduler, result cache,
+descriptor store, ...) is created once per process on first use.
+"""
+import functools
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait as wait_futures
+from datetime import datetime
+
+import metrics
+import proclamations
+from blob_store import BlobStore
+from descriptor_store import DescriptorStore
+from gallery import Gallery
+from input_staging import InputStager
+from model_scheduler import ModelScheduler
+from predictions import PredictionCanceled, PredictionTimeout, PredictionTracker, TrackedPrediction
+from resilience import CircuitBreaker, CircuitOpenError, RetryBudget, backoff_delay, is_rejection, is_retryable
+from result_cache import ResultCache
+from single_flight import SingleFlight
+from variants import VariantBatch
+from warmup import WarmupScheduler, parse_hours, parse_models
+
+logger = logging.getLogger(__name__)
+
+# Replicate models used by the app
+DESCRIPTOR_MODEL = "meta/meta-llama-3-70b-instruct"
+LLAVA_MODEL = "yorickvp/llava-13b:b5f6212d032508382d61ff00469ddda3e32fd8a0e75dc39d8a4191bb742157fb"
+NANO_BANANA_MODEL = "google/nano-banana"
+
+# Concurrent predictions allowed per model across every session in this process
+MODEL_CONCURRENCY = {
+    DESCRIPTOR_MODEL: int(os.getenv("LLAMA_CONCURRENCY", "4")),
+    LLAVA_MODEL: int(os.getenv("LLAVA_CONCURRENCY", "4")),
+    NANO_BANANA_MODEL: int(os.getenv("NANO_BANANA_CONCURRENCY", "4")),
+}
+# nano-banana predictions one request may run at once when it asks for several portrait variants
+VARIANT_CONCURRENCY = int(os.getenv("VARIANT_CONCURRENCY", "4"))
+MAX_VARIANTS = 4
+# Lower runs first: quick text and vision calls jump ahead of slow image generation
+MODEL_PRIORITIES = {
+    DESCRIPTOR_MODEL: 0,
+    LLAVA_MODEL: 0,
+    NANO_BANANA_MODEL: 1,
+}
+# Seconds before an attempt is canceled, and how many times a transient failure is retried
+MODEL_TIMEOUTS = {
+    DESCRIPTOR_MODEL: float(os.getenv("LLAMA_TIMEOUT", "30")),
+    LLAVA_MODEL: float(os.getenv("LLAVA_TIMEOUT", "30")),
+    NANO_BANANA_MODEL: float(os.getenv("NANO_BANANA_TIMEOUT", "120")),
+}
+MODEL_RETRIES = {
+    DESCRIPTOR_MODEL: 2,
+    LLAVA_MODEL: 2,
+    NANO_BANANA_MODEL: 1,
+}
+# Send a duplicate request once an attempt outlasts the model's recent p95; off by
+# default for nano-banana, where a duplicate costs a whole image generation
+MODEL_HEDGING = {
+    DESCRIPTOR_MODEL: os.getenv("LLAMA_HEDGE", "1") == "1",
+    LLAVA_MODEL: os.getenv("LLAVA_HEDGE", "1") == "1",
+    NANO_BANANA_MODEL: os.getenv("NANO_BANANA_HEDGE", "0") == "1",
+}
+HEDGE_MIN_SAMPLES = 20  # calls seen before the p95 is trusted
+# Consecutive failures that open a model's circuit, and seconds before it is probed again
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))
+MODEL_MAX_RUNNING = int(os.getenv("MODEL_MAX_RUNNING", "8"))
+MODEL_QUEUE_SIZE = int(os.getenv("MODEL_QUEUE_SIZE", "32"))
+
+# Longest side each model gets; LLaVA only needs a small image, nano-banana's output follows its input
+MODEL_IMAGE_SIZES = {
+    LLAVA_MODEL: int(os.getenv("LLAVA_IMAGE_SIZE", "672")),
+    NANO_BANANA_MODEL: int(os.getenv("NANO_BANANA_IMAGE_SIZE", "1024")),
+}
+
+# Input photos are uploaded once and models get a URL: "replicate" uses Replicate's files API,
+# "static" writes them to INPUT_STAGING_DIR served publicly at INPUT_BASE_URL, "inline" sends data URIs
+INPUT_STAGING = os.getenv("INPUT_STAGING", "replicate")
+INPUT_STAGING_DIR = os.getenv("INPUT_STAGING_DIR", "static/inputs")
+INPUT_BASE_URL = os.getenv("INPUT_BASE_URL", "")
+# One staged copy serves every model, so it's the largest size any of them needs
+STAGED_IMAGE_SIZE = max(MODEL_IMAGE_SIZES.values())
+
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", ".cache/results")
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", "512"))
+
+# Generated portraits, kept under static/ so Streamlit can serve them as stable links
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "static/blobs")
+BLOB_STORE_MAX_MB = int(os.getenv("BLOB_STORE_MAX_MB", "1024"))
+
+# Every proclamation and portrait made, so past ones can be shown again without a new prediction
+GALLERY_PATH = os.getenv("GALLERY_PATH", ".cache/gallery.sqlite3")
+
+DESCRIPTOR_STORE_PATH = os.getenv("DESCRIPTOR_STORE_PATH", ".cache/descriptors.json")
+DESCRIPTOR_TTL = 3600  # Refresh the pool in the background once an hour
+DESCRIPTOR_TIMEOUT = 45  # seconds to wait for each descriptor list before falling back
+
+# Serve Prometheus metrics on this port when set (e.g. 9464)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Keep-alive predictions so the first visitor after a quiet spell doesn't wait for a cold
+# boot. Off unless WARMUP_HOURS (local hours, e.g. "8-18,20-22") or WARMUP_FORECAST (visits
+# per hour, averaged over the gallery's last WARMUP_FORECAST_DAYS days, for this hour or
+# the next) says visitors are expected. A model idle for WARMUP_INTERVAL seconds is pinged;
+# one idle for WARMUP_COLD_AFTER seconds is counted as cold.
+WARMUP_MODEL_NAMES = {
+    "llama": DESCRIPTOR_MODEL,
+    "llava": LLAVA_MODEL,
+    "nano-banana": NANO_BANANA_MODEL,
+}
+WARMUP_MODELS = parse_models(os.getenv("WARMUP_MODELS", "llama,llava,nano-banana"), WARMUP_MODEL_NAMES)
+WARMUP_HOURS = parse_hours(os.getenv("WARMUP_HOURS", ""))
+WARMUP_FORECAST = float(os.getenv("WARMUP_FORECAST", "0"))
+WARMUP_FORECAST_DAYS = 7
+WARMUP_INTERVAL = float(os.getenv("WARMUP_INTERVAL", "240"))
+WARMUP_COLD_AFTER = float(os.getenv("WARMUP_COLD_AFTER", "600"))
+WARMUP_CHECK_EVERY = float(os.getenv("WARMUP_CHECK_EVERY", "30"))
+# The cheapest call each model accepts: one token, or one small image for nano-banana
+TINY_IMAGE = "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+WARMUP_INPUTS = {
+    DESCRIPTOR_MODEL: {"prompt": "Say hi.", "max_tokens": 1},
+    LLAVA_MODEL: {"image": TINY_IMAGE, "prompt": "Say hi.", "max_tokens": 1},
+    NANO_BANANA_MODEL: {"prompt": "A single gold dot on white", "aspect_ratio": "1:1", "output_format": "jpg"},
+}
+
+# Example lists for AI generation
+EXAMPLE_TITLES = ["Sir", "Lady", "Lord", "Dame", "Duke", "Duchess", "Earl", "Countess", "Baron", "Baroness", "Knight", "Squire", "Maiden", "Master", "Mistress"]
+EXAMPLE_LOCATIONS = [
+    "the Cubicle", "the Coffee Shop", "the WiFi Router", "the Netflix Queue", "the Zoom Call", "the Instagram Feed",
+    "the Group Chat", "the Self-Checkout", "the Parking Garage", "the Office Kitchen", "the Airport Lounge", "the Inbox"
+]
+EXAMPLE_SKILLS = [
+    "wielder of spreadsheets", "master of microwaves", "guardian of the remote control", "slayer of email notifications",
+    "ruler of WiFi passwords", "sage of memes", "keeper of the charging cables", "tamer of the printer",
+    "herald of the reply-all", "champion of the snooze button", "warden of the browser tabs", "knight of the calendar invite"
+]
+EXAMPLE_TRAITS = [
+    "possesses the wisdom of a thousand customer service calls", "bears the noble burden of unread messages",
+    "commands the mystical forces of autocorrect", "endures the eternal trial of the buffering wheel",
+    "carries the sacred scars of software updates", "knows the forbidden lore of the mute button",
+    "survives the daily siege of cookie banners", "guards the ancient secret of the office thermostat"
+]
+
+# "quick" analysis trusts local image statistics unless their confidence is below this, then asks LLaVA
+HEURISTIC_CONFIDENCE = float(os.getenv("HEURISTIC_CONFIDENCE", "0.75"))
+
+ANALYSIS_MODES = ("random", "ai", "quick")
+PROCLAMATION_MODES = ("template", "llm")
+PROCLAMATION_HEADING = "🏰 **ROYAL PROCLAMATION** 🏰\n\n"
+PORTRAIT_STYLES = ("text", "overlay", "artistic", "medieval")
+
+_singletons = {}
+_singletons_lock = threading.RLock()
+
+
+def process_singleton(factory):
+    """Make factory() build one shared instance per process, on first use"""
+    @functools.wraps(factory)
+    def get():
+        with _singletons_lock:
+            if factory not in _singletons:
+                _singletons[factory] = factory()
+            return _singletons[factory]
+    return get
+
+
+@process_singleton
+def get_model_scheduler():
+    return ModelScheduler(
+        MODEL_CONCURRENCY,
+        priorities=MODEL_PRIORITIES,
+        max_running=MODEL_MAX_RUNNING,
+        max_queued=MODEL_QUEUE_SIZE,
+        observer=record_model_job
+    )
+
+
+@process_singleton
+def get_prediction_tracker():
+    return PredictionTracker()
+
+
+# Shared across sessions so re-clicks and re-uploads of the same photo hit the cache
+@process_singleton
+def get_result_cache():
+    return ResultCache(RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024)
+
+
+# Every portrait (generated or drawn locally) is stored once and served from here
+@process_singleton
+def get_blob_store():
+    return BlobStore(BLOB_STORE_DIR, max_bytes=BLOB_STORE_MAX_MB * 1024 * 1024)
+
+
+# Each photo is uploaded for the models once and its URL shared by every call
+@process_singleton
+def get_input_stager():
+    store = BlobStore(INPUT_STAGING_DIR, max_bytes=BLOB_STORE_MAX_MB * 1024 * 1024) if INPUT_STAGING == "static" else None
+    return InputStager(INPUT_STAGING, store=store, base_url=INPUT_BASE_URL)
+
+
+@process_singleton
+def get_gallery():
+    return Gallery(GALLERY_PATH)
+
+
+# Tracks which models are warm; its keep-alive thread only runs once start_warmup() is called
+@process_singleton
+def get_warmup_scheduler():
+    return WarmupScheduler(
+        WARMUP_MODELS,
+        ping_model,
+        interval=WARMUP_INTERVAL,
+        cold_after=WARMUP_COLD_AFTER,
+        hours=WARMUP_HOURS,
+        forecast=visits_expected if WARMUP_FORECAST else None,
+        busy=lambda model: get_model_scheduler().stats()["running"].get(model, 0) > 0,
+        check_every=WARMUP_CHECK_EVERY,
+    )
+
+
+def start_warmup():
+    """Start keeping models warm if a schedule is configured; returns the scheduler"""
+    warmup = get_warmup_scheduler()
+    if WARMUP_HOURS or WARMUP_FORECAST:
+        warmup.start()
+    return warmup
+
+
+# Identical requests in flight at the same time (double-clicks, several tabs) share one prediction
+@process_singleton
+def get_single_flight():
+    return SingleFlight()
+
+
+# Background threads for model calls that overlap with the rest of a request
+@process_singleton
+def get_pipeline_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="pipeline")
+
+
+# Serves the last good descriptor pool and refreshes it in the background
+@process_singleton
+def get_descriptor_store():
+    return DescriptorStore(
+        DESCRIPTOR_STORE_PATH,
+        generate_ai_descriptors,
+        defaults={
+            'titles': EXAMPLE_TITLES,
+            'locations': EXAMPLE_LOCATIONS,
+            'skills': EXAMPLE_SKILLS,
+            'traits': EXAMPLE_TRAITS
+        },
+        ttl=DESCRIPTOR_TTL
+    )
+
+
+# Per-model circuit breakers and retry budgets, shared by every session
+@process_singleton
+def get_circuit_breakers():
+    return {
+        model: CircuitBreaker(failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET)
+        for model in MODEL_CONCURRENCY
+    }
+
+
+@process_singleton
+def get_retry_budgets():
+    return {model: RetryBudget() for model in MODEL_CONCURRENCY}
+
+
+def model_available(model):
+    """False while model's circuit breaker is open, so callers can skip straight to a fallback"""
+    return not get_circuit_breakers()[model].is_open()
+
+
+# Gauges read at scrape time, plus the /metrics endpoint when METRICS_PORT is set
+@process_singleton
+def get_metrics_endpoint():
+    metrics.METRICS.gauge("model_running", lambda: {
+        (("model", model_label(model)),): count for model, count in get_model_scheduler().stats()["running"].items()
+    }, help="Model calls running now")
+    metrics.METRICS.gauge("model_queued", lambda: {
+        (("model", model_label(model)),): count for model, count in get_model_scheduler().stats()["queued"].items()
+    }, help="Model calls waiting in the scheduler queue")
+    metrics.METRICS.gauge("circuit_open", lambda: {
+        (("model", model_label(model)),): int(breaker.state != CircuitBreaker.CLOSED) for model, breaker in get_circuit_breakers().items()
+    }, help="1 while a model's circuit breaker is open or half-open")
+    metrics.METRICS.gauge("model_warm", lambda: {
+        (("model", model_label(model)),): int(state["warm"]) for model, state in get_warmup_scheduler().stats()["models"].items()
+    }, help="1 while a model has had a successful call within WARMUP_COLD_AFTER seconds")
+    metrics.METRICS.gauge("result_cache_bytes", lambda: {(): get_result_cache().stats()["bytes"]}, help="Bytes held by the result cache")
+    if not METRICS_PORT:
+        return None
+    try:
+        return metrics.METRICS.serve(port=METRICS_PORT)
+    except OSError as e:
+        # Another process (e.g. a second Streamlit worker) already serves this port
+        logger.warning("Metrics endpoint not started on port %s: %s", METRICS_PORT, e)
+        return None
+
+
+def model_label(model):
+    """owner/name without the version, for metric labels"""
+    return model.split(":", 1)[0]
+
+
+def record_model_job(job):
+    metrics.observe("model_queue_seconds", job.queue_seconds(), model=model_label(job.model))
+    if job.run_seconds() is not None:
+        metrics.observe("model_run_seconds", job.run_seconds(), model=model_label(job.model))
+
+
+def record_model_call(model, handle, job):
+    """Time a successful call as cold or warm, with Replicate's setup time when it reports one"""
+    if job is None or job.run_seconds() is None:
+        return None  # reattached to a prediction started elsewhere; its timing isn't ours
+    return get_warmup_scheduler().record_call(model, job.run_seconds(), setup_seconds=prediction_setup_seconds(handle.prediction))
+
+
+def prediction_setup_seconds(prediction):
+    """Seconds between Replicate accepting a prediction and starting it (queueing and any cold boot)"""
+    created_at = getattr(prediction, "created_at", None)
+    started_at = getattr(prediction, "started_at", None)
+    if not (created_at and started_at):
+        return None
+    try:
+        created, started = (datetime.fromisoformat(value.replace("Z", "+00:00")) for value in (created_at, started_at))
+    except ValueError:
+        return None
+    return max(0.0, (started - created).total_seconds())
+
+
+def ping_model(model):
+    """Send model its keep-alive prediction and wait for it, outside the scheduler and result cache"""
+    handle = TrackedPrediction(model)
+    wait = None if model == NANO_BANANA_MODEL else int(min(MODEL_TIMEOUTS[model], 60))
+    get_prediction_tracker().run(handle, WARMUP_INPUTS[model], timeout=MODEL_TIMEOUTS[model], wait=wait)
+    return handle.result()
+
+
+def visits_expected(now):
+    """Whether the gallery's recent days averaged WARMUP_FORECAST visits in this hour or the next"""
+    hourly = get_gallery().hourly_counts(now - WARMUP_FORECAST_DAYS * 86400)
+    hour = datetime.fromtimestamp(now).hour
+    busiest = max(hourly.get(hour, 0), hourly.get((hour + 1) % 24, 0))
+    return busiest / WARMUP_FORECAST_DAYS >= WARMUP_FORECAST
+
+
+def record_cache_lookup(model, hit):
+    metrics.count("cache_requests_total", model=model_label(model), result="hit" if hit else "miss")
+
+
+def get_descriptors():
+    return get_descriptor_store().get()
+
+
+def run_model(model, input, on_wait=None):
+    """Run a Replicate model through the shared scheduler and return its output
+
+    on_wait(job) is called about twice a second until the call finishes, e.g. to
+    show the queue position. Raises model_scheduler.QueueFullError straight away
+    when the queue is full. Timeouts, retries, hedging and the circuit breaker
+    work as in run_tracked_prediction.
+    """
+    on_status = (lambda handle, job: on_wait(job)) if on_wait is not None else None
+    return run_tracked_prediction(model, input, on_status=on_status)
+
+
+def run_tracked_prediction(model, input, track_key=None, inflight=None, cache_key=None, on_status=None, cancel=None):
+    """Run model as an asynchronous prediction that survives the caller going away
+
+    The prediction is created and polled with backoff on a scheduler worker. While
+    it runs its ID is kept in inflight (e.g. a Streamlit session's state) under
+    track_key, so a later call with the same key reattaches to it instead of paying
+    for a duplicate; input is ignored in that case. on_status(handle, job) is
+    called about twice a second while waiting.
+
+    Each attempt is canceled after MODEL_TIMEOUTS[model]. Transient failures are
+    retried with jittered backoff up to MODEL_RETRIES[model] times while the
+    model's retry budget allows, and with MODEL_HEDGING an attempt still running
+    past the model's recent p95 gets a duplicate; whichever finishes first wins.
+    While the model's circuit breaker is open this raises CircuitOpenError
+    without calling it. Setting the cancel event (a threading.Event) cancels the
+    prediction and raises PredictionCanceled.
+    """
+    inflight = {} if inflight is None else inflight
+    breaker = get_circuit_breakers()[model]
+    budget = get_retry_budgets()[model]
+    if not breaker.allow():
+        metrics.count("circuit_rejections_total", model=model_label(model))
+        raise CircuitOpenError(f"{model_label(model)} is unavailable right now; please try again shortly")
+    budget.record_request()
+
+    entry = inflight.get(track_key) if track_key else None
+    if entry:
+        attempts = [reattach_prediction(model, entry["id"])]
+    else:
+        attempts = [start_prediction(model, input)]
+    retries = 0
+    hedged = False
+    try:
+        while True:
+            handle, job = attempts[-1]
+            if track_key and handle.id and inflight.get(track_key, {}).get("id") != handle.id:
+                inflight[track_key] = {"id": handle.id, "cache_key": cache_key}
+            finished = next((attempt for attempt in attempts if attempt[0].done()), None)
+            if finished is None:
+                if cancel is not None and cancel.is_set():
+                    raise PredictionCanceled(f"{model_label(model)} prediction is no longer needed")
+                if not hedged and input is not None and should_hedge(model, job) and budget.try_spend():
+                    hedged = True
+                    metrics.count("hedges_total", model=model_label(model))
+                    attempts.append(start_prediction(model, input))
+                    continue
+                if on_status is not None:
+                    on_status(handle, job)
+                wait_futures([attempt[0].future for attempt in attempts], timeout=0.5, return_when=FIRST_COMPLETED)
+                continue
+
+            attempts.remove(finished)
+            try:
+                output = finished[0].result()
+            except Exception as e:
+                if is_retryable(e):
+                    breaker.record_failure()
+                elif is_rejection(e):
+                    breaker.record_rejection()
+                if attempts:
+                    continue  # the hedge may still succeed
+                if not (
+                    input is not None
+                    and is_retryable(e)
+                    and retries < MODEL_RETRIES.get(model, 0)
+                    and breaker.allow()
+                    and budget.try_spend()
+                ):
+                    raise
+                retries += 1
+                metrics.count("retries_total", reason=type(e).__name__, model=model_label(model))
+                logger.warning("Retrying %s after %s: %s", model_label(model), type(e).__name__, e)
+                time.sleep(backoff_delay(retries))
+                attempts.append(start_prediction(model, input))
+                continue
+            breaker.record_success()
+            record_model_call(model, *finished)
+            for handle, job in attempts:
+                cancel_prediction(handle, job)
+            break
+    except Exception:
+        for handle, job in attempts:
+            cancel_prediction(handle, job)
+        inflight.pop(track_key, None)
+        raise
+    inflight.pop(track_key, None)
+    return output
+
+
+def start_prediction(model, input):
+    """Queue one attempt at a prediction; returns (handle, job)"""
+    size = request_size(input)
+    metrics.observe("request_bytes", size, model=model_label(model))
+    metrics.count("bytes_sent_total", size, kind="prediction")
+    handle = TrackedPrediction(model)
+    # Quick models answer within the create request; images return at once so their ID can be tracked
+    wait = None if model == NANO_BANANA_MODEL else int(min(MODEL_TIMEOUTS[model], 60))
+    job = get_model_scheduler().submit(
+        model, get_prediction_tracker().run, handle, input, timeout=MODEL_TIMEOUTS[model], wait=wait
+    )
+    return handle, job
+
+
+def reattach_prediction(model, prediction_id):
+    """Wait on a prediction started earlier, polling it by ID if this process isn't already"""
+    tracker = get_prediction_tracker()
+    handle = tracker.find(prediction_id)
+    if handle is not None:
+        return handle, None
+    # Started by a process that has since gone away
+    handle = TrackedPrediction(model, prediction_id)
+    return handle, get_model_scheduler().submit(model, tracker.resume, handle, timeout=MODEL_TIMEOUTS[model])
+
+
+def request_size(input):
+    """Bytes a prediction's input adds to the request body"""
+    return len(json.dumps(input)) if input is not None else 0
+
+
+def model_image(upload, model):
+    """What to pass a model as the photo: the staged copy's URL, or the data URI if staging failed"""
+    return get_input_stager().ref(upload, STAGED_IMAGE_SIZE, fallback_side=MODEL_IMAGE_SIZES[model])
+
+
+def cancel_prediction(handle, job):
+    """Drop an attempt nobody needs any more, whether it is still queued or already running"""
+    if job is not None:
+        job.cancel()
+    # Straight away on Replicate, rather than at the tracker's next (backed-off) poll
+    get_prediction_tracker().cancel(handle)
+
+
+def should_hedge(model, job):
+    """Whether a running attempt has outlasted the model's recent p95 and deserves a duplicate"""
+    if not MODEL_HEDGING.get(model) or job is None or job.run_seconds() is None:
+        return False
+    threshold = metrics.METRICS.percentile(
+        "model_run_seconds", 0.95, min_samples=HEDGE_MIN_SAMPLES, model=model_label(model)
+    )
+    return threshold is not None and job.run_seconds() > threshold
+
+
+def stream_model(model, input):
+    """Yield a language model's output as Replicate streams it, token by token
+
+    Goes through the scheduler and circuit breaker like run_model. A stream that
+    fails before its first token is retried within the retry budget; once text
+    has been yielded a failure is raised, since tokens can't be taken back. The
+    prediction is canceled if no token arrives for MODEL_TIMEOUTS[model] (counted
+    from when it leaves the scheduler's queue) or the caller stops reading.
+    """
+    breaker = get_circuit_breakers()[model]
+    budget = get_retry_budgets()[model]
+    if not breaker.allow():
+        metrics.count("circuit_rejections_total", model=model_label(model))
+        raise CircuitOpenError(f"{model_label(model)} is unavailable right now; please try again shortly")
+    budget.record_request()
+    tracker = get_prediction_tracker()
+    retries = 0
+    while True:
+        tokens = queue.Queue()
+        handle = TrackedPrediction(model)
+        size = request_size(input)
+        metrics.observe("request_bytes", size, model=model_label(model))
+        metrics.count("bytes_sent_total", size, kind="prediction")
+        job = get_model_scheduler().submit(model, tracker.stream, handle, input, tokens.put)
+        handle.future.add_done_callback(lambda _: tokens.put(None))
+        started = False
+        last_token_at = None
+        try:
+            while True:
+                # The clock only runs once a worker has started the stream; time queued
+                # behind other calls in the scheduler doesn't count against it
+                since = last_token_at or job.started_at
+                wait = 0.5 if since is None else since + MODEL_TIMEOUTS[model] - time.monotonic()
+                try:
+                    token = tokens.get(timeout=max(wait, 0))
+                except queue.Empty:
+                    if since is None or wait > 0:
+                        continue
+                    raise PredictionTimeout(f"{model_label(model)} stopped streaming") from None
+                if token is None:
+                    handle.result()  # raises the stream's error, if it had one
+                    break
+                started = True
+                last_token_at = time.monotonic()
+                yield token
+        except GeneratorExit:
+            job.cancel()
+            tracker.cancel(handle)
+            raise
+        except Exception as e:
+            job.cancel()
+            tracker.cancel(handle)
+            if is_retryable(e):
+                breaker.record_failure()
+            elif is_rejection(e):
+                breaker.record_rejection()
+            if started or not (
+                is_retryable(e)
+                and retries < MODEL_RETRIES.get(model, 0)
+                and breaker.allow()
+                and budget.try_spend()
+            ):
+                raise
+            retries += 1
+            metrics.count("retries_total", reason=type(e).__name__, model=model_label(model))
+            time.sleep(backoff_delay(retries))
+            continue
+        breaker.record_success()
+        record_model_call(model, handle, job)
+        return
+
+
+def fetch_output_blob(output):
+    """Stream the image nano-banana returned into the blob store and return its digest
+
+    Replicate's delivery URLs expire, so the image is downloaded once, here,
+    and everything after that (page, download button, shared links) reads the
+    local copy.
+    """
+    if isinstance(output, list):
+        output = output[0]
+    store = get_blob_store()
+    with metrics.span("download") as span:
+        if hasattr(output, 'read') and callable(output.read):
+            digest = store.put(output.read())
+        else:
+            with urllib.request.urlopen(str(output)) as response:
+                digest = store.put_stream(response)
+        size = os.path.getsize(store.path(digest))
+        span.set(bytes=size)
+    metrics.observe("output_bytes", size, model=model_label(NANO_BANANA_MODEL))
+    return digest
+
+
+def cached_blob(key):
+    """Blob digest the result cache holds for key, or None on a miss"""
+    cache = get_result_cache()
+    cached = cache.get(key)
+    if cached is None:
+        return None
+    store = get_blob_store()
+    if len(cached) != 64:
+        # Written before the blob store existed: the entry is the image itself
+        digest = store.put(cached)
+        cache.put_text(key, digest)
+        return digest
+    digest = cached.decode()
+    return digest if digest in store else None
+
+
+def output_text(output):
+    """Join a language model's output, which replicate returns as a list or iterator of tokens"""
+    if isinstance(output, str):
+        return output
+    return "".join(str(token) for token in output)
+
+
+def generate_descriptor_list(prompt):
+    """Ask LLaMA for a comma-separated list and split it into items"""
+    with metrics.span("llama"):
+        output = run_model(
+            DESCRIPTOR_MODEL,
+            input={
+                "prompt": prompt,
+                "max_tokens": 100,
+                "temperature": 0.8
+            }
+        )
+    return [item.strip().strip('"') for item in output_text(output).split(',')]
+
+
+def generate_ai_descriptors():
+    """Generate new medieval descriptors using AI
+
+    The titles, locations and skills calls run in parallel, so a cold start costs the
+    slowest single call. Each list falls back to its examples on its own if its call
+    fails or times out.
+    """
+    prompts = {
+        'titles': f"Generate 8 creative medieval titles similar to these examples: {', '.join(EXAMPLE_TITLES[:5])}. Make them funny and modern-medieval fusion. Return as comma-separated list.",
+        'locations': f"Generate 8 funny modern 'locations' for medieval titles, similar to: {', '.join(EXAMPLE_LOCATIONS[:3])}. Format: 'the [modern place]'. Return as comma-separated list.",
+        'skills': f"Generate 8 funny medieval 'skills' for modern life, similar to: {', '.join(EXAMPLE_SKILLS[:3])}. Return as comma-separated list.",
+    }
+    defaults = {
+        'titles': EXAMPLE_TITLES,
+        'locations': EXAMPLE_LOCATIONS,
+        'skills': EXAMPLE_SKILLS,
+    }
+
+    descriptors = {'traits': EXAMPLE_TRAITS}  # Keep traits as examples for now
+    failed = []
+
+    executor = ThreadPoolExecutor(max_workers=len(prompts))
+    futures = {key: executor.submit(generate_descriptor_list, prompt) for key, prompt in prompts.items()}
+    # All calls start together, so one shared deadline is a per-call timeout
+    deadline = time.monotonic() + DESCRIPTOR_TIMEOUT
+    for key, future in futures.items():
+        items = []
+        try:
+            items = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            failed.append(f"{key} (timed out)")
+        except Exception as e:
+            failed.append(f"{key} ({e})")
+        descriptors[key] = items[:8] if len(items) >= 8 else defaults[key]
+    # Don't hold the caller on a stalled call; its thread finishes in the background
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    if failed:
+        logger.warning("AI descriptor generation failed for %s. Using default lists for those.", ', '.join(failed))
+
+    return descriptors
+
+
+def portrait_rng(upload, *options):
+    """A random.Random seeded from the photo and options, so asking again draws the same
+
+    Whatever ends up in a nano-banana prompt (the banner's title, the medieval
+    elements) is drawn from one of these, so a repeat request builds the same
+    prompt and is answered from the result cache.
+    """
+    return random.Random(":".join([upload.digest(MODEL_IMAGE_SIZES[NANO_BANANA_MODEL]), *map(str, options)]))
+
+
+def choose_title_and_location(rng=None):
+    """Pick a title and location up front, e.g. to start a portrait before the proclamation exists"""
+    rng = rng or random
+    descriptors = get_descriptors()
+    return rng.choice(descriptors['titles']), rng.choice(descriptors['locations'])
+
+
+def generate_medieval_description(has_image=False, rng=None, title=None, location=None):
+    """Generate a ridiculous medieval description
+
+    rng is a random.Random to draw from (e.g. seeded, for a reproducible
+    proclamation); the module-level random functions are used by default.
+    title and location can be chosen up front, e.g. with portrait_rng().
+    """
+    return proclamations.random_proclamation(get_descriptors(), rng or random, title=title, location=location)
+
+
+def generate_ai_enhanced_description(ai_description, name, title=None, location=None, rng=None):
+    """Generate medieval description enhanced by AI analysis
+
+    title and location can be chosen up front so a portrait started before the
+    analysis finished carries the same title as the proclamation.
+    """
+    return proclamations.ai_proclamation(get_descriptors(), ai_description, name, rng or random, title=title, location=location)
+
+
+def build_proclamation_prompt(name, ai_description=None, title=None, location=None):
+    """Prompt asking LLaMA to write the whole proclamation for name"""
+    likeness = f"The court's viewing crystal describes them as: {ai_description}. Work that into the praise. " if ai_description else ""
+    return f"""Write a short, ridiculous royal proclamation (about 90 words) for a modern person, in mock-medieval English.
+Begin exactly with: Hearken all! Before thee stands **{title} {name} of {location}**,
+{likeness}Praise one absurd modern-life skill and one noble burden they bear, like "wielder of spreadsheets" or "bears the burden of unread messages".
+End with a line in italics about the proclamation being sealed. Use markdown bold for their name only. Output only the proclamation, with no preamble."""
+
+
+def stream_llm_proclamation(name, ai_description=None, title=None, location=None, fresh=False):
+    """Yield a LLaMA-written proclamation as it streams in (cached)
+
+    The heading comes first, at once; the body follows token by token. The
+    finished text is cached on the inputs, so asking again (e.g. for the
+    overlay or portrait prompt) yields the whole text straight away. With
+    fresh=True (a reroll) LLaMA writes a new one, which replaces the cached text.
+    """
+    descriptors = get_descriptors()
+    title = title or random.choice(descriptors['titles'])
+    location = location or random.choice(descriptors['locations'])
+    inputs = {
+        "prompt": build_proclamation_prompt(name, ai_description, title, location),
+        "max_tokens": 220,
+        "temperature": 0.9
+    }
+    cache = get_result_cache()
+    key = cache.make_key(b"", DESCRIPTOR_MODEL, inputs)
+    cached = None if fresh else cache.get_text(key)
+    if not fresh:
+        record_cache_lookup(DESCRIPTOR_MODEL, cached is not None)
+    if cached is not None:
+        yield cached
+        return
+
+    yield PROCLAMATION_HEADING
+    started = time.perf_counter()
+    chunks = []
+    for token in stream_model(DESCRIPTOR_MODEL, inputs):
+        if not chunks:
+            metrics.observe("first_token_seconds", time.perf_counter() - started, model=model_label(DESCRIPTOR_MODEL))
+        chunks.append(token)
+        yield token
+    cache.put_text(key, PROCLAMATION_HEADING + "".join(chunks).strip())
+
+
+def write_llm_proclamation(name, ai_description=None, title=None, location=None, fresh=False):
+    """stream_llm_proclamation() joined into the finished text"""
+    return "".join(stream_llm_proclamation(name, ai_description, title=title, location=location, fresh=fresh)).strip()
+
+
+def analyze_image(upload, on_wait=None):
+    """Use LLaVA to describe the person in a few lowercase words (cached)"""
+    image_size = MODEL_IMAGE_SIZES[LLAVA_MODEL]
+    inputs = {
+        "prompt": "Describe this person in 2-3 words focusing on their appearance or setting. Be brief and simple."
+    }
+    cache = get_result_cache()
+    key = cache.make_key(upload.jpeg(image_size), LLAVA_MODEL, inputs)
+    cached = cache.get_text(key)
+    record_cache_lookup(LLAVA_MODEL, cached is not None)
+    if cached is not None:
+        return cached
+
+    def analyze():
+        # Use Replicate's LLaVA or similar vision model
+        model_input = {**inputs, "image": model_image(upload, LLAVA_MODEL)}
+        upload.note_sent(request_size(model_input))
+        output = run_model(LLAVA_MODEL, input=model_input, on_wait=on_wait)
+
+        # Extract key words from AI response
+        ai_description = output_text(output).strip().lower()
+        cache.put_text(key, ai_description)
+        return ai_description
+
+    with metrics.span("llava"):
+        return get_single_flight().do(key, analyze, label="llava")
+
+
+def analyze_image_quickly(upload, on_wait=None):
+    """Describe the person from local image statistics, asking LLaVA only when unsure
+
+    Returns the same kind of short description as analyze_image(). A guess at or
+    above HEURISTIC_CONFIDENCE (or any guess while LLaVA's circuit is open) is a
+    hit and saves roughly LLaVA's recent median latency; the rest go to LLaVA.
+    """
+    import image_heuristics  # NumPy; loaded the first time someone asks for a quick glance
+
+    started = time.perf_counter()
+    guess = image_heuristics.guess_descriptor(upload.image)
+    if guess.confidence < HEURISTIC_CONFIDENCE and model_available(LLAVA_MODEL):
+        metrics.count("heuristic_requests_total", outcome="escalated")
+        return analyze_image(upload, on_wait=on_wait)
+    metrics.count("heuristic_requests_total", outcome="hit")
+    llava_seconds = metrics.METRICS.percentile("stage_seconds", 0.5, stage="llava")
+    if llava_seconds is not None:
+        metrics.count("heuristic_seconds_saved_total", max(0.0, llava_seconds - (time.perf_counter() - started)))
+    return guess.description
+
+
+def heuristic_stats():
+    """Quick-analysis hit rate so far and the LLaVA seconds it is estimated to have saved"""
+    hits = metrics.METRICS.total("heuristic_requests_total", outcome="hit")
+    total = metrics.METRICS.total("heuristic_requests_total")
+    return {
+        "requests": total,
+        "hits": hits,
+        "hit_rate": hits / total if total else None,
+        "seconds_saved": metrics.METRICS.total("heuristic_seconds_saved_total"),
+    }
+
+
+def medieval_title_part(full_description, name):
+    """Pull the 'Title Name of Place' line out of a proclamation for the portrait banner"""
+    if "stands" in full_description and "of" in full_description:
+        # Extract just the title and name part
+        try:
+            stands_part = full_description.split("stands")[1].split(",")[0].strip()
+            return stands_part.replace("**", "").strip()
+        except:
+            pass
+    return f"{name} - Royal Personage"
+
+
+MEDIEVAL_ELEMENTS = (
+    "Add a golden ornate medieval frame around the portrait",
+    "Give the person a royal crown or medieval headdress",
+    "Add a flowing medieval cape or royal robes",
+    "Include heraldic symbols and coat of arms in the background",
+    "Add medieval castle towers in the distant background",
+    "Give the scene a warm, candlelit medieval atmosphere",
+    "Add some medieval props like a scepter, sword, or royal orb",
+)
+
+
+def medieval_element_sets(count, rng):
+    """count different combinations of 3-4 MEDIEVAL_ELEMENTS, one per portrait variant"""
+    combinations = [
+        elements for size in (3, 4) for elements in itertools.combinations(MEDIEVAL_ELEMENTS, size)
+    ]
+    return [rng.sample(elements, k=len(elements)) for elements in rng.sample(combinations, k=count)]
+
+
+def build_medieval_prompt(title_part, elements=None, rng=None):
+    """Build the nano-banana prompt for a medieval transformation with a title banner
+
+    elements are the MEDIEVAL_ELEMENTS to ask for; otherwise 3-4 are drawn by rng
+    (see portrait_rng(); the module-level random functions by default).
+    """
+    # Randomly select 3-4 elements for variety
+    rng = rng or random
+    selected_elements = elements or rng.sample(MEDIEVAL_ELEMENTS, k=rng.randint(3, 4))
+
+    return f"""Transform this portrait into a humorous medieval royal painting style.
+        {' '.join(selected_elements)}
+
+        MOST IMPORTANT: Keep the original person's face clearly visible and recognizable.
+        Transform the image style to medieval royal portrait but preserve the person's identity.
+
+        Add a small elegant medieval scroll banner at the bottom with just the title: '{title_part}'
+
+        Focus on visual transformation: medieval styling, royal clothing, majestic background.
+        Make it look like a classical royal portrait but with modern humorous touches.
+        Use rich medieval colors: deep reds, royal blues, gold accents.
+        Make it both majestic and slightly silly in a fun way.
+
+        The person should still be clearly recognizable in medieval royal attire."""
+
+
+def build_overlay_prompt(full_description):
+    """Build the nano-banana prompt for painting the proclamation onto scrolls over the photo"""
+    # Clean up the description for better text overlay
+    clean_description = full_description.replace("🏰", "").replace("**", "").replace("*", "").strip()
+
+    # Create a prompt for adding the complete medieval text to the image
+    return f"""IMPORTANT: Keep the original image completely unchanged. Only add text overlay.
+
+        Add elegant medieval scroll text overlay to this image with the royal proclamation:
+        '{clean_description}'
+
+        DO NOT modify the original image - only add text overlays on decorative parchment scrolls.
+        Keep the person and background exactly as they are in the original photo.
+        Place the text on ornate medieval scroll banners that appear to be placed over the image.
+        Use medieval calligraphy and make the text readable and elegant.
+        The original image should remain fully visible underneath the text scrolls."""
+
+
+def image_model_inputs(prompt):
+    return {
+        "prompt": prompt,
+        "aspect_ratio": "match_input_image",
+        "output_format": "jpg"
+    }
+
+
+def image_cache_key(upload, prompt):
+    """Result cache key of the nano-banana portrait of upload for prompt"""
+    return get_result_cache().make_key(upload.jpeg(MODEL_IMAGE_SIZES[NANO_BANANA_MODEL]), NANO_BANANA_MODEL, image_model_inputs(prompt))
+
+
+def run_image_model(upload, prompt, kind, inflight=None, on_status=None, cancel=None):
+    """Run nano-banana on the prepared upload, returning the generated image's blob digest (cached)
+
+    kind ("medieval" or "overlay") plus the upload identify the in-flight prediction
+    in inflight, so a rerun reattaches to it. Setting cancel (a threading.Event)
+    abandons the prediction.
+    """
+    inputs = image_model_inputs(prompt)
+    cache = get_result_cache()
+    key = image_cache_key(upload, prompt)
+    cached = cached_blob(key)
+    record_cache_lookup(NANO_BANANA_MODEL, cached is not None)
+    if cached is not None:
+        return cached
+
+    def generate():
+        model_input = {**inputs, "image_input": [model_image(upload, NANO_BANANA_MODEL)]}
+        upload.note_sent(request_size(model_input))
+        output = run_tracked_prediction(
+            NANO_BANANA_MODEL,
+            model_input,
+            track_key=image_track_key(upload, kind),
+            inflight=inflight,
+            cache_key=key,
+            on_status=on_status,
+            cancel=cancel
+        )
+
+        # Fetch the generated image once, server-side, and keep it for repeat requests
+        digest = fetch_output_blob(output)
+        cache.put_text(key, digest)
+        return digest
+
+    with metrics.span("nano_banana", kind=kind):
+        return get_single_flight().do(key, generate, label="nano-banana")
+
+
+def image_track_key(upload, kind):
+    return f"{kind}:{upload.digest(MODEL_IMAGE_SIZES[NANO_BANANA_MODEL])}"
+
+
+def resume_image_prediction(track_key, inflight, on_status=None, cache_key=None):
+    """Wait for an image prediction started earlier under track_key and return its blob digest
+
+    A prediction no longer in flight has finished (or failed) since; its
+    portrait is then looked up under cache_key, if given.
+    """
+    entry = inflight.get(track_key)
+    if entry is None:
+        return cached_blob(cache_key) if cache_key else None
+    digest = fetch_output_blob(
+        run_tracked_prediction(NANO_BANANA_MODEL, None, track_key, inflight=inflight, on_status=on_status)
+    )
+    if entry.get("cache_key"):
+        get_result_cache().put_text(entry["cache_key"], digest)
+    return digest
+
+
+def medieval_prompt(upload, title_part):
+    """The medieval prompt for this photo and banner title, the same every time they're asked for"""
+    return build_medieval_prompt(title_part, rng=portrait_rng(upload, title_part))
+
+
+def create_medieval_image_transformation(upload, full_description, name, inflight=None, on_status=None, title_part=None):
+    """Transform image to look medieval and add a title banner using nano-banana
+
+    title_part is the banner's title line; by default it's taken from full_description.
+    """
+    prompt = medieval_prompt(upload, title_part or medieval_title_part(full_description, name))
+    return run_image_model(upload, prompt, "medieval", inflight=inflight, on_status=on_status)
+
+
+def start_medieval_transformation(upload, title_part, inflight=None):
+    """Start nano-banana in the background before the proclamation text exists; returns a Future"""
+    return get_pipeline_executor().submit(
+        run_image_model, upload, medieval_prompt(upload, title_part), "medieval", inflight
+    )
+
+
+def start_medieval_variants(upload, title_part, count, rng=None):
+    """Start count medieval portraits at once, each with its own mix of elements; returns a VariantBatch
+
+    At most VARIANT_CONCURRENCY run at a time (and the scheduler's nano-banana
+    cap still applies across sessions). Each variant's result is a blob
+    digest, and batch.variants holds the prompts; cancel the batch once one
+    is picked to stop paying for the rest. The mixes are drawn from
+    portrait_rng() by default, so asking again for the same set is cached.
+    """
+    rng = rng or portrait_rng(upload, title_part, count)
+    prompts = [build_medieval_prompt(title_part, elements) for elements in medieval_element_sets(count, rng)]
+    metrics.count("portrait_variants_total", count)
+    return VariantBatch(
+        lambda prompt, cancel: run_image_model(upload, prompt, "variant", cancel=cancel),
+        prompts,
+        VARIANT_CONCURRENCY
+    )
+
+
+def pick_variant(batch, index):
+    """Keep one finished variant and cancel the ones still painting; returns its blob digest"""
+    unfinished = batch.pending()
+    batch.cancel()
+    if unfinished:
+        metrics.count("portrait_variants_canceled_total", len(unfinished))
+    return batch.result(index)
+
+
+def create_image_with_text_overlay(upload, full_description, inflight=None, on_status=None):
+    """Create an image with complete medieval text overlay using nano-banana (the artistic variant)"""
+    return run_image_model(upload, build_overlay_prompt(full_description), "overlay", inflight=inflight, on_status=on_status)
+
+
+def create_local_text_overlay(upload, full_description):
+    """Draw the proclamation onto parchment scrolls over the photo locally with Pillow; returns a blob digest"""
+    from overlay import render_overlay
+
+    with metrics.span("overlay_render"):
+        return get_blob_store().put(render_overlay(upload.image, full_description))
+
+
+def save_to_gallery(name, description, options, portrait_kind=None, image=None, ai_description=None,
+                    upload=None, timings=None, session=None, prompt=None):
+    """Record a finished result in the gallery; returns its id
+
+    portrait_kind says what actually made the image ("medieval" or "artistic"
+    for nano-banana, "overlay" for the local overlay, None for text only), which
+    decides the model and prompt stored with it. Pass prompt when the exact
+    one is known, e.g. for a picked variant.
+    """
+    model = None
+    if image is None:
+        portrait_kind = prompt = None
+    if portrait_kind == "medieval":
+        model = NANO_BANANA_MODEL
+        if prompt is None and upload is not None:
+            prompt = medieval_prompt(upload, medieval_title_part(description, name))
+    elif portrait_kind == "artistic":
+        model, prompt = NANO_BANANA_MODEL, build_overlay_prompt(description)
+    elif portrait_kind == "overlay":
+        model = "local-overlay"
+    try:
+        return get_gallery().add(
+            name, description, options, ai_description=ai_description, image=image,
+            upload=upload.digest(MODEL_IMAGE_SIZES[NANO_BANANA_MODEL]) if upload is not None else None,
+            model=model, prompt=prompt, timings=timings, session=session
+        )
+    except sqlite3.Error as e:
+        # Losing a gallery entry shouldn't cost the user their portrait
+        logger.warning("Could not save to the gallery: %s", e)
+        return None
+
+
+def generate_portrait(upload, name, analysis="random", style="text", proclamation="template", seed=None, on_stage=None):
+    """Run the whole flow for one photo and return a dict of results
+
+    analysis is one of ANALYSIS_MODES, style one of PORTRAIT_STYLES and
+    proclamation one of PROCLAMATION_MODES ("llm" has LLaMA write the whole text,
+    falling back to the template if that fails). The result
+    holds the proclamation ("description"), the LLaVA text ("ai_description"), the
+    portrait's digest in get_blob_store() ("image", None for "text") and what made it
+    ("kind": "medieval", "artistic" or "overlay"), any non-fatal "errors", and
+    per-stage "timings" in seconds, and the bytes sent to Replicate for it
+    ("bytes_sent"). A failed analysis falls back to the plain
+    proclamation like the app does, and a nano-banana portrait that fails (or
+    whose circuit is open) falls back to the local overlay; both are noted in
+    "errors". A seed (any int or string) makes the template proclamation
+    reproducible for the same descriptor pool and analysis; by default it comes
+    from the photo and options, so asking again gives the same proclamation and
+    portrait, answered from the result cache. on_stage(stage, result)
+    is called with the result so far as soon as the "proclamation" is ready,
+    and again once the "portrait" is (for every style but "text").
+    """
+    if analysis not in ANALYSIS_MODES:
+        raise ValueError(f"Unknown analysis mode {analysis!r}; expected one of {ANALYSIS_MODES}")
+    if style not in PORTRAIT_STYLES:
+        raise ValueError(f"Unknown portrait style {style!r}; expected one of {PORTRAIT_STYLES}")
+    if proclamation not in PROCLAMATION_MODES:
+        raise ValueError(f"Unknown proclamation mode {proclamation!r}; expected one of {PROCLAMATION_MODES}")
+
+    result = {"description": None, "ai_description": None, "image": None, "kind": None, "errors": [], "timings": {}}
+    timings = result["timings"]
+    started = time.perf_counter()
+    sent_before = upload.bytes_sent
+    rng = random.Random(seed) if seed is not None else portrait_rng(upload, name, analysis, style, proclamation)
+
+    title, location = choose_title_and_location(rng)
+    image_future = None
+    if analysis != "random" and style == "medieval" and model_available(NANO_BANANA_MODEL):
+        # Paint while LLaVA analyzes; the portrait only needs the title line
+        image_future = start_medieval_transformation(upload, f"{title} {name} of {location}")
+
+    if analysis != "random":
+        stage = time.perf_counter()
+        try:
+            result["ai_description"] = analyze_image_quickly(upload) if analysis == "quick" else analyze_image(upload)
+        except Exception as e:
+            result["errors"].append(f"analysis: {e}")
+        timings["analysis"] = time.perf_counter() - stage
+    if proclamation == "llm":
+        try:
+            with metrics.span("proclamation", mode="llm"):
+                result["description"] = write_llm_proclamation(name, result["ai_description"], title=title, location=location)
+        except Exception as e:
+            result["errors"].append(f"proclamation: {e}; used the template instead")
+    if result["description"] is None and analysis != "random":
+        with metrics.span("proclamation"):
+            result["description"] = generate_ai_enhanced_description(result["ai_description"], name, title=title, location=location, rng=rng)
+    elif result["description"] is None:
+        with metrics.span("proclamation"):
+            result["description"] = generate_medieval_description(
+                has_image=True, rng=rng, title=title, location=location
+            ).replace("[Your Name]", name)
+    timings["proclamation"] = time.perf_counter() - started
+    if on_stage is not None:
+        on_stage("proclamation", result)
+
+    stage = time.perf_counter()
+    try:
+        if image_future is not None:
+            result["image"] = image_future.result()
+        elif style == "medieval":
+            result["image"] = create_medieval_image_transformation(upload, result["description"], name, title_part=f"{title} {name} of {location}")
+        elif style == "artistic":
+            result["image"] = create_image_with_text_overlay(upload, result["description"])
+    except Exception as e:
+        result["errors"].append(f"portrait: {e}; used the local overlay instead")
+    if result["image"] is not None:
+        result["kind"] = style
+    if style == "overlay" or (style != "text" and result["image"] is None):
+        result["image"] = create_local_text_overlay(upload, result["description"])
+        result["kind"] = "overlay"
+    if style != "text":
+        timings["portrait"] = time.perf_counter() - stage
+        if on_stage is not None:
+            on_stage("portrait", result)
+    timings["total"] = time.perf_counter() - started
+    result["bytes_sent"] = record_bytes_sent(upload, sent_before)
+    return result
+
+
+def record_bytes_sent(upload, sent_before):
+    """Record what one generation sent over the wire for upload, given its tally when it started; returns it"""
+    sent = upload.bytes_sent - sent_before
+    metrics.observe("generation_sent_bytes", sent)
+    return sent
@@ -0,0 +1,204 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+
+
+class PredictionCanceled(Exception):
+    """Raised when a tracked prediction was canceled before it produced output"""
+
+
+class PredictionTimeout(Exception):
+    """Raised when a tracked prediction ran past its timeout (it is canceled on Replicate too)"""
+
+
+class TrackedPrediction:
+    """Handle for a prediction run by PredictionTracker
+
+    id stays None until Replicate has accepted the prediction, prediction holds the
+    latest polled state, and result() blocks until the output is available.
+    cancel() asks the tracker to cancel the prediction at its next poll.
+    """
+
+    def __init__(self, model, prediction_id=None):
+        self.model = model
+        self.id = prediction_id
+        self.prediction = None
+        self.started_at = time.monotonic()
+        self.future = Future()
+        self.cancel_requested = False
+
+    @property
+    def status(self):
+        if self.prediction is not None:
+            return self.prediction.status
+        return "queued" if self.id is None else "starting"
+
+    def progress(self):
+        """Percent complete parsed from the model's logs, if it reports any"""
+        progress = self.prediction.progress if self.prediction is not None else None
+        return progress.percentage if progress else None
+
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def cancel(self):
+        self.cancel_requested = True
+
+
+class PredictionTracker:
+    """Creates Replicate predictions and polls them with backoff instead of blocking in replicate.run
+
+    run() and resume() do the polling and are meant to be called on a worker
+    thread; the caller waits on the handle. Handles are kept by prediction ID, so
+    a script rerun can find a prediction that is still running and wait on it
+    rather than paying for a duplicate.
+    """
+
+    def __init__(self, client=None, poll_initial=0.5, poll_max=5.0, backoff=1.5, keep_finished=3600):
+        # replicate (and httpx under it) is imported on first use, not at app start
+        import replicate
+
+        self.client = client or replicate.default_client
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.backoff = backoff
+        self.keep_finished = keep_finished
+        self._handles = {}
+        self._lock = threading.Lock()
+
+    def run(self, handle, input, timeout=None, wait=None):
+        """Create a prediction for handle.model and poll it to completion
+
+        After timeout seconds the prediction is canceled and PredictionTimeout
+        raised. wait (seconds) asks Replicate to hold the create request open
+        until the prediction finishes, which saves polling for quick models.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            prediction = self._create(handle.model, input, wait)
+            handle.id = prediction.id
+            handle.prediction = prediction
+            self._register(handle)
+            self._poll(handle, deadline)
+        except BaseException as e:
+            handle.future.set_exception(e)
+
+    def resume(self, handle, timeout=None):
+        """Poll an existing prediction by handle.id, e.g. one started by another process"""
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            handle.prediction = self.client.predictions.get(handle.id)
+            self._register(handle)
+            self._poll(handle, deadline)
+        except BaseException as e:
+            handle.future.set_exception(e)
+
+    def stream(self, handle, input, on_token):
+        """Create a streaming prediction for handle.model and call on_token(text) as tokens arrive
+
+        The joined text becomes the handle's result. handle.cancel() takes
+        effect at the next token; to stop a stream that has gone quiet, cancel
+        the prediction by ID, which ends the stream.
+        """
+        from replicate.exceptions import ModelError
+        from replicate.stream import ServerSentEvent
+
+        try:
+            prediction = self._create(handle.model, input, stream=True)
+            handle.id = prediction.id
+            handle.prediction = prediction
+            self._register(handle)
+            tokens = []
+            try:
+                for event in prediction.stream():
+                    if handle.cancel_requested:
+                        self._cancel(prediction)
+                        raise PredictionCanceled(f"Prediction {prediction.id} was canceled")
+                    if event.event == ServerSentEvent.EventType.OUTPUT:
+                        tokens.append(str(event))
+                        on_token(str(event))
+            except RuntimeError:
+                # A failed prediction arrives as an error event; report it like _poll does
+                prediction.reload()
+                if prediction.status == "failed":
+                    raise ModelError(prediction)
+                raise
+            handle.future.set_result("".join(tokens))
+        except BaseException as e:
+            handle.future.set_exception(e)
+
+    def cancel(self, handle):
+        """Cancel handle's prediction on Replicate right away (once it has an ID)"""
+        handle.cancel()
+        if handle.id is not None:
+            try:
+                self.client.predictions.cancel(handle.id)
+            except Exception as e:
+                logger.warning("Could not cancel prediction %s: %s", handle.id, e)
+
+    def find(self, prediction_id):
+        with self._lock:
+            return self._handles.get(prediction_id)
+
+    def _create(self, model, input, wait=None, stream=False):
+        params = {"wait": wait} if wait else {}
+        if stream:
+            params["stream"] = True
+        if ":" in model:
+            _, version_id = model.split(":", 1)
+            return self.client.predictions.create(version=version_id, input=input, **params)
+        return self.client.models.predictions.create(model=model, input=input, **params)
+
+    def _poll(self, handle, deadline=None):
+        prediction = handle.prediction
+        delay = self.poll_initial
+        while prediction.status not in TERMINAL_STATUSES:
+            if handle.cancel_requested:
+                self._cancel(prediction)
+                raise PredictionCanceled(f"Prediction {prediction.id} was canceled")
+            if deadline is not None and time.monotonic() >= deadline:
+                self._cancel(prediction)
+                raise PredictionTimeout(f"Prediction {prediction.id} did not finish in time")
+            if deadline is not None:
+                time.sleep(max(0, min(delay, deadline - time.monotonic())))
+            else:
+                time.sleep(delay)
+            prediction.reload()
+            metrics.count("prediction_polls_total", model=handle.model.split(":")[0])
+            delay = min(delay * self.backoff, self.poll_max)
+        if prediction.status == "failed":
+            from replicate.exceptions import ModelError
+
+            raise ModelError(prediction)
+        if prediction.status == "canceled":
+            raise PredictionCanceled(f"Prediction {prediction.id} was canceled")
+        handle.future.set_result(prediction.output)
+
+    def _cancel(self, prediction):
+        # Stop paying for a prediction nobody will wait for; best effort
+        try:
+            prediction.cancel()
+        except Exception as e:
+            logger.warning("Could not cancel prediction %s: %s", prediction.id, e)
+
+    def _register(self, handle):
+        with self._lock:
+            self._handles[handle.id] = handle
+            # Forget finished predictions nobody came back for
+            cutoff = time.monotonic() - self.keep_finished
+            for prediction_id, other in list(self._handles.items()):
+                if other.done() and other.started_at < cutoff:
+                    del self._handles[prediction_id]
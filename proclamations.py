@@ -0,0 +1,178 @@
+import json
+import math
+import random
+import re
+
+# Templates are plain format strings built once; filling one is a single str.format()
+RANDOM_TEMPLATE = """🏰 **ROYAL PROCLAMATION** 🏰
+
+Hearken all! Before thee stands **{title} {name} of {location}**,
+noble {skill} and {trait}.
+
+By royal decree, this distinguished personage shall be remembered
+throughout the realm for their legendary ability to {feat}.
+
+*Sealed with the Royal Stamp of Ridiculous Importance* 👑"""
+
+AI_TEMPLATE = """🏰 **ROYAL PROCLAMATION** 🏰
+
+Hearken all! Before thee stands **{title} {name} {descriptor} of {location}**,
+noble {skill} and {trait}.
+
+*As divined by the Royal Court's mystical viewing crystal* 🔮
+
+By royal decree, this distinguished personage shall be remembered
+throughout the realm for their legendary prowess in {feat}.
+
+*Sealed with the Royal Stamp of AI-Enhanced Ridiculousness* 👑✨"""
+
+RANDOM_FEATS = (
+    "find the perfect meme for any occasion",
+    "remember where they put their keys (sometimes)",
+    "distinguish between similar-looking apps",
+    "order food without looking at the menu",
+    "pretend to understand cryptocurrency",
+    "nod knowingly during technical meetings",
+    "keep plants alive for more than a week",
+    "fold fitted sheets with minimal cursing",
+    "leave a group chat without anyone noticing",
+    "find the one working outlet at the airport",
+    "unsubscribe from newsletters faster than they arrive",
+    "close forty browser tabs without losing the important one",
+    "assemble flat-pack furniture with only one screw left over",
+    "end a video call on the first try",
+    "guess the WiFi password of any café",
+    "parallel park on the first attempt",
+)
+
+AI_FEATS = (
+    "conquering the weekly grocery quest",
+    "navigating the treacherous realm of IKEA",
+    "mastering the ancient art of untangling earphones",
+    "wielding the power of perfect emoji selection",
+    "commanding respect from voice assistants",
+    "achieving legendary status in online shopping",
+    "maintaining the sacred ritual of coffee consumption",
+    "defending the realm against spam calls",
+)
+
+# Checked in order: the first rule with a keyword anywhere in the description wins
+DESCRIPTOR_RULES = (
+    (("smile", "smiling", "happy"), "the Eternally Cheerful"),
+    (("serious", "stern", "focused"), "the Contemplative"),
+    (("glasses", "spectacles"), "the Wise-Eyed Scholar"),
+    (("beard", "mustache"), "the Magnificently Whiskered"),
+    (("hat", "cap"), "the Crown-Bearer"),
+    (("young", "child"), "the Youthful"),
+    (("outdoor", "outside", "nature"), "the Wild Wanderer"),
+)
+DEFAULT_DESCRIPTOR = "the Mysterious"
+
+# keyword -> rule number, and one regex that finds every keyword (overlapping ones too) in a single pass
+KEYWORD_RULES = {word: rank for rank, (words, _) in enumerate(DESCRIPTOR_RULES) for word in words}
+KEYWORD_PATTERN = re.compile("(?=(" + "|".join(sorted(map(re.escape, KEYWORD_RULES), key=len, reverse=True)) + "))")
+
+PARTS = ("titles", "locations", "skills", "traits")
+
+
+def descriptor_for(ai_description):
+    """The descriptor the LLaVA text earns, e.g. "the Wild Wanderer" for "person outdoors"
+
+    Keywords match anywhere, as substrings; when several rules match, the
+    earliest in DESCRIPTOR_RULES wins.
+    """
+    if not ai_description:
+        return DEFAULT_DESCRIPTOR
+    ranks = [KEYWORD_RULES[match.group(1)] for match in KEYWORD_PATTERN.finditer(ai_description)]
+    return DESCRIPTOR_RULES[min(ranks)][1] if ranks else DEFAULT_DESCRIPTOR
+
+
+def random_proclamation(descriptors, rng=random, name="[Your Name]", title=None, location=None):
+    """The template proclamation with parts drawn from the descriptor pool by rng"""
+    return RANDOM_TEMPLATE.format(
+        title=title or rng.choice(descriptors["titles"]),
+        name=name,
+        location=location or rng.choice(descriptors["locations"]),
+        skill=rng.choice(descriptors["skills"]),
+        trait=rng.choice(descriptors["traits"]),
+        feat=rng.choice(RANDOM_FEATS),
+    )
+
+
+def ai_proclamation(descriptors, ai_description, name, rng=random, title=None, location=None):
+    """The AI-enhanced template proclamation, with a descriptor earned from ai_description"""
+    return AI_TEMPLATE.format(
+        title=title or rng.choice(descriptors["titles"]),
+        name=name,
+        descriptor=descriptor_for(ai_description),
+        location=location or rng.choice(descriptors["locations"]),
+        skill=rng.choice(descriptors["skills"]),
+        trait=rng.choice(descriptors["traits"]),
+        feat=rng.choice(AI_FEATS),
+    )
+
+
+def combination_count(descriptors):
+    """How many distinct template proclamations the pool can make"""
+    return math.prod(len(descriptors[part]) for part in PARTS) * len(RANDOM_FEATS)
+
+
+def generate_bulk(descriptors, count, seed=0, names=None, unique=True, batch_size=10000):
+    """Iterator over count proclamation records, sampled in NumPy batches from a seeded RNG
+
+    Each record holds the parts that were drawn and the finished "text". With
+    unique=True no two records share a combination of title, location, skill,
+    trait and feat (ValueError if the pool can't make that many). names, if
+    given, are used in turn. The same pool, seed and arguments always give the
+    same records.
+    """
+    lists = [list(descriptors[part]) for part in PARTS] + [list(RANDOM_FEATS)]
+    shape = tuple(len(values) for values in lists)
+    space = math.prod(shape)
+    if unique and count > space:
+        raise ValueError(f"The descriptor pool can make only {space} unique proclamations, not {count}")
+    return _bulk_records(lists, shape, space, count, seed, names, unique, batch_size)
+
+
+def _bulk_records(lists, shape, space, count, seed, names, unique, batch_size):
+    # Only bulk runs need NumPy, so importing this module stays cheap for the app
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    if unique:
+        # sample() on a range draws without replacement and never builds the whole space
+        codes = np.fromiter(random.Random(seed).sample(range(space), count), dtype=np.int64, count=count)
+    names = list(names) if names else ["[Your Name]"]
+
+    for start in range(0, count, batch_size):
+        stop = min(count, start + batch_size)
+        batch = codes[start:stop] if unique else rng.integers(0, space, size=stop - start)
+        columns = np.unravel_index(batch, shape)
+        for offset, picks in enumerate(zip(*(column.tolist() for column in columns))):
+            title, location, skill, trait, feat = (values[i] for values, i in zip(lists, picks))
+            name = names[(start + offset) % len(names)]
+            yield {
+                "index": start + offset,
+                "name": name,
+                "title": title,
+                "location": location,
+                "skill": skill,
+                "trait": trait,
+                "feat": feat,
+                "text": RANDOM_TEMPLATE.format(title=title, name=name, location=location, skill=skill, trait=trait, feat=feat),
+            }
+
+
+def write_jsonl(records, fileobj, flush_every=5000):
+    """Write records to fileobj one JSON object per line; returns how many were written"""
+    written = 0
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, ensure_ascii=False))
+        written += 1
+        if len(lines) >= flush_every:
+            fileobj.write("\n".join(lines) + "\n")
+            lines.clear()
+    if lines:
+        fileobj.write("\n".join(lines) + "\n")
+    return written
@@ -0,0 +1,140 @@
+import random
+import threading
+import time
+import urllib.error
+
+from predictions import PredictionTimeout
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops calling a model that keeps failing, then lets a probe through to test it
+
+    After failure_threshold failures in a row the breaker opens and allow()
+    returns False for reset_timeout seconds. It then half-opens: one call is
+    allowed through, and its success closes the breaker while a failure opens it
+    again. A probe turned down for its own input (record_rejection()) shows the
+    model is up and closes it too. A probe that never reports back frees the
+    slot after another reset_timeout.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half-open", "open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and now - self.opened_at < self.reset_timeout:
+                return False
+            if self.state == self.HALF_OPEN and now - self.probe_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self.probe_at = now
+            return True
+
+    def is_open(self):
+        """True while calls are being refused outright (not yet due for a probe)"""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_rejection(self):
+        """A call the model answered but refused (bad input, a safety filter): not a failure of the model"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Token bucket that keeps retries (and hedges) to a fraction of real calls
+
+    Every call adds ratio tokens and every retry spends one, so a failing
+    upstream sees at most about (1 + ratio) times normal traffic instead of a
+    retry storm. min_per_second tokens trickle in regardless, so a quiet app can
+    still retry.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=0.1, max_tokens=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = float(max_tokens)
+        self.refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.refilled_at) * self.min_per_second)
+        self.refilled_at = now
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    """Seconds to sleep before retry number attempt (1, 2, ...), with full jitter"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def is_retryable(error):
+    """Whether error looks like a transient upstream problem worth another try
+
+    These are also the errors that count against a model's circuit breaker;
+    cancellations, a full local queue or a rejected request (see is_rejection())
+    don't.
+    """
+    import httpx
+    from replicate.exceptions import ReplicateError
+
+    if isinstance(error, ReplicateError):
+        return error.status is None or error.status == 429 or error.status >= 500
+    return isinstance(error, (PredictionTimeout, httpx.TransportError, urllib.error.URLError, ConnectionError, TimeoutError))
+
+
+def is_rejection(error):
+    """Whether the model answered but refused this one request
+
+    That is a failed prediction (ModelError: a safety filter, an unreadable
+    photo) or a 4xx other than 429. Trying again won't help, and the model is
+    evidently up.
+    """
+    from replicate.exceptions import ModelError, ReplicateError
+
+    if isinstance(error, ReplicateError):
+        return error.status is not None and 400 <= error.status < 500 and error.status != 429
+    return isinstance(error, ModelError)
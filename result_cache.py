@@ -0,0 +1,141 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """Disk-backed, content-addressed cache for model outputs
+
+    Entries are keyed on a hash of the input image bytes, the model and its inputs
+    (prompt and options), and hold the raw output bytes: generated images for
+    nano-banana, UTF-8 text for LLaVA. When the cache grows past max_bytes the least
+    recently used entries are evicted; a hit refreshes the entry's mtime, so the
+    LRU order survives restarts.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> [size, last_access]
+        self._total_bytes = 0
+        self._scan()
+
+    @staticmethod
+    def make_key(image_bytes, model, inputs):
+        """Hash the image, model and model inputs into a cache key"""
+        digest = hashlib.sha256()
+        digest.update(hashlib.sha256(image_bytes).digest())
+        digest.update(model.encode())
+        digest.update(json.dumps(inputs, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached bytes for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                self._forget(key)
+            return None
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries[key][1] = now
+            else:
+                self._entries[key] = [len(data), now]
+                self._total_bytes += len(data)
+        return data
+
+    def put(self, key, data):
+        """Store bytes under key, evicting old entries if the cache is over budget"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write cache entry %s: %s", key, e)
+            return
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = [len(data), time.time()]
+            self._total_bytes += len(data)
+            self._evict()
+
+    def get_text(self, key):
+        data = self.get(key)
+        return data.decode('utf-8') if data is not None else None
+
+    def put_text(self, key, text):
+        self.put(key, text.encode('utf-8'))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+            }
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._total_bytes -= entry[0]
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Could not evict cache entry %s: %s", key, e)
+                continue
+            self._forget(key)
+            self.evictions += 1
+
+    def _scan(self):
+        if not os.path.isdir(self.directory):
+            return
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                self._entries[name] = [stat.st_size, stat.st_mtime]
+                self._total_bytes += stat.st_size
+        with self._lock:
+            self._evict()
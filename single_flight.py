@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import Future
+
+import metrics
+
+
+class LeaderAborted(Exception):
+    """The call being waited on was interrupted (e.g. its script was rerun) rather than failing"""
+
+
+class SingleFlight:
+    """Collapses concurrent calls that share a key into one execution
+
+    The first caller for a key runs fn; anyone arriving with the same key while it
+    is in flight waits for that result instead of starting their own call. If the
+    first caller is interrupted rather than failing, a waiter takes over and runs
+    fn itself. Counters per label show how many duplicate calls were collapsed.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._executed = {}
+        self._collapsed = {}
+
+    def do(self, key, fn, *args, label=None, **kwargs):
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                leader = future is None
+                if leader:
+                    future = self._calls[key] = Future()
+                    self._executed[label] = self._executed.get(label, 0) + 1
+                else:
+                    self._collapsed[label] = self._collapsed.get(label, 0) + 1
+            if leader:
+                return self._lead(key, future, fn, args, kwargs)
+            try:
+                return future.result()
+            except LeaderAborted:
+                # Nothing was collapsed after all; the next pass counts this call again, as led or collapsed
+                with self._lock:
+                    self._collapsed[label] -= 1
+                metrics.count("single_flight_takeovers_total", call=label)
+                continue
+
+    def stats(self):
+        with self._lock:
+            labels = set(self._executed) | set(self._collapsed)
+            return {
+                label: {'executed': self._executed.get(label, 0), 'collapsed': self._collapsed.get(label, 0)}
+                for label in labels
+            }
+
+    def _lead(self, key, future, fn, args, kwargs):
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.set_exception(LeaderAborted())
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
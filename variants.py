@@ -0,0 +1,72 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_futures
+
+
+class VariantBatch:
+    """Several variants of one job running side by side, at most max_concurrent at a time
+
+    fn(variant, cancel) is called once per variant on the batch's own threads;
+    cancel is a threading.Event that cancel() sets, which fn should check while
+    it waits. Variants can be collected as they finish with wait(), and cancel()
+    stops the rest: queued ones never start and running ones see the event.
+    The batch is independent of the caller, so it can be kept (e.g. in a
+    Streamlit session) and picked up again after the caller has gone away.
+    """
+
+    def __init__(self, fn, variants, max_concurrent):
+        self.variants = list(variants)
+        self.canceled = threading.Event()
+        self.started_at = time.monotonic()
+        self.finished_at = {}
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_concurrent, len(self.variants))), thread_name_prefix="variants")
+        self.futures = [executor.submit(self._run, fn, variant) for variant in self.variants]
+        for index, future in enumerate(self.futures):
+            future.add_done_callback(lambda _, index=index: self.finished_at.setdefault(index, time.monotonic()))
+        # The threads exit once the last variant is done; nothing waits for them
+        executor.shutdown(wait=False)
+
+    def __len__(self):
+        return len(self.variants)
+
+    def finished(self):
+        """Indexes of variants that are done (finished, failed or canceled), in the order they got there"""
+        return sorted(self.finished_at, key=self.finished_at.get)
+
+    def pending(self):
+        return [index for index, future in enumerate(self.futures) if not future.done()]
+
+    def wait(self, timeout=None):
+        """Block until another variant finishes or timeout passes; returns the indexes now done"""
+        pending = [self.futures[index] for index in self.pending()]
+        if pending:
+            wait_futures(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        return [index for index, future in enumerate(self.futures) if future.done()]
+
+    def result(self, index):
+        """The variant's result, or None if it failed or was canceled"""
+        future = self.futures[index]
+        if not future.done() or future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def error(self, index):
+        future = self.futures[index]
+        if future.done() and not future.cancelled():
+            return future.exception()
+        return None
+
+    def seconds(self, index):
+        """How long after the batch started the variant finished (None while it runs)"""
+        return self.finished_at[index] - self.started_at if index in self.finished_at else None
+
+    def cancel(self):
+        """Stop every variant that hasn't finished; finished results are kept"""
+        self.canceled.set()
+        for future in self.futures:
+            future.cancel()
+
+    def _run(self, fn, variant):
+        if self.canceled.is_set():
+            return None
+        return fn(variant, self.canceled)
@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def parse_hours(spec):
+    """Parse "8-18,20-22" into [(8, 18), (20, 22)]: local hours, start included, end not
+
+    A range may wrap past midnight ("22-2"), and a single hour ("9") covers that hour.
+    """
+    ranges = []
+    for part in filter(None, (part.strip() for part in (spec or "").split(","))):
+        start, _, end = part.partition("-")
+        start = int(start)
+        end = int(end) if end else start + 1
+        if not (0 <= start < 24 and 0 <= end <= 24):
+            raise ValueError(f"Bad hour range {part!r}; expected e.g. 8-18")
+        ranges.append((start, end))
+    return ranges
+
+
+def parse_models(spec, known):
+    """Map comma-separated model names ("llama,llava") to their ids in known
+
+    Names not in known are skipped with a warning rather than stopping the app.
+    """
+    models = []
+    for name in filter(None, (name.strip() for name in (spec or "").split(","))):
+        if name in known:
+            models.append(known[name])
+        else:
+            logger.warning("Ignoring unknown keep-alive model %r; expected one of %s", name, ", ".join(known))
+    return models
+
+
+def in_hours(ranges, hour):
+    return any(start <= hour < end if start <= end else (hour >= start or hour < end) for start, end in ranges)
+
+
+class WarmupScheduler:
+    """Knows which models are warm, and keeps them warm while visitors are expected
+
+    Every successful call to a model is reported through record_call(); a model
+    with no successful call for cold_after seconds is taken to be cold (scaled
+    down on Replicate), so each call is timed as cold or warm under
+    model_call_seconds, which shows what a cold boot costs. Once start()ed, a
+    background thread checks every check_every seconds whether visitors are
+    expected (a local hour in hours, or forecast(now) returning true) and, if so,
+    calls ping(model) for each model idle for interval seconds and not busy(model).
+    Pings are timed and counted under warmup_*, which is what the schedule costs.
+    """
+
+    def __init__(self, models, ping, interval=240, cold_after=600, hours=(), forecast=None, busy=None,
+                 check_every=30, clock=time.time):
+        self.models = list(models)
+        self.ping = ping
+        self.interval = interval
+        self.cold_after = cold_after
+        self.hours = list(hours)
+        self.forecast = forecast
+        self.busy = busy
+        self.check_every = check_every
+        self.clock = clock
+        self._last_ok = {}  # model -> clock() of its last successful call, visitor or ping
+        self._pinging = set()
+        self._counts = {model: {"cold_calls": 0, "warm_calls": 0, "pings": 0, "ping_failures": 0, "ping_seconds": 0.0} for model in self.models}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_warm(self, model, now=None):
+        with self._lock:
+            return self._is_warm(model, self.clock() if now is None else now)
+
+    def record_call(self, model, seconds, setup_seconds=None):
+        """Note a successful call that took seconds; returns whether the model was "cold" or "warm" when it started
+
+        setup_seconds, if known, is the time Replicate took to start the
+        prediction (queueing plus any cold boot), recorded alongside.
+        """
+        now = self.clock()
+        with self._lock:
+            warmth = "warm" if self._is_warm(model, now - seconds) else "cold"
+            self._last_ok[model] = now
+            if model in self._counts:
+                self._counts[model][f"{warmth}_calls"] += 1
+        label = model.split(":", 1)[0]
+        metrics.observe("model_call_seconds", seconds, model=label, warmth=warmth)
+        if setup_seconds is not None:
+            metrics.observe("model_setup_seconds", setup_seconds, model=label, warmth=warmth)
+        return warmth
+
+    def keep_warm(self, now=None):
+        """Why models should be warm right now ("hours" or "forecast"), or None"""
+        now = self.clock() if now is None else now
+        if in_hours(self.hours, datetime.fromtimestamp(now).hour):
+            return "hours"
+        if self.forecast is not None:
+            try:
+                if self.forecast(now):
+                    return "forecast"
+            except Exception as e:
+                logger.warning("Traffic forecast failed: %s", e)
+        return None
+
+    def due(self, now=None):
+        """Models that would be pinged now: idle for interval, not busy and not already being pinged"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            idle = [
+                model for model in self.models
+                if model not in self._pinging and now - self._last_ok.get(model, float("-inf")) >= self.interval
+            ]
+        return [model for model in idle if self.busy is None or not self.busy(model)]
+
+    def tick(self, now=None):
+        """Start keep-alive pings for the models that are due, if visitors are expected; returns their threads"""
+        reason = self.keep_warm(now)
+        if reason is None:
+            return []
+        threads = []
+        for model in self.due(now):
+            with self._lock:
+                if model in self._pinging:
+                    continue
+                self._pinging.add(model)
+            # One thread per model, so a slow image model doesn't hold up the others
+            thread = threading.Thread(target=self._ping, args=(model, reason), name="warmup-ping", daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def start(self):
+        """Run tick() every check_every seconds on a background thread (once per scheduler)"""
+        with self._lock:
+            if self._thread is not None:
+                return self._thread
+            self._thread = threading.Thread(target=self._loop, name="model-warmup", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        """Per model: warm now?, idle seconds, visitor calls by warmth and keep-alive pings; plus the schedule's state"""
+        now = self.clock()
+        with self._lock:
+            models = {
+                model: {
+                    "warm": self._is_warm(model, now),
+                    "idle": now - self._last_ok[model] if model in self._last_ok else None,
+                    **self._counts[model],
+                }
+                for model in self.models
+            }
+        return {"running": self._thread is not None, "reason": self.keep_warm(now), "models": models}
+
+    def _is_warm(self, model, when):
+        last = self._last_ok.get(model)
+        return last is not None and when - last < self.cold_after
+
+    def _ping(self, model, reason):
+        started = time.perf_counter()
+        warmth = "warm" if self.is_warm(model) else "cold"
+        label = model.split(":", 1)[0]
+        try:
+            self.ping(model)
+        except Exception as e:
+            logger.warning("Keep-alive for %s failed: %s", label, e)
+            metrics.count("warmup_pings_total", model=label, result="failed", reason=reason)
+            with self._lock:
+                self._counts[model]["ping_failures"] += 1
+            return
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                self._pinging.discard(model)
+                self._counts[model]["ping_seconds"] += seconds
+        metrics.observe("warmup_ping_seconds", seconds, model=label, warmth=warmth)
+        metrics.count("warmup_pings_total", model=label, result="ok", reason=reason)
+        with self._lock:
+            self._last_ok[model] = self.clock()
+            self._counts[model]["pings"] += 1
+
+    def _loop(self):
+        while not self._stop.wait(self.check_every):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.warning("Warm-up check failed: %s", e)